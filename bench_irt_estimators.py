@@ -0,0 +1,61 @@
+"""Benchmark per-answer theta estimation latency for each IRT estimator mode.
+
+Simulates adaptive sessions the way submit_answer drives the engine: after
+every answer the estimate is recomputed from all responses in the dimension.
+
+Usage: python bench_irt_estimators.py [sessions]
+"""
+import sys
+import time
+import numpy as np
+from irt_engine import IRTEngine, ESTIMATORS, ESTIMATOR_SCIPY
+
+QUESTIONS_PER_DIMENSION = 15
+
+
+def simulate_sessions(count: int, rng: np.random.Generator):
+    """Random 2PL response patterns as lists of (response, a, b) tuples"""
+    sessions = []
+    for _ in range(count):
+        theta = rng.normal()
+        a = rng.uniform(0.8, 2.0, QUESTIONS_PER_DIMENSION)
+        b = rng.uniform(-1.5, 1.5, QUESTIONS_PER_DIMENSION)
+        p = 1 / (1 + np.exp(-a * (theta - b)))
+        responses = np.where(rng.random(QUESTIONS_PER_DIMENSION) < p,
+                             rng.integers(4, 6, QUESTIONS_PER_DIMENSION),
+                             rng.integers(1, 4, QUESTIONS_PER_DIMENSION))
+        sessions.append([(int(x), float(ai), float(bi)) for x, ai, bi in zip(responses, a, b)])
+    return sessions
+
+
+def run(method: str, sessions):
+    """Per-answer latencies (seconds) and final estimates for one estimator"""
+    latencies = []
+    finals = []
+    for responses in sessions:
+        theta = 0.0
+        for n in range(1, len(responses) + 1):
+            start = time.perf_counter()
+            theta, se = IRTEngine.estimate_theta(responses[:n], theta, method=method)
+            latencies.append(time.perf_counter() - start)
+        finals.append(theta)
+    return np.array(latencies), np.array(finals)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sessions = simulate_sessions(count, np.random.default_rng(42))
+
+    results = {method: run(method, sessions) for method in ESTIMATORS}
+    baseline = results[ESTIMATOR_SCIPY][1]
+
+    print(f"{count} sessions x {QUESTIONS_PER_DIMENSION} answers")
+    print(f"{'estimator':<16}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}{'max |dθ| vs scipy':>20}")
+    for method, (latencies, finals) in results.items():
+        us = latencies * 1e6
+        print(f"{method:<16}{us.mean():>10.1f}{np.percentile(us, 50):>10.1f}"
+              f"{np.percentile(us, 95):>10.1f}{np.max(np.abs(finals - baseline)):>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
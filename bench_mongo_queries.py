@@ -0,0 +1,176 @@
+"""Benchmark the IRT backend's per-endpoint Mongo reads against a local mongod.
+
+Seeds a scratch database with synthetic sessions (carrying a full irt_state),
+a question bank and the answer log, then times the reads each endpoint makes:
+first on bare collections fetching whole documents, then after the startup
+index provisioning with the endpoint projections. The scratch database is
+dropped afterwards.
+
+Usage: python bench_mongo_queries.py [sessions] [requests]
+  MONGO_URL      server to use (default mongodb://localhost:27017)
+  BENCH_DB_NAME  scratch database (default personality_bench)
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from session_store import MotorSessionStore
+from irt_personality_test import (
+    BIG_FIVE_DIMENSIONS, SESSION_STATUS_FIELDS, SESSION_PROGRESS_FIELDS, SESSION_QUESTION_FIELDS,
+    SESSION_REPORT_FIELDS, ANSWER_STATE_FIELDS, ensure_collection_indexes
+)
+
+QUESTIONS_PER_DIMENSION = 200
+ANSWERS_PER_DIMENSION = 10
+INSERT_BATCH = 1000
+
+
+def make_questions(rng: np.random.Generator):
+    return [{
+        "question_id": f"{dim}-{i}",
+        "text": f"سؤال {i} في {dim}",
+        "dimension": dim,
+        "reverse_scored": bool(i % 4 == 0),
+        "discrimination": float(rng.uniform(0.8, 2.0)),
+        "difficulty": float(rng.uniform(-1.5, 1.5)),
+        "source": "generated",
+        "question_number": i + 1
+    } for dim in BIG_FIVE_DIMENSIONS for i in range(QUESTIONS_PER_DIMENSION)]
+
+
+def make_session(rng: np.random.Generator):
+    """A completed session shaped like the ones submit_answer writes, plus its answers"""
+    session_id = str(uuid.uuid4())
+    session = {
+        "session_id": session_id, "name": "bench", "age": int(rng.integers(18, 70)),
+        "status": "completed", "current_dimension": "neuroticism", "cat_mode": "sequential",
+        "dimension_order": list(BIG_FIVE_DIMENSIONS), "total_questions_asked": 0,
+        "theta_estimates": {}, "standard_errors": {}, "dimension_progress": {},
+        "asked_questions": {}, "irt_state": {}
+    }
+    answers = []
+    for dim in BIG_FIVE_DIMENSIONS:
+        items = rng.choice(QUESTIONS_PER_DIMENSION, ANSWERS_PER_DIMENSION, replace=False)
+        responses = rng.integers(1, 6, ANSWERS_PER_DIMENSION)
+        difficulty = rng.uniform(-1.5, 1.5, ANSWERS_PER_DIMENSION)
+        session["asked_questions"][dim] = [f"{dim}-{i}" for i in items]
+        session["irt_state"][dim] = {
+            "responses": responses.tolist(),
+            "discrimination": rng.uniform(0.8, 2.0, ANSWERS_PER_DIMENSION).tolist(),
+            "difficulty": difficulty.tolist(),
+            "thresholds": [[float(b + t) for t in (-1.5, -0.5, 0.5, 1.5)] for b in difficulty]
+        }
+        session["theta_estimates"][dim] = float(rng.normal())
+        session["standard_errors"][dim] = float(rng.uniform(0.25, 0.4))
+        session["dimension_progress"][dim] = ANSWERS_PER_DIMENSION
+        session["total_questions_asked"] += ANSWERS_PER_DIMENSION
+        answers.extend({"session_id": session_id, "question_id": f"{dim}-{i}", "answer": int(x),
+                        "dimension": dim, "response_time": 3.0} for i, x in zip(items, responses))
+    return session, answers
+
+
+async def seed(db, count: int, rng: np.random.Generator):
+    await db.questions.insert_many(make_questions(rng))
+    for start in range(0, count, INSERT_BATCH):
+        sessions, answers = [], []
+        for _ in range(min(INSERT_BATCH, count - start)):
+            session, session_answers = make_session(rng)
+            sessions.append(session)
+            answers.extend(session_answers)
+        await db.sessions.insert_many(sessions)
+        await db.answers.insert_many(answers)
+
+
+def endpoint_reads(db, store: MotorSessionStore, projected: bool):
+    """Per-endpoint read sequences, given a session id and one of its question ids"""
+    def fields(names):
+        return names if projected else None
+
+    async def question(sid, qid):
+        await store.get(sid, fields=fields(SESSION_QUESTION_FIELDS))
+
+    async def progress(sid, qid):
+        await store.get(sid, fields=fields(SESSION_PROGRESS_FIELDS))
+
+    async def report(sid, qid):
+        await store.get(sid, fields=fields(SESSION_REPORT_FIELDS))
+        await db.reports.find_one({"session_id": sid, "scoring_version": "bench"}, {"_id": 0, "report": 1})
+
+    async def report_status(sid, qid):
+        await db.reports.find_one({"session_id": sid, "scoring_version": "bench"}, {"_id": 0, "report": 1})
+        await store.get(sid, fields=fields(SESSION_STATUS_FIELDS))
+
+    async def answer(sid, qid):
+        # The session read stays whole; the answer log is only read to rebuild a missing irt_state
+        await store.get(sid)
+        await db.questions.find_one({"question_id": qid}, {"_id": 0})
+        await store.answers(sid, qid.split("-")[0], fields=fields(ANSWER_STATE_FIELDS))
+
+    async def bank_check(sid, qid):
+        await db.questions.count_documents(
+            {"dimension": qid.split("-")[0], "source": {"$ne": "seed"}, "retired": {"$ne": True}}, limit=1)
+
+    return {"question": question, "progress": progress, "report": report,
+            "report_status": report_status, "answer": answer, "bank_check": bank_check}
+
+
+async def time_reads(reads, targets):
+    """Latencies (ms) per endpoint over the same (session_id, question_id) targets"""
+    latencies = {}
+    for name, read in reads.items():
+        samples = []
+        for sid, qid in targets:
+            start = time.perf_counter()
+            await read(sid, qid)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies[name] = np.array(samples)
+    return latencies
+
+
+async def run(count: int, requests: int):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("BENCH_DB_NAME", "personality_bench")]
+    await client.drop_database(db.name)
+    rng = np.random.default_rng(42)
+    try:
+        start = time.perf_counter()
+        await seed(db, count, rng)
+        print(f"Seeded {count} sessions x {len(BIG_FIVE_DIMENSIONS) * ANSWERS_PER_DIMENSION} answers "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        picks = rng.integers(0, count, requests)
+        ids = [s["session_id"] async for s in db.sessions.find({}, {"_id": 0, "session_id": 1})]
+        targets = []
+        for i in picks:
+            session = await db.sessions.find_one({"session_id": ids[i]}, {"_id": 0, "asked_questions": 1})
+            dim = list(BIG_FIVE_DIMENSIONS)[int(i) % len(BIG_FIVE_DIMENSIONS)]
+            targets.append((ids[i], session["asked_questions"][dim][0]))
+
+        store = MotorSessionStore(db.sessions, db.answers)
+        baseline = await time_reads(endpoint_reads(db, store, projected=False), targets)
+        await store.ensure_indexes()
+        await ensure_collection_indexes(db)
+        optimized = await time_reads(endpoint_reads(db, store, projected=True), targets)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    print(f"{requests} requests per endpoint; baseline = no indexes, whole documents")
+    print(f"{'endpoint':<16}{'base p50':>10}{'base p95':>10}{'opt p50':>10}{'opt p95':>10}{'speedup':>10}")
+    for name in baseline:
+        base, opt = baseline[name], optimized[name]
+        print(f"{name:<16}{np.percentile(base, 50):>10.2f}{np.percentile(base, 95):>10.2f}"
+              f"{np.percentile(opt, 50):>10.2f}{np.percentile(opt, 95):>10.2f}{base.mean() / opt.mean():>9.1f}x")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(run(count, requests))
+
+
+if __name__ == "__main__":
+    main()
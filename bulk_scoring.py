@@ -0,0 +1,381 @@
+"""Bulk re-scoring of stored sessions after item parameters or scoring rules change.
+
+Answers are read from a memory-mapped response matrix (response_export.py),
+split into row shards that a process pool scores in parallel, and written back
+to the session store in batched updates. Within a shard every estimator runs
+on the whole (sessions x items) block at once: Newton / Fisher scoring updates
+all thetas per iteration and EAP sums one log-likelihood table lookup per item.
+
+Sources:
+  simple  - simple_backend.py sessions (its SESSION_STORE, questions and scoring version);
+            writes "scores" and "scoring_version" on completed sessions. With the memory
+            store the sessions are read from sessions_data.json plus its journal and a new
+            snapshot is written, so the server must be stopped first (--server-stopped)
+  mongo   - the IRT backend's sessions and answers with the active calibrated parameters;
+            writes theta_estimates.<dim> and standard_errors.<dim>
+
+Usage: python bulk_scoring.py {simple,mongo} [--matrix DIR] [--workers N] [--chunk-rows N]
+                              [--model grm|2pl] [--estimator mle-newton|eap-quadrature|scipy]
+                              [--server-stopped]
+"""
+import argparse
+import asyncio
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy.special import erf
+from irt_engine import (
+    IRTEngine, GradedResponseEngine, ItemParameters, MODEL_2PL, MODEL_GRM,
+    ESTIMATOR_NEWTON, ESTIMATOR_EAP, DEFAULT_ESTIMATOR, DEFAULT_THETA_BOUNDS,
+    NEWTON_MAX_ITER, NEWTON_TOLERANCE, NEWTON_MAX_STEP, PROBABILITY_CLIP, quadrature_grid
+)
+from response_export import ResponseMatrix, MISSING, export_mongo, export_sessions
+
+BULK_SCORING_CONFIG = {
+    "chunk_rows": 50_000,      # Sessions per shard handed to a worker process
+    "workers": os.cpu_count() or 1,
+    "write_batch_size": 1000,  # Sessions per bulk store update
+    "initial_theta": 0.0
+}
+
+
+class ScoringPlan:
+    """Item parameters grouped by dimension and mapped to response matrix columns"""
+
+    def __init__(self, dimensions: List[str], columns: List[np.ndarray], parameters: List[ItemParameters],
+                 reverse: np.ndarray, model: str = MODEL_GRM, method: str = DEFAULT_ESTIMATOR,
+                 bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS, initial_theta: float = 0.0):
+        self.dimensions = dimensions
+        self.columns = columns
+        self.parameters = parameters
+        self.reverse = reverse
+        self.model = model
+        self.method = method
+        self.bounds = tuple(bounds)
+        self.initial_theta = initial_theta
+
+    @classmethod
+    def from_questions(cls, questions: List[Dict], dimensions: List[str],
+                       item_ids: Optional[Sequence[str]] = None, **options) -> "ScoringPlan":
+        """Plan for matrix columns item_ids (default: one column per question, in order)"""
+        if item_ids is None:
+            item_ids = [q["question_id"] for q in questions]
+        column_of = {qid: i for i, qid in enumerate(item_ids)}
+        reverse = np.zeros(len(item_ids), dtype=bool)
+        columns, parameters = [], []
+        for dimension in dimensions:
+            # Questions missing from the matrix have no answers to score
+            dim_questions = [q for q in questions if q.get("dimension") == dimension and q["question_id"] in column_of]
+            dim_columns = np.array([column_of[q["question_id"]] for q in dim_questions], dtype=np.intp)
+            reverse[dim_columns] = [bool(q.get("reverse_scored", False)) for q in dim_questions]
+            columns.append(dim_columns)
+            parameters.append(ItemParameters.from_questions(dim_questions, model=options.get("model", MODEL_GRM)))
+        return cls(dimensions, columns, parameters, reverse, **options)
+
+
+def keyed_responses(block: np.ndarray, reverse: np.ndarray) -> np.ndarray:
+    """Reverse-scored 1..5 answers of a raw block, keeping 0 for missing (and for out-of-range values)"""
+    block = np.asarray(block, dtype=np.int8)
+    block = np.where((block >= 1) & (block <= 5), block, MISSING)
+    return np.where(reverse & (block != MISSING), 6 - block, block).astype(np.int8)
+
+
+def _grm_terms(theta: np.ndarray, a: np.ndarray, thresholds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Category probabilities and their theta derivatives with shape (sessions, items, K)"""
+    z = a[:, np.newaxis] * (theta[:, np.newaxis, np.newaxis] - thresholds)
+    inner = 1 / (1 + np.exp(-z))
+    shape = inner.shape[:-1] + (1,)
+    cumulative = np.concatenate([np.ones(shape), inner, np.zeros(shape)], axis=-1)
+    w = cumulative * (1 - cumulative)
+    p = np.clip(cumulative[..., :-1] - cumulative[..., 1:], *PROBABILITY_CLIP)
+    return p, w[..., :-1] - w[..., 1:]
+
+
+def _score_information(theta: np.ndarray, x: np.ndarray, asked: np.ndarray,
+                       items: ItemParameters, model: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-session log-likelihood gradient and test information over the asked items"""
+    if model == MODEL_GRM:
+        p, dp = _grm_terms(theta, items.a, items.thresholds)
+        index = (np.maximum(x, 1).astype(np.intp) - 1)[..., np.newaxis]
+        ratio = np.take_along_axis(dp, index, axis=-1)[..., 0] / np.take_along_axis(p, index, axis=-1)[..., 0]
+        gradient = np.sum(asked * items.a * ratio, axis=1)
+        info = np.sum(asked * np.square(items.a) * np.sum(np.square(dp) / p, axis=-1), axis=1)
+        return gradient, info
+    y = (x >= 4).astype(np.float64)
+    p = IRTEngine.endorse_probability(theta[:, np.newaxis], items.a, items.b)
+    gradient = np.sum(asked * items.a * (y - p), axis=1)
+    info = np.sum(asked * np.square(items.a) * p * (1 - p), axis=1)
+    return gradient, info
+
+
+def _estimate_newton(x: np.ndarray, asked: np.ndarray, items: ItemParameters, plan: ScoringPlan):
+    """The engine's damped Newton / Fisher-scoring MLE, iterated for all sessions at once"""
+    theta = np.full(len(x), float(np.clip(plan.initial_theta, *plan.bounds)))
+    active = np.flatnonzero(asked.any(axis=1))
+    for _ in range(NEWTON_MAX_ITER):
+        if len(active) == 0:
+            break
+        # Only sessions that have not converged yet are recomputed
+        gradient, info = _score_information(theta[active], x[active], asked[active], items, plan.model)
+        positive = info > 0
+        active, gradient, info = active[positive], gradient[positive], info[positive]
+        step = np.clip(gradient / info, -NEWTON_MAX_STEP, NEWTON_MAX_STEP)
+        new_theta = np.clip(theta[active] + step, *plan.bounds)
+        converged = np.abs(new_theta - theta[active]) < NEWTON_TOLERANCE
+        theta[active] = new_theta
+        active = active[~converged]
+
+    _, info = _score_information(theta, x, asked, items, plan.model)
+    se = np.full(len(x), np.inf)
+    np.divide(1.0, np.sqrt(info), out=se, where=info > 0)
+    return theta, se
+
+
+def _estimate_eap(x: np.ndarray, asked: np.ndarray, items: ItemParameters, plan: ScoringPlan):
+    """EAP on the engine's quadrature grid: one table lookup per item for all sessions"""
+    grid, log_prior = quadrature_grid(plan.bounds)
+    if plan.model == MODEL_GRM:
+        categories = GradedResponseEngine.category_probabilities(grid, items.a, items.thresholds)
+        index = np.maximum(x, 1).astype(np.intp) - 1
+    else:
+        endorse = IRTEngine.endorse_probability(grid[:, np.newaxis], items.a, items.b)
+        categories = np.stack([1 - endorse, endorse], axis=-1)
+        index = (x >= 4).astype(np.intp)
+    log_table = np.log(np.clip(categories, *PROBABILITY_CLIP)).transpose(1, 2, 0)  # (items, K, grid)
+
+    log_posterior = np.tile(log_prior, (len(x), 1))
+    for j in range(len(items)):
+        log_posterior += asked[:, j, np.newaxis] * log_table[j, index[:, j]]
+    weights = np.exp(log_posterior - log_posterior.max(axis=1, keepdims=True))
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    theta = weights @ grid
+    se = np.sqrt(np.sum(weights * np.square(grid - theta[:, np.newaxis]), axis=1))
+    return theta, se
+
+
+def _estimate_rows(x: np.ndarray, asked: np.ndarray, items: ItemParameters, plan: ScoringPlan):
+    """Other estimators (the bounded scipy search) one session at a time through the engine"""
+    theta = np.full(len(x), plan.initial_theta)
+    se = np.full(len(x), np.inf)
+    for row in np.flatnonzero(asked.any(axis=1)):
+        mask = asked[row]
+        if plan.model == MODEL_GRM:
+            theta[row], se[row] = GradedResponseEngine.estimate_theta_arrays(
+                x[row, mask], items.a[mask], items.thresholds[mask], plan.initial_theta, plan.bounds, plan.method)
+        else:
+            theta[row], se[row] = IRTEngine.estimate_theta_arrays(
+                x[row, mask], items.a[mask], items.b[mask], plan.initial_theta, plan.bounds, plan.method)
+    return theta, se
+
+
+BULK_ESTIMATORS = {
+    ESTIMATOR_NEWTON: _estimate_newton,
+    ESTIMATOR_EAP: _estimate_eap
+}
+
+
+def score_block(block: np.ndarray, plan: ScoringPlan) -> Dict[str, np.ndarray]:
+    """theta, se, raw_score and items arrays of shape (sessions, dimensions) for a raw answer block"""
+    keyed = keyed_responses(block, plan.reverse)
+    n, d = len(keyed), len(plan.dimensions)
+    result = {
+        "theta": np.full((n, d), plan.initial_theta),
+        "se": np.full((n, d), np.inf),
+        "raw_score": np.zeros((n, d), dtype=np.int64),
+        "items": np.zeros((n, d), dtype=np.int64)
+    }
+    estimator = BULK_ESTIMATORS.get(plan.method, _estimate_rows)
+    for k, (columns, items) in enumerate(zip(plan.columns, plan.parameters)):
+        if len(columns) == 0:
+            continue
+        x = keyed[:, columns].astype(np.float64)
+        asked = x != MISSING
+        result["raw_score"][:, k] = x.sum(axis=1)
+        result["items"][:, k] = asked.sum(axis=1)
+        theta, se = estimator(x, asked, items, plan)
+        unanswered = ~asked.any(axis=1)
+        result["theta"][:, k] = np.where(unanswered, plan.initial_theta, theta)
+        result["se"][:, k] = np.where(unanswered, np.inf, se)
+    return result
+
+
+def dimension_scores(dimensions: List[str], result: Dict[str, np.ndarray]) -> List[Dict[str, Dict]]:
+    """Per-session scores as stored by simple_backend (percentile from the N(0, 1) norm)"""
+    items = result["items"]
+    answered = items > 0
+    # Rounded in bulk; the per-session loop below only assembles dicts
+    theta = np.round(result["theta"], 3).tolist()
+    se = np.where(np.isfinite(result["se"]), np.round(result["se"], 3), np.nan).tolist()
+    percentile = np.round(50 * (1 + erf(result["theta"] / np.sqrt(2))), 1).tolist()
+    mean = np.round(np.divide(result["raw_score"], items, out=np.zeros(items.shape), where=answered), 2).tolist()
+    raw_score = result["raw_score"].tolist()
+    answered, items = answered.tolist(), items.tolist()
+
+    sessions = []
+    for i in range(len(items)):
+        scores = {}
+        for k, dimension in enumerate(dimensions):
+            if not answered[i][k]:
+                scores[dimension] = {"raw_score": 0, "items": 0, "mean": None, "theta": None,
+                                     "standard_error": None, "percentile": None}
+                continue
+            scores[dimension] = {
+                "raw_score": raw_score[i][k],
+                "items": items[i][k],
+                "mean": mean[i][k],
+                "theta": theta[i][k],
+                "standard_error": None if math.isnan(se[i][k]) else se[i][k],
+                "percentile": percentile[i][k]
+            }
+        sessions.append(scores)
+    return sessions
+
+
+def score_shard(path: str, start: int, stop: int, plan: ScoringPlan) -> Tuple[int, Dict[str, np.ndarray]]:
+    """Worker entry point: score matrix rows [start, stop) read straight from the memory map"""
+    matrix = ResponseMatrix.open(path)
+    return start, score_block(matrix.responses[start:stop], plan)
+
+
+async def rescore_matrix(matrix: ResponseMatrix, plan: ScoringPlan, store,
+                         fields: Callable[[Dict[str, np.ndarray]], List[Dict]], config: Dict = BULK_SCORING_CONFIG) -> int:
+    """Score every matrix row in a process pool and write fields(shard result) per session in bulk"""
+    rows = matrix.shape[0]
+    shards = [(start, min(start + config["chunk_rows"], rows)) for start in range(0, rows, config["chunk_rows"])]
+    workers = max(1, min(config["workers"], len(shards)))
+    written = 0
+
+    async def write(start: int, result: Dict[str, np.ndarray]):
+        nonlocal written
+        updates = list(zip(matrix.session_ids[start:start + len(result["theta"])], fields(result)))
+        for offset in range(0, len(updates), config["write_batch_size"]):
+            written += await store.update_many(updates[offset:offset + config["write_batch_size"]])
+
+    if workers == 1:
+        for start, stop in shards:
+            await write(*score_shard(matrix.path, start, stop, plan))
+        return written
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = [loop.run_in_executor(pool, score_shard, matrix.path, start, stop, plan) for start, stop in shards]
+        # Write each shard as soon as it is scored while the others are still running
+        for next_shard in asyncio.as_completed(pending):
+            await write(*await next_shard)
+    return written
+
+
+async def rescore_simple(config: Dict, matrix_path: Optional[str], options: Dict,
+                         server_stopped: bool = False) -> int:
+    """Re-score completed simple_backend sessions in its configured session store
+
+    The memory store only exists inside the server process: its snapshot and journal
+    are loaded here and replaced by a new snapshot, which would drop whatever a running
+    server journals meanwhile. It therefore needs server_stopped.
+    """
+    # Importing the backend only builds its question bank and stores; session files are read at startup
+    import simple_backend as backend
+
+    if backend.SESSION_STORE == backend.STORE_MEMORY:
+        if not server_stopped:
+            raise SystemExit("simple_backend uses the memory session store: stop the server, "
+                             "then run again with --server-stopped")
+        backend.load_sessions()
+    store = backend.session_store
+    options = {"model": backend.SCORING_MODEL, "method": backend.SCORING_ESTIMATOR,
+               "bounds": backend.THETA_BOUNDS, **options}
+    with tempfile.TemporaryDirectory(prefix="rescore-") as tmp:
+        if matrix_path is None:
+            matrix_path = tmp
+            completed = [s async for s in store.scan({"status": "completed"})]
+            export_sessions(completed, matrix_path, items=backend.compiled_questions, dimensions=backend.DIMENSIONS)
+        matrix = ResponseMatrix.open(matrix_path)
+        plan = ScoringPlan.from_questions(backend.compiled_questions, backend.DIMENSIONS, matrix.item_ids, **options)
+
+        def fields(result):
+            return [{"scores": scores, "scoring_version": backend.SCORING_VERSION}
+                    for scores in dimension_scores(plan.dimensions, result)]
+
+        written = await rescore_matrix(matrix, plan, store, fields, config)
+
+    if backend.SESSION_STORE == backend.STORE_MEMORY:
+        backend.save_sessions()
+    await store.close()
+    return written
+
+
+async def load_active_questions(db) -> List[Dict]:
+    """Question bank with the active calibrated parameters overlaid (as the IRT backend loads it)"""
+    questions = {q["question_id"]: q async for q in db.questions.find({}, {"_id": 0})}
+    params_version = await db.metadata.find_one({"_id": "irt_parameters"})
+    if params_version:
+        async for params in db.irt_parameters.find({"version": params_version["version"]}, {"_id": 0}):
+            question = questions.get(params["question_id"])
+            if question:
+                for field in ("discrimination", "difficulty", "thresholds"):
+                    if field in params:
+                        question[field] = params[field]
+    return list(questions.values())
+
+
+async def rescore_mongo(config: Dict, matrix_path: Optional[str], options: Dict) -> int:
+    """Re-estimate every dimension of the IRT backend's completed sessions"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from session_store import create_session_store, STORE_MONGO
+
+    db = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))[
+        os.getenv("DB_NAME", "personality_test_db")]
+    store = create_session_store(STORE_MONGO, db=db)
+    options = {"model": os.getenv("IRT_MODEL", MODEL_GRM), "method": os.getenv("IRT_ESTIMATOR", DEFAULT_ESTIMATOR),
+               **options}
+    with tempfile.TemporaryDirectory(prefix="rescore-") as tmp:
+        if matrix_path is None:
+            matrix_path = tmp
+            await export_mongo(db, matrix_path, session_filter={"status": "completed"})
+        matrix = ResponseMatrix.open(matrix_path)
+        plan = ScoringPlan.from_questions(await load_active_questions(db), matrix.dimensions, matrix.item_ids, **options)
+
+        def fields(result):
+            theta, se = result["theta"].tolist(), result["se"].tolist()
+            return [{
+                **{f"theta_estimates.{dim}": theta[i][k] for k, dim in enumerate(plan.dimensions)},
+                **{f"standard_errors.{dim}": se[i][k] for k, dim in enumerate(plan.dimensions)}
+            } for i in range(len(theta))]
+
+        return await rescore_matrix(matrix, plan, store, fields, config)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Re-score stored sessions in bulk")
+    parser.add_argument("source", choices=["simple", "mongo"])
+    parser.add_argument("--matrix", help="Score an existing response_export.py directory instead of exporting")
+    parser.add_argument("--workers", type=int, default=BULK_SCORING_CONFIG["workers"])
+    parser.add_argument("--chunk-rows", type=int, default=BULK_SCORING_CONFIG["chunk_rows"])
+    parser.add_argument("--model", choices=[MODEL_GRM, MODEL_2PL])
+    parser.add_argument("--estimator", help="Theta estimator (default: the backend's)")
+    parser.add_argument("--server-stopped", action="store_true",
+                        help="Confirm simple_backend is not running (required with its memory session store)")
+    args = parser.parse_args()
+
+    config = dict(BULK_SCORING_CONFIG, workers=args.workers, chunk_rows=args.chunk_rows)
+    options = {"initial_theta": config["initial_theta"]}
+    if args.model:
+        options["model"] = args.model
+    if args.estimator:
+        options["method"] = args.estimator
+
+    started = time.perf_counter()
+    if args.source == "simple":
+        written = await rescore_simple(config, args.matrix, options, server_stopped=args.server_stopped)
+    else:
+        written = await rescore_mongo(config, args.matrix, options)
+    print(f"Re-scored {written} sessions in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,334 @@
+"""Offline item calibration by marginal maximum likelihood (Bock-Aitkin EM).
+
+Streams stored answers from Mongo into compact NumPy arrays, fits item
+parameters per dimension with vectorized E and M steps on a quadrature grid,
+and writes the result as a new version in the irt_parameters collection.
+
+Answers can also be read from a response matrix written by response_export.py
+(--matrix DIR), which scans the memory-mapped file instead of Mongo.
+
+Usage: python irt_calibration.py [--dimension openness] [--model grm] [--max-iter 50] [--matrix DIR]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from irt_engine import (
+    GradedResponseEngine, MODEL_2PL, MODEL_GRM, PROBABILITY_CLIP,
+    quadrature_grid, item_thresholds
+)
+from response_export import ResponseMatrix, MISSING
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "personality_test_db")
+
+CALIBRATION_CONFIG = {
+    "theta_bounds": (-4.0, 4.0),  # Quadrature range for the latent trait
+    "quadrature_points": 41,
+    "max_iter": 50,               # EM cycles
+    "tolerance": 1e-5,            # Relative change in marginal log-likelihood to stop
+    "m_step_iterations": 3,       # Fisher-scoring steps per M step
+    "chunk_answers": 250_000,     # Answers per E-step chunk (bounds peak memory)
+    "read_batch_size": 10_000,    # Mongo cursor batch size
+    "min_responses": 20,          # Items with fewer responses keep their current parameters
+    "discrimination_bounds": (0.2, 4.0),
+    "threshold_bounds": (-6.0, 6.0)
+}
+
+# Active calibration version pointer in the metadata collection
+PARAMETERS_VERSION_KEY = "irt_parameters"
+
+
+class ResponseData:
+    """Answers of one dimension as compact parallel arrays sorted by person"""
+
+    def __init__(self, person: np.ndarray, item: np.ndarray, response: np.ndarray,
+                 item_ids: List[str]):
+        order = np.argsort(person, kind='stable')
+        self.person = person[order]
+        self.item = item[order]
+        self.response = response[order]  # Category index 0..K-1
+        self.item_ids = item_ids
+
+    def __len__(self) -> int:
+        return len(self.person)
+
+    def chunks(self, chunk_answers: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Slices of at most ~chunk_answers answers that never split a person"""
+        start = 0
+        total = len(self.person)
+        while start < total:
+            stop = min(start + chunk_answers, total)
+            if stop < total:
+                # Extend to the end of the last person in the chunk
+                stop = int(np.searchsorted(self.person, self.person[stop - 1], side='right'))
+            yield self.person[start:stop], self.item[start:stop], self.response[start:stop]
+            start = stop
+
+    def response_counts(self) -> np.ndarray:
+        return np.bincount(self.item, minlength=len(self.item_ids))
+
+
+def to_categories(responses: np.ndarray, model: str) -> np.ndarray:
+    """Map reverse-scored 1..5 Likert answers to 0-based model categories"""
+    if model == MODEL_2PL:
+        return (responses >= 4).astype(np.int8)
+    return (responses - 1).astype(np.int8)
+
+
+async def load_dimension_answers(db, dimension: str, questions: List[Dict], model: str,
+                                 batch_size: int) -> ResponseData:
+    """Stream a dimension's answers from Mongo into compact arrays"""
+    item_index = {q["question_id"]: i for i, q in enumerate(questions)}
+    reverse = np.array([q.get("reverse_scored", False) for q in questions], dtype=bool)
+    session_index: Dict[str, int] = {}
+    persons, items, answers = [], [], []
+    batch_person, batch_item, batch_answer = [], [], []
+
+    def flush():
+        if batch_person:
+            persons.append(np.array(batch_person, dtype=np.int32))
+            items.append(np.array(batch_item, dtype=np.int32))
+            answers.append(np.array(batch_answer, dtype=np.int8))
+            batch_person.clear()
+            batch_item.clear()
+            batch_answer.clear()
+
+    cursor = db.answers.find(
+        {"dimension": dimension},
+        {"_id": 0, "session_id": 1, "question_id": 1, "answer": 1}
+    ).batch_size(batch_size)
+    async for ans in cursor:
+        item = item_index.get(ans["question_id"])
+        if item is None:
+            continue
+        batch_person.append(session_index.setdefault(ans["session_id"], len(session_index)))
+        batch_item.append(item)
+        batch_answer.append(ans["answer"])
+        if len(batch_person) >= batch_size:
+            flush()
+    flush()
+
+    if not persons:
+        empty = np.empty(0, dtype=np.int32)
+        return ResponseData(empty, empty, np.empty(0, dtype=np.int8), list(item_index))
+
+    item = np.concatenate(items)
+    response = np.concatenate(answers)
+    # Handle reverse scoring
+    response = np.where(reverse[item], 6 - response, response)
+    return ResponseData(np.concatenate(persons), item, to_categories(response, model), list(item_index))
+
+
+def load_matrix_answers(matrix: ResponseMatrix, questions: List[Dict], model: str,
+                        chunk_rows: int = 65536) -> ResponseData:
+    """Collect a dimension's answers from a memory-mapped response matrix"""
+    columns = {qid: i for i, qid in enumerate(matrix.item_ids)}
+    present = [i for i, q in enumerate(questions) if q["question_id"] in columns]
+    matrix_columns = np.array([columns[questions[i]["question_id"]] for i in present], dtype=np.intp)
+    item_of_column = np.array(present, dtype=np.int32)
+    persons, items, answers = [], [], []
+
+    for start, block in matrix.iter_rows(chunk_rows):
+        scored = matrix.scored(block[:, matrix_columns], matrix_columns)
+        rows, cols = np.nonzero(scored != MISSING)
+        persons.append((rows + start).astype(np.int32))
+        items.append(item_of_column[cols])
+        answers.append(scored[rows, cols])
+
+    item_ids = [q["question_id"] for q in questions]
+    if not persons:
+        empty = np.empty(0, dtype=np.int32)
+        return ResponseData(empty, empty, np.empty(0, dtype=np.int8), item_ids)
+    return ResponseData(np.concatenate(persons), np.concatenate(items),
+                        to_categories(np.concatenate(answers), model), item_ids)
+
+
+class MMLCalibrator:
+    """Bock-Aitkin EM for the GRM (the 2PL is the two-category case)
+
+    Items are parametrized by cumulative logits P*_k(theta) = sigmoid(a theta + c_k),
+    so b_k = -c_k / a. The E step accumulates expected category counts per item
+    on the quadrature grid; the M step runs Fisher scoring for all items at once.
+    """
+
+    def __init__(self, discrimination: np.ndarray, thresholds: np.ndarray,
+                 config: Dict = CALIBRATION_CONFIG):
+        self.config = config
+        self.a = np.asarray(discrimination, dtype=np.float64).copy()
+        self.thresholds = np.asarray(thresholds, dtype=np.float64).copy()
+        self.grid, self.log_prior = quadrature_grid(tuple(config["theta_bounds"]),
+                                                    config["quadrature_points"])
+        self.log_likelihood = -np.inf
+        self.iterations = 0
+
+    @property
+    def categories(self) -> int:
+        return self.thresholds.shape[1] + 1
+
+    def e_step(self, data: ResponseData) -> Tuple[np.ndarray, float]:
+        """Expected counts r[item, category, q] and the marginal log-likelihood"""
+        n_items, n_cat = len(self.a), self.categories
+        q_points = len(self.grid)
+        # (items * categories, Q) log category probabilities on the grid
+        probabilities = GradedResponseEngine.category_probabilities(self.grid, self.a, self.thresholds)
+        log_p = np.log(np.clip(probabilities, *PROBABILITY_CLIP)).transpose(1, 2, 0).reshape(n_items * n_cat, q_points)
+
+        counts = np.zeros((n_items * n_cat, q_points))
+        total = 0.0
+        for person, item, response in data.chunks(self.config["chunk_answers"]):
+            flat = item.astype(np.intp) * n_cat + response
+            starts = np.flatnonzero(np.r_[True, person[1:] != person[:-1]])
+            local = np.cumsum(np.r_[False, person[1:] != person[:-1]])
+
+            # Posterior over the grid for every person in the chunk
+            log_post = np.add.reduceat(log_p[flat], starts, axis=0) + self.log_prior
+            peak = log_post.max(axis=1, keepdims=True)
+            posterior = np.exp(log_post - peak)
+            norm = posterior.sum(axis=1, keepdims=True)
+            total += float(np.sum(peak + np.log(norm)))
+            posterior /= norm
+
+            weights = posterior[local]
+            for q in range(q_points):
+                counts[:, q] += np.bincount(flat, weights=weights[:, q], minlength=n_items * n_cat)
+
+        return counts.reshape(n_items, n_cat, q_points), total
+
+    def m_step(self, counts: np.ndarray, update: np.ndarray):
+        """Fisher scoring on (a, c_1..c_{K-1}) for every item flagged in `update`"""
+        a_min, a_max = self.config["discrimination_bounds"]
+        b_min, b_max = self.config["threshold_bounds"]
+        grid = self.grid
+        n_items, n_cat, _ = counts.shape
+        n_params = n_cat  # a plus K-1 intercepts
+        totals = counts.sum(axis=1)  # (items, Q)
+
+        for _ in range(self.config["m_step_iterations"]):
+            c = -self.a[:, np.newaxis] * self.thresholds
+            cumulative = GradedResponseEngine.cumulative_probabilities(grid, self.a, self.thresholds)
+            cumulative = cumulative.transpose(1, 2, 0)  # (items, K+1, Q)
+            w = cumulative * (1 - cumulative)
+
+            # Derivatives of the boundary curves P*_k w.r.t. (a, c_1..c_{K-1})
+            d_star = np.zeros((n_items, n_cat + 1, len(grid), n_params))
+            d_star[:, 1:-1, :, 0] = w[:, 1:-1, :] * grid
+            for k in range(1, n_cat):
+                d_star[:, k, :, k] = w[:, k, :]
+            d_cat = d_star[:, :-1] - d_star[:, 1:]  # (items, K, Q, P)
+            p = np.clip(cumulative[:, :-1] - cumulative[:, 1:], *PROBABILITY_CLIP)
+
+            gradient = np.einsum('ikq,ikqp->ip', counts / p, d_cat)
+            information = np.einsum('iq,ikqp,ikqr->ipr', totals, d_cat / p[..., np.newaxis], d_cat)
+            information += 1e-6 * np.eye(n_params)
+            step = np.linalg.solve(information, gradient[..., np.newaxis])[..., 0]
+            step = np.clip(step, -1.0, 1.0)
+            step[~update] = 0.0
+
+            a = np.clip(self.a + step[:, 0], a_min, a_max)
+            c = c + step[:, 1:]
+            thresholds = np.clip(-c / a[:, np.newaxis], b_min, b_max)
+            self.a, self.thresholds = a, np.sort(thresholds, axis=1)
+
+    def fit(self, data: ResponseData) -> "MMLCalibrator":
+        update = data.response_counts() >= self.config["min_responses"]
+        for iteration in range(1, self.config["max_iter"] + 1):
+            counts, log_likelihood = self.e_step(data)
+            previous = self.log_likelihood
+            self.log_likelihood = log_likelihood
+            self.iterations = iteration
+            if np.isfinite(previous) and abs(log_likelihood - previous) <= self.config["tolerance"] * abs(previous):
+                break
+            self.m_step(counts, update)
+        return self
+
+
+def initial_parameters(questions: List[Dict], model: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Starting values from the current question bank"""
+    a = np.array([q.get("discrimination", 1.0) for q in questions], dtype=np.float64)
+    if model == MODEL_2PL:
+        thresholds = np.array([[q.get("difficulty", 0.0)] for q in questions], dtype=np.float64)
+    else:
+        thresholds = np.array([item_thresholds(q) for q in questions], dtype=np.float64)
+    return a, thresholds.reshape(len(questions), -1)
+
+
+async def next_parameters_version(db) -> int:
+    latest = await db.irt_parameters.find_one({}, {"version": 1}, sort=[("version", -1)])
+    return (latest["version"] + 1) if latest else 1
+
+
+async def calibrate(db, dimensions: List[str], model: str = MODEL_GRM,
+                    config: Dict = CALIBRATION_CONFIG, activate: bool = True,
+                    matrix: Optional[ResponseMatrix] = None) -> Optional[int]:
+    """Calibrate the given dimensions and store the parameters as a new version"""
+    version = await next_parameters_version(db)
+    calibrated_at = datetime.utcnow()
+    documents = []
+
+    for dimension in dimensions:
+        questions = [q async for q in db.questions.find({"dimension": dimension}, {"_id": 0})]
+        if not questions:
+            continue
+        if matrix is not None:
+            data = load_matrix_answers(matrix, questions, model)
+        else:
+            data = await load_dimension_answers(db, dimension, questions, model, config["read_batch_size"])
+        if len(data) == 0:
+            print(f"{dimension}: no answers, skipped")
+            continue
+
+        a, thresholds = initial_parameters(questions, model)
+        calibrator = MMLCalibrator(a, thresholds, config).fit(data)
+        counts = data.response_counts()
+        print(f"{dimension}: {len(data)} answers, {calibrator.iterations} EM cycles, "
+              f"log-likelihood {calibrator.log_likelihood:.1f}")
+
+        for i, question in enumerate(questions):
+            doc = {
+                "version": version,
+                "question_id": question["question_id"],
+                "dimension": dimension,
+                "model": model,
+                "discrimination": float(calibrator.a[i]),
+                "difficulty": float(np.mean(calibrator.thresholds[i])),
+                "n_responses": int(counts[i]),
+                "calibrated_at": calibrated_at
+            }
+            if model == MODEL_GRM:
+                doc["thresholds"] = calibrator.thresholds[i].tolist()
+            documents.append(doc)
+
+    if not documents:
+        return None
+
+    await db.irt_parameters.insert_many(documents)
+    if activate:
+        # Point running servers at the new version and make their item bank caches reload
+        await db.metadata.update_one({"_id": PARAMETERS_VERSION_KEY}, {"$set": {"version": version}}, upsert=True)
+        await db.metadata.update_one({"_id": "question_bank"}, {"$inc": {"version": 1}}, upsert=True)
+    print(f"Stored {len(documents)} item parameters as version {version}")
+    return version
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Calibrate IRT item parameters from stored answers")
+    parser.add_argument("--dimension", action="append", help="Dimension to calibrate (default: all)")
+    parser.add_argument("--model", default=os.getenv("IRT_MODEL", MODEL_GRM), choices=[MODEL_GRM, MODEL_2PL])
+    parser.add_argument("--max-iter", type=int, default=CALIBRATION_CONFIG["max_iter"])
+    parser.add_argument("--no-activate", action="store_true", help="Store the version without activating it")
+    parser.add_argument("--matrix", help="Read answers from a response_export.py directory instead of Mongo")
+    args = parser.parse_args()
+
+    db = AsyncIOMotorClient(MONGO_URL)[DB_NAME]
+    dimensions = args.dimension or await db.questions.distinct("dimension")
+    config = dict(CALIBRATION_CONFIG, max_iter=args.max_iter)
+    matrix = ResponseMatrix.open(args.matrix) if args.matrix else None
+    await calibrate(db, dimensions, args.model, config, activate=not args.no_activate, matrix=matrix)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,516 @@
+from typing import List, Optional, Dict, Tuple, Sequence
+from functools import lru_cache
+import numpy as np
+from scipy.optimize import minimize_scalar
+from scipy.stats import norm
+
+# Default bounds for theta estimation (mirrors IRT_CONFIG["theta_bounds"])
+DEFAULT_THETA_BOUNDS = (-3.0, 3.0)
+
+# Probabilities are clipped to this range before taking logs to avoid log(0)
+PROBABILITY_CLIP = (0.0001, 0.9999)
+
+# Theta estimators selectable through IRT_CONFIG["estimator"]
+ESTIMATOR_SCIPY = "scipy"
+ESTIMATOR_NEWTON = "mle-newton"
+ESTIMATOR_EAP = "eap-quadrature"
+DEFAULT_ESTIMATOR = ESTIMATOR_NEWTON
+
+# Newton-Raphson settings
+NEWTON_MAX_ITER = 25
+NEWTON_TOLERANCE = 1e-6
+NEWTON_MAX_STEP = 1.0  # Damping: largest theta change per iteration
+
+# Number of quadrature points used by the EAP estimator
+QUADRATURE_POINTS = 61
+
+# IRT models selectable through IRT_CONFIG["model"]
+MODEL_2PL = "2pl"
+MODEL_GRM = "grm"
+
+# Graded Response Model: 5-point Likert items have 4 ordered category thresholds.
+# Items without calibrated thresholds get these offsets around their difficulty.
+LIKERT_CATEGORIES = 5
+DEFAULT_THRESHOLD_OFFSETS = (-1.5, -0.5, 0.5, 1.5)
+
+# Item selection index: theta grid resolution and ranked items kept per grid point
+SELECTION_GRID_POINTS = 601
+SELECTION_DEPTH = 16
+SELECTION_BLOCK_ROWS = 64  # Grid rows tabulated at a time to bound memory on large banks
+
+
+@lru_cache(maxsize=8)
+def quadrature_grid(bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS,
+                    points: int = QUADRATURE_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """Fixed theta grid with log standard normal prior weights (computed once per bounds)"""
+    grid = np.linspace(bounds[0], bounds[1], points)
+    log_prior = norm.logpdf(grid)
+    grid.setflags(write=False)
+    log_prior.setflags(write=False)
+    return grid, log_prior
+
+
+def default_thresholds(difficulty: float) -> List[float]:
+    """GRM category thresholds spread around an item's difficulty"""
+    return [difficulty + offset for offset in DEFAULT_THRESHOLD_OFFSETS]
+
+
+def item_thresholds(question: Dict) -> List[float]:
+    """Calibrated GRM thresholds of a question document, or defaults from its difficulty"""
+    thresholds = question.get('thresholds')
+    if thresholds:
+        return list(thresholds)
+    return default_thresholds(question.get('difficulty', 0.0))
+
+
+class ItemParameters:
+    """Item parameters for a set of questions held as parallel NumPy arrays"""
+
+    def __init__(self, question_ids: Sequence[str], discrimination: Sequence[float],
+                 difficulty: Sequence[float], thresholds: Optional[Sequence[Sequence[float]]] = None,
+                 model: str = MODEL_2PL):
+        self.question_ids = list(question_ids)
+        self.a = np.asarray(discrimination, dtype=np.float64)
+        self.b = np.asarray(difficulty, dtype=np.float64)
+        self.model = model
+        if thresholds is None:
+            thresholds = self.b[:, np.newaxis] + np.asarray(DEFAULT_THRESHOLD_OFFSETS)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64).reshape(len(self.b), LIKERT_CATEGORIES - 1)
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    @classmethod
+    def from_questions(cls, questions: List[Dict], model: str = MODEL_2PL) -> "ItemParameters":
+        """Build parameter arrays from question documents"""
+        n = len(questions)
+        a = np.fromiter((q.get('discrimination', 1.0) for q in questions), dtype=np.float64, count=n)
+        b = np.fromiter((q.get('difficulty', 0.0) for q in questions), dtype=np.float64, count=n)
+        thresholds = [item_thresholds(q) for q in questions] if model == MODEL_GRM else None
+        return cls([q.get('question_id') for q in questions], a, b, thresholds, model)
+
+    def information(self, theta):
+        """Item information at a scalar theta (n,) or at each point of a theta grid (grid, n)"""
+        if self.model == MODEL_GRM:
+            return GradedResponseEngine.information(theta, self.a, self.thresholds)
+        theta = np.asarray(theta, dtype=np.float64)
+        if theta.ndim:
+            theta = theta[:, np.newaxis]
+        return IRTEngine.information_2pl(theta, self.a, self.b)
+
+
+class IRTEngine:
+    """IRT (2PL Model) Engine for Adaptive Testing
+
+    All methods accept scalars or NumPy arrays so likelihood and information
+    are computed for every item in a single array operation.
+    """
+
+    @staticmethod
+    def endorse_probability(theta, a, b):
+        """Probability of endorsing (agree/strongly agree) under the 2PL model"""
+        z = np.multiply(a, np.subtract(theta, b))
+        return 1 / (1 + np.exp(-z))
+
+    @staticmethod
+    def probability_2pl(theta, a, b, response):
+        """Calculate probability using 2PL model for Likert scale responses"""
+        # Convert 5-point Likert to probability using graded response model approach
+        # Simplified: use middle threshold for binary-like calculation
+        p = IRTEngine.endorse_probability(theta, a, b)
+        return np.where(np.asarray(response) >= 4, p, 1 - p)
+
+    @staticmethod
+    def information_2pl(theta, a, b):
+        """Calculate Fisher Information for 2PL model"""
+        p = IRTEngine.endorse_probability(theta, a, b)
+        return np.square(a) * p * (1 - p)
+
+    @staticmethod
+    def log_likelihood(theta: float, responses: np.ndarray, a: np.ndarray, b: np.ndarray) -> float:
+        """Log-likelihood of a response pattern summed over all items at once"""
+        p = IRTEngine.probability_2pl(theta, a, b, responses)
+        p = np.clip(p, *PROBABILITY_CLIP)
+        return float(np.sum(np.log(p)))
+
+    @staticmethod
+    def test_information(theta: float, a: np.ndarray, b: np.ndarray) -> float:
+        """Total Fisher Information of a set of items at theta"""
+        return float(np.sum(IRTEngine.information_2pl(theta, a, b)))
+
+    @staticmethod
+    def response_arrays(responses: List[Tuple[int, float, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Split (response, a, b) tuples into response, discrimination and difficulty arrays"""
+        data = np.asarray(responses, dtype=np.float64).reshape(-1, 3)
+        return data[:, 0], data[:, 1], data[:, 2]
+
+    @staticmethod
+    def _estimate_scipy(x: np.ndarray, a: np.ndarray, b: np.ndarray, initial_theta: float,
+                        bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Legacy estimator: bounded scalar minimization of the negative log-likelihood"""
+        result = minimize_scalar(lambda theta: -IRTEngine.log_likelihood(theta, x, a, b),
+                                 bounds=bounds, method='bounded')
+
+        if result.success:
+            theta_hat = float(result.x)
+            # Calculate standard error using Fisher Information
+            total_info = IRTEngine.test_information(theta_hat, a, b)
+            se = 1.0 / np.sqrt(total_info) if total_info > 0 else float('inf')
+            return theta_hat, float(se)
+        else:
+            return initial_theta, float('inf')
+
+    @staticmethod
+    def score_information(theta: float, x: np.ndarray, a: np.ndarray, b: np.ndarray) -> Tuple[float, float]:
+        """Gradient of the 2PL log-likelihood and test information (-Hessian) at theta"""
+        y = (x >= 4).astype(np.float64)
+        p = IRTEngine.endorse_probability(theta, a, b)
+        gradient = float(np.sum(a * (y - p)))
+        info = float(np.sum(np.square(a) * p * (1 - p)))
+        return gradient, info
+
+    @staticmethod
+    def _estimate_newton(x: np.ndarray, a: np.ndarray, b: np.ndarray, initial_theta: float,
+                         bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Newton-Raphson MLE with analytic gradient and Hessian of the 2PL log-likelihood"""
+        theta = float(np.clip(initial_theta, *bounds))
+
+        for _ in range(NEWTON_MAX_ITER):
+            gradient, info = IRTEngine.score_information(theta, x, a, b)
+            if info <= 0:
+                break
+            step = max(-NEWTON_MAX_STEP, min(NEWTON_MAX_STEP, gradient / info))
+            new_theta = float(np.clip(theta + step, *bounds))
+            converged = abs(new_theta - theta) < NEWTON_TOLERANCE
+            theta = new_theta
+            if converged:
+                break
+
+        total_info = IRTEngine.test_information(theta, a, b)
+        se = 1.0 / np.sqrt(total_info) if total_info > 0 else float('inf')
+        return theta, float(se)
+
+    @staticmethod
+    def _estimate_eap(x: np.ndarray, a: np.ndarray, b: np.ndarray, initial_theta: float,
+                      bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Expected a posteriori estimate on a fixed quadrature grid with a N(0, 1) prior"""
+        grid, log_prior = quadrature_grid(tuple(bounds))
+        # (items x grid) response probabilities, summed into the log posterior in one pass
+        p = IRTEngine.probability_2pl(grid[np.newaxis, :], a[:, np.newaxis], b[:, np.newaxis],
+                                      x[:, np.newaxis])
+        log_posterior = log_prior + np.sum(np.log(np.clip(p, *PROBABILITY_CLIP)), axis=0)
+        weights = np.exp(log_posterior - log_posterior.max())
+        weights /= weights.sum()
+
+        theta = float(np.dot(weights, grid))
+        se = float(np.sqrt(np.dot(weights, np.square(grid - theta))))
+        return theta, se
+
+    @staticmethod
+    def estimate_theta(responses: List[Tuple[int, float, float]],
+                       initial_theta: float = 0.0,
+                       bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS,
+                       method: str = DEFAULT_ESTIMATOR) -> Tuple[float, float]:
+        """Estimate theta with the selected estimator, returning (theta, standard error)"""
+        if not responses:
+            return initial_theta, float('inf')
+
+        x, a, b = IRTEngine.response_arrays(responses)
+        return IRTEngine.estimate_theta_arrays(x, a, b, initial_theta, bounds, method)
+
+    @staticmethod
+    def estimate_theta_arrays(responses: Sequence[float], discrimination: Sequence[float],
+                              difficulty: Sequence[float], initial_theta: float = 0.0,
+                              bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS,
+                              method: str = DEFAULT_ESTIMATOR) -> Tuple[float, float]:
+        """Estimate theta from parallel response / parameter arrays"""
+        if len(responses) == 0:
+            return initial_theta, float('inf')
+
+        estimator = ESTIMATORS.get(method)
+        if estimator is None:
+            raise ValueError(f"Unknown theta estimator: {method}")
+
+        return estimator(np.asarray(responses, dtype=np.float64),
+                         np.asarray(discrimination, dtype=np.float64),
+                         np.asarray(difficulty, dtype=np.float64),
+                         initial_theta, bounds)
+
+    @staticmethod
+    def select_next_index(items: ItemParameters, current_theta: float) -> Optional[int]:
+        """Index of the most informative item in a parameter set"""
+        if len(items) == 0:
+            return None
+        return int(np.argmax(IRTEngine.information_2pl(current_theta, items.a, items.b)))
+
+    @staticmethod
+    def select_next_question(available_questions: List[Dict],
+                             current_theta: float) -> Optional[Dict]:
+        """Select the most informative question using Fisher Information"""
+        if not available_questions:
+            return None
+
+        index = IRTEngine.select_next_index(ItemParameters.from_questions(available_questions),
+                                            current_theta)
+        return available_questions[index]
+
+
+ESTIMATORS = {
+    ESTIMATOR_SCIPY: IRTEngine._estimate_scipy,
+    ESTIMATOR_NEWTON: IRTEngine._estimate_newton,
+    ESTIMATOR_EAP: IRTEngine._estimate_eap,
+}
+
+
+class GradedResponseEngine:
+    """Samejima Graded Response Model for ordered Likert responses
+
+    Each item has a discrimination `a` and ordered thresholds b_1 < ... < b_{K-1}.
+    The probability of answering in category k or above is
+    P*_k(theta) = 1 / (1 + exp(-a (theta - b_k))), with P*_0 = 1 and P*_K = 0,
+    and category k has probability P*_k - P*_{k+1}. Responses are the 1..K
+    Likert values (after reverse scoring). Every method is vectorized across
+    items, and across a theta grid when theta is a 1-D array.
+    """
+
+    @staticmethod
+    def _theta_axes(theta) -> np.ndarray:
+        """Theta shaped to broadcast against (items, thresholds) arrays"""
+        return np.asarray(theta, dtype=np.float64)[..., np.newaxis, np.newaxis]
+
+    @staticmethod
+    def cumulative_probabilities(theta, a: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        """Boundary curves P*_0..P*_K with shape ([grid,] items, K + 1)"""
+        theta = GradedResponseEngine._theta_axes(theta)
+        z = a[:, np.newaxis] * (theta - thresholds)
+        inner = 1 / (1 + np.exp(-z))
+        shape = inner.shape[:-1] + (1,)
+        return np.concatenate([np.ones(shape), inner, np.zeros(shape)], axis=-1)
+
+    @staticmethod
+    def category_probabilities(theta, a: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        """Probability of each response category with shape ([grid,] items, K)"""
+        cumulative = GradedResponseEngine.cumulative_probabilities(theta, a, thresholds)
+        return cumulative[..., :-1] - cumulative[..., 1:]
+
+    @staticmethod
+    def response_probabilities(theta, responses: np.ndarray, a: np.ndarray,
+                               thresholds: np.ndarray) -> np.ndarray:
+        """Probability of the observed responses with shape ([grid,] items)"""
+        categories = GradedResponseEngine.category_probabilities(theta, a, thresholds)
+        index = (np.asarray(responses, dtype=np.intp) - 1)[:, np.newaxis]
+        index = np.broadcast_to(index, categories.shape[:-1] + (1,))
+        return np.take_along_axis(categories, index, axis=-1)[..., 0]
+
+    @staticmethod
+    def log_likelihood(theta, responses: np.ndarray, a: np.ndarray, thresholds: np.ndarray):
+        """Log-likelihood of a response pattern (per grid point when theta is an array)"""
+        p = GradedResponseEngine.response_probabilities(theta, responses, a, thresholds)
+        return np.sum(np.log(np.clip(p, *PROBABILITY_CLIP)), axis=-1)
+
+    @staticmethod
+    def information(theta, a: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        """Fisher Information of each item with shape ([grid,] items)"""
+        cumulative = GradedResponseEngine.cumulative_probabilities(theta, a, thresholds)
+        w = cumulative * (1 - cumulative)
+        p = np.clip(cumulative[..., :-1] - cumulative[..., 1:], *PROBABILITY_CLIP)
+        return np.square(a) * np.sum(np.square(w[..., :-1] - w[..., 1:]) / p, axis=-1)
+
+    @staticmethod
+    def test_information(theta: float, a: np.ndarray, thresholds: np.ndarray) -> float:
+        """Total Fisher Information of a set of items at theta"""
+        return float(np.sum(GradedResponseEngine.information(theta, a, thresholds)))
+
+    @staticmethod
+    def _standard_error(theta: float, a: np.ndarray, thresholds: np.ndarray) -> float:
+        total_info = GradedResponseEngine.test_information(theta, a, thresholds)
+        return float(1.0 / np.sqrt(total_info)) if total_info > 0 else float('inf')
+
+    @staticmethod
+    def _estimate_scipy(x: np.ndarray, a: np.ndarray, thresholds: np.ndarray,
+                        initial_theta: float, bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Bounded scalar minimization of the negative GRM log-likelihood"""
+        result = minimize_scalar(
+            lambda theta: -float(GradedResponseEngine.log_likelihood(theta, x, a, thresholds)),
+            bounds=bounds, method='bounded')
+        if not result.success:
+            return initial_theta, float('inf')
+        theta_hat = float(result.x)
+        return theta_hat, GradedResponseEngine._standard_error(theta_hat, a, thresholds)
+
+    @staticmethod
+    def score_information(theta: float, x: np.ndarray, a: np.ndarray,
+                          thresholds: np.ndarray) -> Tuple[float, float]:
+        """Gradient of the GRM log-likelihood and expected test information at theta"""
+        index = (x.astype(np.intp) - 1)[:, np.newaxis]
+        cumulative = GradedResponseEngine.cumulative_probabilities(theta, a, thresholds)
+        w = cumulative * (1 - cumulative)
+        p = np.clip(cumulative[:, :-1] - cumulative[:, 1:], *PROBABILITY_CLIP)
+        dp = w[:, :-1] - w[:, 1:]
+        # d log P(x) / d theta = a (W_x - W_{x+1}) / P_x
+        gradient = float(np.sum(a * np.take_along_axis(dp, index, axis=1)[:, 0]
+                                / np.take_along_axis(p, index, axis=1)[:, 0]))
+        info = float(np.sum(np.square(a) * np.sum(np.square(dp) / p, axis=1)))
+        return gradient, info
+
+    @staticmethod
+    def _estimate_newton(x: np.ndarray, a: np.ndarray, thresholds: np.ndarray,
+                         initial_theta: float, bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Fisher-scoring MLE using the analytic GRM score function"""
+        theta = float(np.clip(initial_theta, *bounds))
+
+        for _ in range(NEWTON_MAX_ITER):
+            gradient, info = GradedResponseEngine.score_information(theta, x, a, thresholds)
+            if info <= 0:
+                break
+            step = max(-NEWTON_MAX_STEP, min(NEWTON_MAX_STEP, gradient / info))
+            new_theta = float(np.clip(theta + step, *bounds))
+            converged = abs(new_theta - theta) < NEWTON_TOLERANCE
+            theta = new_theta
+            if converged:
+                break
+
+        return theta, GradedResponseEngine._standard_error(theta, a, thresholds)
+
+    @staticmethod
+    def _estimate_eap(x: np.ndarray, a: np.ndarray, thresholds: np.ndarray,
+                      initial_theta: float, bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """Expected a posteriori estimate on a fixed quadrature grid with a N(0, 1) prior"""
+        grid, log_prior = quadrature_grid(tuple(bounds))
+        log_posterior = log_prior + GradedResponseEngine.log_likelihood(grid, x, a, thresholds)
+        weights = np.exp(log_posterior - log_posterior.max())
+        weights /= weights.sum()
+
+        theta = float(np.dot(weights, grid))
+        se = float(np.sqrt(np.dot(weights, np.square(grid - theta))))
+        return theta, se
+
+    @staticmethod
+    def estimate_theta_arrays(responses: Sequence[int], discrimination: Sequence[float],
+                              thresholds: Sequence[Sequence[float]], initial_theta: float = 0.0,
+                              bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS,
+                              method: str = DEFAULT_ESTIMATOR) -> Tuple[float, float]:
+        """Estimate theta from 1..K responses, discriminations and per-item thresholds"""
+        if len(responses) == 0:
+            return initial_theta, float('inf')
+
+        estimator = GRM_ESTIMATORS.get(method)
+        if estimator is None:
+            raise ValueError(f"Unknown theta estimator: {method}")
+
+        a = np.asarray(discrimination, dtype=np.float64)
+        return estimator(np.asarray(responses, dtype=np.float64), a,
+                         np.asarray(thresholds, dtype=np.float64).reshape(len(a), -1),
+                         initial_theta, bounds)
+
+
+GRM_ESTIMATORS = {
+    ESTIMATOR_SCIPY: GradedResponseEngine._estimate_scipy,
+    ESTIMATOR_NEWTON: GradedResponseEngine._estimate_newton,
+    ESTIMATOR_EAP: GradedResponseEngine._estimate_eap,
+}
+
+
+class InformationIndex:
+    """Precomputed maximum-information item selection for one item pool (2PL or GRM)
+
+    Item information is tabulated on a fine theta grid and, for every grid point,
+    only the `depth` most informative items are kept in ranked order. Selecting
+    the next item is then a grid lookup plus a short walk past already asked
+    items; the full pool is only rescanned if every ranked item was asked.
+    """
+
+    def __init__(self, items: ItemParameters,
+                 bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS,
+                 grid_points: int = SELECTION_GRID_POINTS,
+                 depth: int = SELECTION_DEPTH):
+        self.items = items
+        self.position = {qid: i for i, qid in enumerate(items.question_ids)}
+        self.grid = np.linspace(bounds[0], bounds[1], grid_points)
+        self.step = (bounds[1] - bounds[0]) / (grid_points - 1)
+        self.depth = min(depth, len(items))
+        self.ranked = np.empty((grid_points, self.depth), dtype=np.int32)
+
+        if self.depth == 0:
+            return
+        for start in range(0, grid_points, SELECTION_BLOCK_ROWS):
+            info = items.information(self.grid[start:start + SELECTION_BLOCK_ROWS])
+            top = np.argpartition(-info, self.depth - 1, axis=1)[:, :self.depth]
+            order = np.argsort(-np.take_along_axis(info, top, axis=1), axis=1, kind='stable')
+            self.ranked[start:start + len(info)] = np.take_along_axis(top, order, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def grid_index(self, theta: float) -> int:
+        """Nearest grid point to theta"""
+        index = int(round((theta - self.grid[0]) / self.step))
+        return min(max(index, 0), len(self.grid) - 1)
+
+    def select(self, theta: float, asked_question_ids: Sequence[str] = ()) -> Optional[int]:
+        """Position of the most informative item not yet asked, or None when exhausted"""
+        asked = {self.position[qid] for qid in asked_question_ids if qid in self.position}
+        for position in self.ranked[self.grid_index(theta)]:
+            if position not in asked:
+                return int(position)
+
+        if len(asked) >= len(self.items):
+            return None
+        info = self.items.information(theta)
+        info[list(asked)] = -np.inf
+        return int(np.argmax(info))
+
+
+class MultidimensionalEngine:
+    """Joint MAP estimation and D-optimal item selection across correlated traits
+
+    Every item loads on a single trait (between-item multidimensionality). The
+    traits share a multivariate normal prior with covariance `prior_covariance`,
+    so answers on one trait also sharpen the estimates of correlated traits.
+    """
+
+    @staticmethod
+    def estimate(dimensions: List[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                 prior_covariance: np.ndarray, model: str = MODEL_GRM,
+                 initial_theta: Optional[Sequence[float]] = None,
+                 bounds: Tuple[float, float] = DEFAULT_THETA_BOUNDS) -> Tuple[np.ndarray, np.ndarray]:
+        """Posterior mode and covariance of all traits
+
+        `dimensions` holds one (responses, discrimination, item_params) triple per
+        trait, where item_params are the difficulties (2PL) or thresholds (GRM).
+        """
+        count = len(dimensions)
+        prior_precision = np.linalg.inv(np.asarray(prior_covariance, dtype=np.float64))
+        theta = np.zeros(count) if initial_theta is None else np.clip(np.asarray(initial_theta, dtype=np.float64), *bounds)
+        engine = GradedResponseEngine if model == MODEL_GRM else IRTEngine
+
+        def score_information(values):
+            gradient = -prior_precision @ values
+            information = np.zeros(count)
+            for d, (x, a, params) in enumerate(dimensions):
+                if len(x):
+                    g, info = engine.score_information(values[d], x, a, params)
+                    gradient[d] += g
+                    information[d] = info
+            return gradient, prior_precision + np.diag(information)
+
+        for _ in range(NEWTON_MAX_ITER):
+            gradient, precision = score_information(theta)
+            step = np.clip(np.linalg.solve(precision, gradient), -NEWTON_MAX_STEP, NEWTON_MAX_STEP)
+            new_theta = np.clip(theta + step, *bounds)
+            converged = np.max(np.abs(new_theta - theta)) < NEWTON_TOLERANCE
+            theta = new_theta
+            if converged:
+                break
+
+        _, precision = score_information(theta)
+        return theta, np.linalg.inv(precision)
+
+    @staticmethod
+    def d_optimal_gain(item_information: float, posterior_variance: float) -> float:
+        """Relative growth of the posterior precision determinant from one more item
+
+        For an item loading only on trait d, det(P + I e_d e_d') = det(P) (1 + I C_dd),
+        so the D-optimal item maximizes its information times the trait's posterior variance.
+        """
+        return item_information * posterior_variance
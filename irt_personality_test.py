@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Callable
 import uuid
 import os
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta
 import asyncio
 import numpy as np
-from scipy.optimize import minimize_scalar
 from scipy.stats import norm
 import math
 import random
 # from emergentintegrations.llm.chat import LlmChat, UserMessage
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+from irt_engine import (
+    IRTEngine, GradedResponseEngine, MultidimensionalEngine, ItemParameters, InformationIndex,
+    MODEL_GRM, LIKERT_CATEGORIES, default_thresholds, item_thresholds
+)
+from session_store import create_session_store, STORE_MONGO
+from llm_client import create_llm_client
+from report_jobs import ReportJobQueue
+import json
 
 app = FastAPI()
 
@@ -29,6 +39,30 @@ sessions_collection = db.sessions
 questions_collection = db.questions
 answers_collection = db.answers
 irt_params_collection = db.irt_parameters
+metadata_collection = db.metadata
+reports_collection = db.reports
+
+# Sessions and answers go through the shared store interface (SESSION_STORE=mongo|sqlite|memory)
+SESSION_STORE = os.getenv("SESSION_STORE", STORE_MONGO)
+session_store = create_session_store(SESSION_STORE, db=db)
+
+# Session fields each read path needs; Mongo projects to these (irt_state alone is most of a document)
+SESSION_STATUS_FIELDS = ("status",)
+SESSION_PROGRESS_FIELDS = ("status", "current_dimension", "total_questions_asked",
+                           "theta_estimates", "standard_errors", "dimension_progress")
+SESSION_QUESTION_FIELDS = SESSION_PROGRESS_FIELDS + ("cat_mode", "asked_questions", "posterior_covariance")
+SESSION_REPORT_FIELDS = SESSION_PROGRESS_FIELDS + ("session_id", "name", "completed_at")
+ANSWER_STATE_FIELDS = ("question_id", "answer")
+IRT_PARAMETER_FIELDS = {"_id": 0, "question_id": 1, "discrimination": 1, "difficulty": 1, "thresholds": 1}
+# Bumped by every answer write; writes are conditioned on it (missing on older sessions, which matches None)
+SESSION_VERSION_FIELD = "version"
+
+async def ensure_collection_indexes(database):
+    """Indexes behind the question, calibration and report lookups (sessions and answers belong to the store)"""
+    await database.questions.create_index("question_id", unique=True)
+    await database.questions.create_index([("dimension", 1), ("source", 1), ("retired", 1)])
+    await database.irt_parameters.create_index([("version", 1), ("question_id", 1)])
+    await database.reports.create_index("session_id", unique=True)
 
 # CORS middleware
 app.add_middleware(
@@ -74,9 +108,40 @@ IRT_CONFIG = {
     "min_questions": 5,    # Minimum questions per dimension
     "max_questions": 15,   # Maximum questions per dimension
     "initial_theta": 0.0,  # Initial ability estimate
-    "theta_bounds": (-3.0, 3.0)  # Bounds for theta estimation
+    "theta_bounds": (-3.0, 3.0),  # Bounds for theta estimation
+    "model": os.getenv("IRT_MODEL", "grm"),  # "grm" (Graded Response Model) or "2pl" (binary split at 4)
+    "estimator": os.getenv("IRT_ESTIMATOR", "mle-newton"),  # "mle-newton", "eap-quadrature" or legacy "scipy"
+    "bank_refresh_interval": 30,  # Seconds between question bank version checks when change streams are unavailable
+    "bank_reload_debounce": 1.0,  # Seconds without question changes before the cache reloads
+    "bank_generation": os.getenv("QUESTION_BANK_GENERATION", "background"),  # "background", "blocking" or "off"
+    "bank_generation_concurrency": int(os.getenv("BANK_GENERATION_CONCURRENCY", 2)),  # Dimensions generated at once
+    "bank_generation_timeout": float(os.getenv("BANK_GENERATION_TIMEOUT", 90)),  # Seconds per dimension
+    "questions_per_dimension": 20,  # Questions generated per dimension
+    "cat_mode": os.getenv("IRT_CAT_MODE", "unidimensional"),  # "unidimensional" (one trait at a time) or "multidimensional"
+    "min_questions_multidimensional": 3,  # Minimum questions per dimension in multidimensional mode
+    "report_version": 1,  # Bump when report scoring or generation changes to invalidate cached reports
+    "report_workers": 2,  # Concurrent background report generations
+    "report_max_attempts": 3,  # Tries per report before giving up
+    "report_retry_delay": 2.0,  # Seconds before the first retry, doubled after each failure
+    "answer_write_attempts": 3,  # Re-reads of a session whose version changed under an answer
+    # Big Five trait correlations used as the multidimensional prior, in BIG_FIVE_DIMENSIONS order
+    "trait_correlations": [
+        [1.00, 0.20, 0.43, 0.21, -0.17],
+        [0.20, 1.00, 0.29, 0.43, -0.43],
+        [0.43, 0.29, 1.00, 0.26, -0.36],
+        [0.21, 0.43, 0.26, 1.00, -0.36],
+        [-0.17, -0.43, -0.36, -0.36, 1.00]
+    ]
 }
 
+CAT_MULTIDIMENSIONAL = "multidimensional"
+
+# Bundled questions served until the generated bank is ready
+SEED_BANK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_bank_seed.json")
+SOURCE_SEED = "seed"
+SOURCE_GENERATED = "generated"
+BANK_GENERATION_LOCK = "bank_generation"
+
 # Pydantic models
 class SessionCreate(BaseModel):
     name: str
@@ -99,6 +164,7 @@ class Question(BaseModel):
     reverse_scored: bool = False
     discrimination: float = 1.0
     difficulty: float = 0.0
+    thresholds: Optional[List[float]] = None  # GRM category thresholds
 
 class AnswerSubmit(BaseModel):
     session_id: str
@@ -106,6 +172,15 @@ class AnswerSubmit(BaseModel):
     answer: int  # 1-5 scale
     response_time: Optional[float] = None
 
+class BatchAnswer(BaseModel):
+    question_id: str
+    answer: int  # 1-5 scale
+    response_time: Optional[float] = None
+
+class AnswerBatchSubmit(BaseModel):
+    session_id: str
+    answers: List[BatchAnswer]  # In the order they were answered
+
 class PersonalityReport(BaseModel):
     session_id: str
     name: str
@@ -116,91 +191,379 @@ class PersonalityReport(BaseModel):
     total_questions_asked: int
     measurement_precision: Dict[str, float]
 
-class IRTEngine:
-    """IRT (2PL Model) Engine for Adaptive Testing"""
+class ItemBankCache:
+    """In-process cache of the question bank keyed by question_id
     
-    @staticmethod
-    def probability_2pl(theta: float, a: float, b: float, response: int) -> float:
-        """Calculate probability using 2PL model for Likert scale responses"""
-        # Convert 5-point Likert to probability using graded response model approach
-        # Simplified: use middle threshold for binary-like calculation
-        if response >= 4:  # Strong agree/agree
-            z = a * (theta - b)
-            return 1 / (1 + np.exp(-z))
-        else:  # Neutral/disagree/strong disagree
-            z = a * (theta - b)
-            return 1 - (1 / (1 + np.exp(-z)))
+    Loaded once at startup and reloaded whenever the bank changes, detected through a
+    Mongo change stream or, on deployments without a replica set, a version counter.
+    """
     
-    @staticmethod
-    def information_2pl(theta: float, a: float, b: float) -> float:
-        """Calculate Fisher Information for 2PL model"""
-        z = a * (theta - b)
-        p = 1 / (1 + np.exp(-z))
-        q = 1 - p
-        return (a ** 2) * p * q
+    VERSION_KEY = "question_bank"
+    PARAMETERS_KEY = "irt_parameters"
     
-    @staticmethod
-    def estimate_theta(responses: List[Tuple[int, float, float]], 
-                      initial_theta: float = 0.0) -> Tuple[float, float]:
-        """Estimate theta using Maximum Likelihood Estimation"""
-        if not responses:
-            return initial_theta, float('inf')
-        
-        def log_likelihood(theta):
-            ll = 0
-            for response, a, b in responses:
-                p = IRTEngine.probability_2pl(theta, a, b, response)
-                # Avoid log(0)
-                p = max(min(p, 0.9999), 0.0001)
-                ll += np.log(p)
-            return -ll  # Negative for minimization
-        
-        # Find optimal theta
-        result = minimize_scalar(log_likelihood, bounds=IRT_CONFIG["theta_bounds"], 
-                               method='bounded')
-        
-        if result.success:
-            theta_hat = result.x
-            # Calculate standard error using Fisher Information
-            total_info = sum(IRTEngine.information_2pl(theta_hat, a, b) 
-                           for _, a, b in responses)
-            se = 1.0 / np.sqrt(total_info) if total_info > 0 else float('inf')
-            return theta_hat, se
-        else:
-            return initial_theta, float('inf')
+    def __init__(self):
+        self.questions: Dict[str, Dict] = {}
+        self.by_dimension: Dict[str, List[Dict]] = {dim: [] for dim in BIG_FIVE_DIMENSIONS.keys()}
+        self.indexes: Dict[str, InformationIndex] = {}
+        self.version = None
+        self.parameters_version = None
     
-    @staticmethod
-    def select_next_question(available_questions: List[Dict], 
-                           current_theta: float) -> Optional[Dict]:
-        """Select the most informative question using Fisher Information"""
-        if not available_questions:
-            return None
+    async def load(self):
+        """Load the full question bank and swap it in"""
+        version = await self.current_version()
+        questions = {}
+        by_dimension = {dim: [] for dim in BIG_FIVE_DIMENSIONS.keys()}
+        async for q in questions_collection.find({}, {"_id": 0}):
+            questions[q["question_id"]] = q
+            # Retired questions stay answerable by older sessions but are never selected again
+            if not q.get("retired"):
+                by_dimension.setdefault(q["dimension"], []).append(q)
         
-        best_question = None
-        max_info = -1
+        # Overlay the active calibrated parameters (written by irt_calibration.py)
+        params_version = await metadata_collection.find_one({"_id": self.PARAMETERS_KEY})
+        if params_version:
+            async for params in irt_params_collection.find({"version": params_version["version"]}, IRT_PARAMETER_FIELDS):
+                question = questions.get(params["question_id"])
+                if question:
+                    for field in ("discrimination", "difficulty", "thresholds"):
+                        if field in params:
+                            question[field] = params[field]
         
-        for question in available_questions:
-            a = question.get('discrimination', 1.0)
-            b = question.get('difficulty', 0.0)
-            info = IRTEngine.information_2pl(current_theta, a, b)
-            
-            if info > max_info:
-                max_info = info
-                best_question = question
+        # Selection indexes are built off the event loop; large banks take a moment to tabulate
+        loop = asyncio.get_running_loop()
+        indexes = {}
+        for dim, dim_questions in by_dimension.items():
+            indexes[dim] = await loop.run_in_executor(None, self.build_index, dim_questions)
         
-        return best_question
+        self.questions, self.by_dimension, self.indexes, self.version = questions, by_dimension, indexes, version
+        self.parameters_version = params_version["version"] if params_version else None
+        print(f"Loaded {len(questions)} questions into item bank cache (version {version})")
+    
+    @classmethod
+    async def current_version(cls) -> int:
+        doc = await metadata_collection.find_one({"_id": cls.VERSION_KEY})
+        return doc["version"] if doc else 0
+    
+    @classmethod
+    async def bump_version(cls):
+        """Signal every running process that the question bank changed"""
+        await metadata_collection.update_one(
+            {"_id": cls.VERSION_KEY}, {"$inc": {"version": 1}}, upsert=True
+        )
+    
+    def get(self, question_id: str) -> Optional[Dict]:
+        return self.questions.get(question_id)
+    
+    async def fetch(self, question_id: str) -> Optional[Dict]:
+        """Cached question, falling back to Mongo for questions added since the last load"""
+        question = self.questions.get(question_id)
+        if question is None:
+            question = await questions_collection.find_one({"question_id": question_id}, {"_id": 0})
+            if question:
+                self.questions[question_id] = question
+        return question
+    
+    def dimension_questions(self, dimension: str) -> List[Dict]:
+        return self.by_dimension.get(dimension, [])
+    
+    @staticmethod
+    def build_index(questions: List[Dict]) -> InformationIndex:
+        return InformationIndex(ItemParameters.from_questions(questions, model=IRT_CONFIG["model"]),
+                                bounds=IRT_CONFIG["theta_bounds"],
+                                depth=IRT_CONFIG["max_questions"] + 1)
+    
+    def select_question(self, dimension: str, theta: float, asked_question_ids: List[str]) -> Optional[Dict]:
+        """Most informative unasked question of a dimension at theta"""
+        index = self.indexes.get(dimension)
+        if index is None:
+            return None
+        position = index.select(theta, asked_question_ids)
+        return None if position is None else self.by_dimension[dimension][position]
+    
+    async def watch(self):
+        """Keep the cache fresh for the lifetime of the process"""
+        try:
+            async with questions_collection.watch() as stream:
+                async for _ in stream:
+                    # Bank generation inserts many questions at once: wait for the burst to end, reload once
+                    while True:
+                        await asyncio.sleep(IRT_CONFIG["bank_reload_debounce"])
+                        drained = 0
+                        while await stream.try_next() is not None:
+                            drained += 1
+                        if not drained:
+                            break
+                    await self.load()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Change streams need a replica set; poll the version counter instead
+            print(f"Question bank change stream unavailable ({e}), polling version counter")
+        
+        while True:
+            await asyncio.sleep(IRT_CONFIG["bank_refresh_interval"])
+            try:
+                if await self.current_version() != self.version:
+                    await self.load()
+            except Exception as e:
+                print(f"Error refreshing item bank cache: {e}")
+
+item_bank = ItemBankCache()
+
+def empty_dimension_state() -> Dict[str, List]:
+    """Running IRT state for one dimension: parallel arrays of responses and item parameters"""
+    return {"responses": [], "discrimination": [], "difficulty": [], "thresholds": []}
+
+def append_to_dimension_state(state: Dict[str, List], question: Dict, answer: int):
+    """Add one answered item (reverse scored) to a dimension's running state"""
+    response_value = answer
+    # Handle reverse scoring
+    if question.get("reverse_scored", False):
+        response_value = 6 - response_value
+    
+    state["responses"].append(response_value)
+    state["discrimination"].append(question.get("discrimination", 1.0))
+    state["difficulty"].append(question.get("difficulty", 0.0))
+    state["thresholds"].append(item_thresholds(question))
+
+def estimate_dimension_theta(state: Dict[str, List], initial_theta: float) -> Tuple[float, float]:
+    """Estimate (theta, se) for one dimension with the configured IRT model and estimator"""
+    if IRT_CONFIG["model"] == MODEL_GRM:
+        # States saved before GRM support carry no thresholds
+        if len(state.get("thresholds", [])) != len(state["responses"]):
+            state["thresholds"] = [default_thresholds(b) for b in state["difficulty"]]
+        return GradedResponseEngine.estimate_theta_arrays(state["responses"],
+                                                          state["discrimination"],
+                                                          state["thresholds"],
+                                                          initial_theta,
+                                                          bounds=IRT_CONFIG["theta_bounds"],
+                                                          method=IRT_CONFIG["estimator"])
+    return IRTEngine.estimate_theta_arrays(state["responses"],
+                                           state["discrimination"],
+                                           state["difficulty"],
+                                           initial_theta,
+                                           bounds=IRT_CONFIG["theta_bounds"],
+                                           method=IRT_CONFIG["estimator"])
+
+async def rebuild_dimension_state(session_id: str, dimension: str, asked: List[str]) -> Dict[str, List]:
+    """Rebuild the running IRT state from stored answers (sessions created before irt_state existed)
+
+    Only answers to the asked questions count: the log is written before the session, so it
+    can hold an answer whose session update has not landed (yet).
+    """
+    state = empty_dimension_state()
+    for ans in await session_store.answers(session_id, dimension, fields=ANSWER_STATE_FIELDS):
+        if ans["question_id"] not in asked:
+            continue
+        ans_question = await item_bank.fetch(ans["question_id"])
+        if ans_question:
+            append_to_dimension_state(state, ans_question, ans["answer"])
+    return state
+
+async def stored_dimension_states(session: Dict, skip: Optional[str] = None) -> Dict[str, Dict[str, List]]:
+    """Running IRT state of every answered dimension but skip; missing ones are rebuilt from the log"""
+    states = {}
+    for dim, asked in session["asked_questions"].items():
+        if dim == skip:
+            continue
+        stored_state = session.get("irt_state", {}).get(dim)
+        if stored_state is not None:
+            states[dim] = stored_state
+        elif asked:
+            states[dim] = await rebuild_dimension_state(session["session_id"], dim, asked)
+    return states
+
+def dimension_finished(questions_asked: int, se: float, min_questions: int) -> bool:
+    """Stopping rule for one dimension"""
+    return (
+        se < IRT_CONFIG["se_threshold"] and
+        questions_asked >= min_questions
+    ) or questions_asked >= IRT_CONFIG["max_questions"]
+
+def estimate_all_dimensions(states: Dict[str, Dict[str, List]],
+                            initial_thetas: Dict[str, float]) -> Tuple[Dict[str, float], Dict[str, float], List[List[float]]]:
+    """Joint posterior over all five traits: per-dimension thetas, standard errors and covariance"""
+    dimensions = list(BIG_FIVE_DIMENSIONS.keys())
+    data = []
+    for dim in dimensions:
+        state = states.get(dim) or empty_dimension_state()
+        if IRT_CONFIG["model"] == MODEL_GRM:
+            thresholds = state.get("thresholds", [])
+            if len(thresholds) != len(state["responses"]):
+                thresholds = [default_thresholds(b) for b in state["difficulty"]]
+            params = np.asarray(thresholds, dtype=np.float64).reshape(len(thresholds), LIKERT_CATEGORIES - 1)
+        else:
+            params = np.asarray(state["difficulty"], dtype=np.float64)
+        data.append((
+            np.asarray(state["responses"], dtype=np.float64),
+            np.asarray(state["discrimination"], dtype=np.float64),
+            params
+        ))
+    
+    theta, covariance = MultidimensionalEngine.estimate(
+        data,
+        IRT_CONFIG["trait_correlations"],
+        model=IRT_CONFIG["model"],
+        initial_theta=[initial_thetas.get(dim, IRT_CONFIG["initial_theta"]) for dim in dimensions],
+        bounds=IRT_CONFIG["theta_bounds"]
+    )
+    thetas = {dim: float(theta[i]) for i, dim in enumerate(dimensions)}
+    ses = {dim: float(np.sqrt(covariance[i, i])) for i, dim in enumerate(dimensions)}
+    return thetas, ses, covariance.tolist()
+
+def select_multidimensional_question(session: Dict) -> Optional[Dict]:
+    """D-optimal next question across every unfinished dimension"""
+    dimensions = list(BIG_FIVE_DIMENSIONS.keys())
+    covariance = session.get("posterior_covariance") or IRT_CONFIG["trait_correlations"]
+    best_question = None
+    best_gain = -1.0
+    
+    for i, dim in enumerate(dimensions):
+        if dimension_finished(session["dimension_progress"][dim], session["standard_errors"][dim],
+                              IRT_CONFIG["min_questions_multidimensional"]):
+            continue
+        theta = session["theta_estimates"][dim]
+        question = item_bank.select_question(dim, theta, session["asked_questions"][dim])
+        if question is None:
+            continue
+        info = ItemParameters.from_questions([question], model=IRT_CONFIG["model"]).information(theta)[0]
+        gain = MultidimensionalEngine.d_optimal_gain(info, covariance[i][i])
+        if gain > best_gain:
+            best_gain = gain
+            best_question = question
+    
+    return best_question
+
+def multidimensional_answer(session: Dict, current_dim: str, state: Dict[str, List],
+                            question_id: str, other_states: Dict[str, Dict[str, List]]) -> Tuple[Dict, Dict]:
+    """Update the joint trait posterior after an answer and pick the next dimension
+    
+    other_states holds the other dimensions' running states (see stored_dimension_states).
+    Returns the session fields to $set and the response.
+    """
+    states = {**other_states, current_dim: state}
+    thetas, ses, covariance = estimate_all_dimensions(states, session["theta_estimates"])
+    answered_count = len(state["responses"])
+    
+    # Select against the session as it will be after this answer, leaving the fetched document untouched
+    answered_session = {
+        **session,
+        "theta_estimates": thetas,
+        "standard_errors": ses,
+        "posterior_covariance": covariance,
+        "dimension_progress": {**session["dimension_progress"], current_dim: answered_count},
+        "asked_questions": {**session["asked_questions"],
+                            current_dim: session["asked_questions"][current_dim] + [question_id]}
+    }
+    set_fields = {"theta_estimates": thetas, "standard_errors": ses, "posterior_covariance": covariance}
+    # States rebuilt from the answer log are stored, so each is rebuilt only once
+    stored_states = session.get("irt_state", {})
+    set_fields.update((f"irt_state.{dim}", other_states[dim]) for dim in other_states if dim not in stored_states)
+    
+    next_question = select_multidimensional_question(answered_session)
+    if next_question is None:
+        # Every dimension met its stopping rule (or ran out of questions)
+        set_fields["status"] = "completed"
+        set_fields["completed_at"] = datetime.utcnow()
+        return set_fields, {
+            "status": "test_completed",
+            "message": "تم إكمال جميع أبعاد الاختبار بنجاح!",
+            "total_questions": session["total_questions_asked"] + 1
+        }
+    
+    set_fields["current_dimension"] = next_question["dimension"]
+    return set_fields, {
+        "status": "continue",
+        "current_dimension": BIG_FIVE_DIMENSIONS[current_dim]["name"],
+        "next_dimension": BIG_FIVE_DIMENSIONS[next_question["dimension"]]["name"],
+        "theta_estimate": thetas[current_dim],
+        "standard_error": ses[current_dim],
+        "questions_asked": answered_count,
+        "precision": f"{(1-ses[current_dim])*100:.1f}%" if ses[current_dim] < 1 else "منخفضة"
+    }
+
+def sequential_answer(session: Dict, current_dim: str, state: Dict[str, List],
+                      question_id: str) -> Tuple[Dict, Dict]:
+    """Update the current dimension's estimate and apply its stopping rule
+    
+    Returns the session fields to $set and the response.
+    """
+    new_theta, se = estimate_dimension_theta(state, session["theta_estimates"][current_dim])
+    answered_count = len(state["responses"])
+    set_fields = {
+        f"theta_estimates.{current_dim}": new_theta,
+        f"standard_errors.{current_dim}": se
+    }
+    
+    # Check stopping criteria for current dimension
+    should_stop_dimension = (
+        dimension_finished(answered_count, se, IRT_CONFIG["min_questions"]) or
+        # A small bank (such as the seed bank) can run out before the stopping rule is met
+        item_bank.select_question(current_dim, new_theta,
+                                  session["asked_questions"][current_dim] + [question_id]) is None
+    )
+    
+    if not should_stop_dimension:
+        return set_fields, {
+            "status": "continue",
+            "current_dimension": BIG_FIVE_DIMENSIONS[current_dim]["name"],
+            "theta_estimate": new_theta,
+            "standard_error": se,
+            "questions_asked": answered_count,
+            "precision": f"{(1-se)*100:.1f}%" if se < 1 else "منخفضة"
+        }
+    
+    current_dim_index = session["dimension_order"].index(current_dim)
+    if current_dim_index < len(session["dimension_order"]) - 1:
+        # Move to next dimension
+        next_dim = session["dimension_order"][current_dim_index + 1]
+        set_fields["current_dimension"] = next_dim
+        return set_fields, {
+            "status": "dimension_completed",
+            "completed_dimension": BIG_FIVE_DIMENSIONS[current_dim]["name"],
+            "next_dimension": BIG_FIVE_DIMENSIONS[next_dim]["name"],
+            "theta_estimate": new_theta,
+            "standard_error": se,
+            "questions_asked": answered_count
+        }
+    
+    # All dimensions completed
+    set_fields["status"] = "completed"
+    set_fields["completed_at"] = datetime.utcnow()
+    return set_fields, {
+        "status": "test_completed",
+        "message": "تم إكمال جميع أبعاد الاختبار بنجاح!",
+        "total_questions": session["total_questions_asked"] + 1
+    }
+
+def answer_changes(stored_state: Optional[Dict[str, List]], state: Dict[str, List], current_dim: str,
+                   question_id: str, set_fields: Dict) -> Tuple[Dict, Dict, Dict]:
+    """$set / $push / $inc recording one answer
+    
+    asked_questions and the running IRT state grow by $push; the whole dimension state is
+    only written when it was rebuilt or back-filled rather than appended to.
+    """
+    set_fields = {**set_fields, f"dimension_progress.{current_dim}": len(state["responses"])}
+    push = {f"asked_questions.{current_dim}": question_id}
+    appended = stored_state is not None and all(
+        len(values) == len(stored_state.get(key, [])) + 1 for key, values in state.items()
+    )
+    if appended:
+        push.update({f"irt_state.{current_dim}.{key}": values[-1] for key, values in state.items()})
+    else:
+        set_fields[f"irt_state.{current_dim}"] = state
+    inc = {"total_questions_asked": 1, SESSION_VERSION_FIELD: 1}
+    return set_fields, push, inc
 
-# Generate AI questions with IRT parameters
 async def generate_questions_for_dimension(dimension: str, count: int = 20) -> List[Dict]:
     """Generate questions for a specific Big Five dimension using Gemini with IRT parameters"""
     try:
         dimension_info = BIG_FIVE_DIMENSIONS[dimension]
         
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=f"question_gen_{dimension}",
-            system_message="أنت خبير في علم النفس متخصص في إنشاء أسئلة اختبارات الشخصية باللغة العربية."
-        ).with_model("gemini", "gemini-2.0-flash")
+        chat = llm_client.chat(
+            f"question_gen_{dimension}",
+            "أنت خبير في علم النفس متخصص في إنشاء أسئلة اختبارات الشخصية باللغة العربية."
+        )
         
         prompt = f"""
 أنشئ {count} سؤال لقياس بُعد "{dimension_info['name']}" في نموذج الشخصية الخماسي.
@@ -228,11 +591,9 @@ async def generate_questions_for_dimension(dimension: str, count: int = 20) -> L
 }}
 """
         
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        response = await chat.send(prompt)
         
         # Parse JSON response
-        import json
         try:
             questions_data = json.loads(response)
             questions = []
@@ -256,8 +617,10 @@ async def generate_questions_for_dimension(dimension: str, count: int = 20) -> L
                     "reverse_scored": q.get("reverse_scored", False),
                     "discrimination": discrimination,
                     "difficulty": difficulty,
+                    "thresholds": default_thresholds(difficulty),
                     "difficulty_level": difficulty_level,
-                    "question_number": i + 1
+                    "question_number": i + 1,
+                    "source": SOURCE_GENERATED
                 })
             return questions
         except json.JSONDecodeError:
@@ -268,50 +631,116 @@ async def generate_questions_for_dimension(dimension: str, count: int = 20) -> L
         return []
 
 async def initialize_question_bank():
-    """Initialize question bank with IRT parameters if not exists"""
+    """Load the bundled seed bank into an empty questions collection so the app can serve at once"""
     try:
         # Check if questions already exist
         existing_count = await questions_collection.count_documents({})
         if existing_count > 0:
             return
         
-        print("Initializing question bank...")
-        all_questions = []
-        
-        for dimension in BIG_FIVE_DIMENSIONS.keys():
-            questions = await generate_questions_for_dimension(dimension, count=20)
-            all_questions.extend(questions)
+        with open(SEED_BANK_FILE, "r", encoding="utf-8") as f:
+            seed_questions = json.load(f)["questions"]
         
-        if all_questions:
-            await questions_collection.insert_many(all_questions)
-            print(f"Initialized {len(all_questions)} questions")
+        # Upserts keep concurrent workers from seeding twice
+        for q in seed_questions:
+            await questions_collection.update_one(
+                {"question_id": q["question_id"]}, {"$setOnInsert": {**q, "source": SOURCE_SEED}}, upsert=True
+            )
+        await ItemBankCache.bump_version()
+        print(f"Initialized question bank with {len(seed_questions)} seed questions")
     
     except Exception as e:
         print(f"Error initializing question bank: {e}")
 
+async def has_generated_questions(dimension: str) -> bool:
+    return await questions_collection.count_documents(
+        {"dimension": dimension, "source": {"$ne": SOURCE_SEED}, "retired": {"$ne": True}}, limit=1
+    ) > 0
+
+async def generate_question_bank(force: bool = False) -> int:
+    """Generate questions for every dimension still on the seed bank and swap them in
+    
+    Dimensions are generated concurrently, at most bank_generation_concurrency at a
+    time and each within bank_generation_timeout seconds.
+    """
+    dimensions = [dim for dim in BIG_FIVE_DIMENSIONS.keys()
+                  if force or not await has_generated_questions(dim)]
+    if not dimensions:
+        return 0
+    
+    semaphore = asyncio.Semaphore(IRT_CONFIG["bank_generation_concurrency"])
+    
+    async def generate(dimension: str) -> List[Dict]:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    generate_questions_for_dimension(dimension, count=IRT_CONFIG["questions_per_dimension"]),
+                    timeout=IRT_CONFIG["bank_generation_timeout"]
+                )
+            except asyncio.TimeoutError:
+                print(f"Question generation for {dimension} timed out")
+                return []
+    
+    results = await asyncio.gather(*[generate(dim) for dim in dimensions])
+    
+    added = 0
+    for dimension, questions in zip(dimensions, results):
+        if not questions:
+            continue
+        await questions_collection.insert_many(questions)
+        # Hot swap: earlier questions of the dimension are retired, not deleted, so sessions
+        # in progress can still submit and score them
+        await questions_collection.update_many(
+            {"dimension": dimension, "question_id": {"$nin": [q["question_id"] for q in questions]}},
+            {"$set": {"retired": True}}
+        )
+        added += len(questions)
+    
+    if added:
+        await ItemBankCache.bump_version()
+        await item_bank.load()
+        print(f"Generated {added} questions for {len(dimensions)} dimensions")
+    return added
+
+async def run_bank_generation(force: bool = False):
+    """Generate the bank unless another process already is (claimed through the metadata collection)"""
+    stale_before = datetime.utcnow() - timedelta(seconds=IRT_CONFIG["bank_generation_timeout"] * len(BIG_FIVE_DIMENSIONS))
+    await metadata_collection.delete_one({"_id": BANK_GENERATION_LOCK, "started_at": {"$lt": stale_before}})
+    try:
+        await metadata_collection.insert_one({"_id": BANK_GENERATION_LOCK, "started_at": datetime.utcnow()})
+    except DuplicateKeyError:
+        print("Question bank generation already running in another process")
+        return
+    
+    try:
+        await generate_question_bank(force=force)
+    except Exception as e:
+        print(f"Error generating question bank: {e}")
+    finally:
+        await metadata_collection.delete_one({"_id": BANK_GENERATION_LOCK})
+
 # Generate personality report using Gemini
 async def generate_personality_report(session_id: str, scores: Dict, 
-                                    total_questions: int, precision: Dict) -> Dict:
-    """Generate detailed personality report using Gemini"""
-    try:
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=f"report_gen_{session_id}",
-            system_message="أنت خبير في علم النفس متخصص في تحليل الشخصية وكتابة التقارير النفسية باللغة العربية."
-        ).with_model("gemini", "gemini-2.0-flash")
-        
-        # Format scores for the prompt
-        scores_text = ""
-        precision_text = ""
-        for dim, score_data in scores.items():
-            dim_name = BIG_FIVE_DIMENSIONS[dim]["name"]
-            theta = score_data["theta"]
-            level = score_data["level"]
-            se = precision.get(dim, 0)
-            scores_text += f"- {dim_name}: {theta:.2f} ({level})\n"
-            precision_text += f"- {dim_name}: دقة القياس {(1-se)*100:.1f}%\n"
-        
-        prompt = f"""
+                                    total_questions: int, precision: Dict,
+                                    on_text: Optional[Callable[[str], None]] = None) -> Dict:
+    """Generate detailed personality report through the LLM client, streaming the analysis to on_text"""
+    chat = llm_client.chat(
+        f"report_gen_{session_id}",
+        "أنت خبير في علم النفس متخصص في تحليل الشخصية وكتابة التقارير النفسية باللغة العربية."
+    )
+    
+    # Format scores for the prompt
+    scores_text = ""
+    precision_text = ""
+    for dim, score_data in scores.items():
+        dim_name = BIG_FIVE_DIMENSIONS[dim]["name"]
+        theta = score_data["theta"]
+        level = score_data["level"]
+        se = precision.get(dim, 0)
+        scores_text += f"- {dim_name}: {theta:.2f} ({level})\n"
+        precision_text += f"- {dim_name}: دقة القياس {(1-se)*100:.1f}%\n"
+    
+    prompt = f"""
 بناءً على نتائج اختبار الشخصية التكيفي المتقدم باستخدام نظرية الاستجابة للمفردة (IRT):
 
 نتائج الشخصية:
@@ -333,12 +762,15 @@ async def generate_personality_report(session_id: str, scores: Dict,
 اكتب التقرير بأسلوب علمي مبسط وودود، مع التأكيد على دقة النتائج بفضل التقنية المتقدمة المستخدمة.
 يجب أن يكون التقرير شاملاً (على الأقل 600 كلمة) ومقسماً إلى أقسام واضحة.
 """
-        
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
-        
-        # Generate recommendations
-        recommendations_prompt = """
+    
+    response = ""
+    async for chunk in chat.stream(prompt):
+        response += chunk
+        if on_text is not None:
+            on_text(chunk)
+    
+    # Generate recommendations
+    recommendations_prompt = """
 بناءً على تحليل الشخصية المتقدم، اقترح 8-12 توصية عملية ومحددة للتطوير الشخصي.
 ركز على:
 - توصيات قابلة للقياس والتطبيق
@@ -348,32 +780,154 @@ async def generate_personality_report(session_id: str, scores: Dict,
 
 أرجع النتيجة كقائمة نقاط فقط، كل نقطة في سطر منفصل تبدأ بـ "-"
 """
+    
+    recommendations_response = await chat.send(recommendations_prompt)
+    
+    # Parse recommendations
+    recommendations = []
+    for line in recommendations_response.split('\n'):
+        if line.strip().startswith('-'):
+            recommendations.append(line.strip()[1:].strip())
+    
+    return {
+        "detailed_analysis": response,
+        "recommendations": recommendations
+    }
+
+REPORT_FALLBACK = {
+    "detailed_analysis": "حدث خطأ في إنشاء التقرير المفصل.",
+    "recommendations": ["حاول إعادة إجراء الاختبار مرة أخرى."]
+}
+
+def report_scoring_version() -> str:
+    """Cache key that changes with the report logic, the IRT model or the active calibration"""
+    return f"v{IRT_CONFIG['report_version']}:{IRT_CONFIG['model']}:params-{item_bank.parameters_version or 'default'}"
+
+def score_personality_session(session: Dict) -> Tuple[Dict, Dict]:
+    """Per-dimension report scores and measurement precision of a completed session"""
+    dimension_scores = {}
+    measurement_precision = {}
+    
+    for dimension in BIG_FIVE_DIMENSIONS.keys():
+        theta = session["theta_estimates"][dimension]
+        se = session["standard_errors"][dimension]
         
-        rec_message = UserMessage(text=recommendations_prompt)
-        recommendations_response = await chat.send_message(rec_message)
+        # Convert theta to interpretable scale (0-100)
+        # Theta typically ranges from -3 to +3, convert to 0-100 scale
+        percentile_score = norm.cdf(theta) * 100
         
-        # Parse recommendations
-        recommendations = []
-        for line in recommendations_response.split('\n'):
-            if line.strip().startswith('-'):
-                recommendations.append(line.strip()[1:].strip())
+        # Determine level
+        if percentile_score <= 25:
+            level = "منخفض"
+        elif percentile_score <= 75:
+            level = "متوسط"
+        else:
+            level = "مرتفع"
         
-        return {
-            "detailed_analysis": response,
-            "recommendations": recommendations
+        dimension_scores[dimension] = {
+            "theta": theta,
+            "percentile": percentile_score,
+            "level": level,
+            "name": BIG_FIVE_DIMENSIONS[dimension]["name"],
+            "questions_asked": session["dimension_progress"][dimension]
         }
         
+        measurement_precision[dimension] = se
+    
+    return dimension_scores, measurement_precision
+
+def assemble_report(session: Dict, dimension_scores: Dict, measurement_precision: Dict, report_data: Dict) -> Dict:
+    return {
+        "session_id": session["session_id"],
+        "name": session["name"],
+        "scores": dimension_scores,
+        "detailed_analysis": report_data["detailed_analysis"],
+        "recommendations": report_data["recommendations"],
+        "completion_date": session.get("completed_at", datetime.utcnow()).isoformat(),
+        "total_questions_asked": session["total_questions_asked"],
+        "measurement_precision": measurement_precision
+    }
+
+async def run_report_job(job) -> Dict:
+    """Job queue handler: score the session, stream the LLM text into the job and store the report"""
+    session = await session_store.get(job.session_id, fields=SESSION_REPORT_FIELDS)
+    if not session or session["status"] != "completed":
+        raise ValueError("session is not completed")
+    
+    dimension_scores, measurement_precision = score_personality_session(session)
+    report_data = await generate_personality_report(
+        job.session_id,
+        dimension_scores,
+        session["total_questions_asked"],
+        measurement_precision,
+        on_text=job.append_text
+    )
+    report = assemble_report(session, dimension_scores, measurement_precision, report_data)
+    
+    # One document per session: a newer scoring version replaces the stale report
+    await reports_collection.replace_one(
+        {"session_id": job.session_id},
+        {
+            "session_id": job.session_id,
+            "scoring_version": job.version,
+            "report": report,
+            "generated_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+    return report
+
+llm_client = create_llm_client()
+report_jobs = ReportJobQueue(run_report_job,
+                             concurrency=IRT_CONFIG["report_workers"],
+                             max_attempts=IRT_CONFIG["report_max_attempts"],
+                             retry_delay=IRT_CONFIG["report_retry_delay"])
+
+def start_report_job(session_id: str):
+    """Start generating the report as soon as a session completes"""
+    return report_jobs.submit(session_id, report_scoring_version())
+
+async def find_cached_report(session_id: str) -> Optional[Dict]:
+    cached = await reports_collection.find_one(
+        {"session_id": session_id, "scoring_version": report_scoring_version()}, {"_id": 0, "report": 1}
+    )
+    return cached["report"] if cached else None
+
+async def cached_personality_report(session: Dict) -> Dict:
+    """Stored report, or the result of its (possibly already running) generation job"""
+    cached = await find_cached_report(session["session_id"])
+    if cached:
+        return cached
+    
+    job = start_report_job(session["session_id"])
+    try:
+        return await job.result()
     except Exception as e:
+        # Not stored, so the next view queues a new attempt
         print(f"Error generating report: {e}")
-        return {
-            "detailed_analysis": "حدث خطأ في إنشاء التقرير المفصل.",
-            "recommendations": ["حاول إعادة إجراء الاختبار مرة أخرى."]
-        }
+        dimension_scores, measurement_precision = score_personality_session(session)
+        return assemble_report(session, dimension_scores, measurement_precision, REPORT_FALLBACK)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize application on startup"""
+    await session_store.ensure_indexes()
+    await ensure_collection_indexes(db)
+    report_jobs.start()
     await initialize_question_bank()
+    await item_bank.load()
+    asyncio.create_task(item_bank.watch())
+    
+    # Serve the seed bank right away; the generated bank is hot-swapped in when ready
+    if IRT_CONFIG["bank_generation"] == "blocking":
+        await run_bank_generation()
+    elif IRT_CONFIG["bank_generation"] == "background":
+        app.state.bank_generation = asyncio.create_task(run_bank_generation())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await report_jobs.stop()
+    await session_store.close()
 
 @app.post("/api/sessions", response_model=SessionResponse)
 async def create_session(session_data: SessionCreate):
@@ -394,10 +948,15 @@ async def create_session(session_data: SessionCreate):
             "theta_estimates": {dim: IRT_CONFIG["initial_theta"] for dim in BIG_FIVE_DIMENSIONS.keys()},
             "standard_errors": {dim: float('inf') for dim in BIG_FIVE_DIMENSIONS.keys()},
             "asked_questions": {dim: [] for dim in BIG_FIVE_DIMENSIONS.keys()},
-            "total_questions_asked": 0
+            "irt_state": {dim: empty_dimension_state() for dim in BIG_FIVE_DIMENSIONS.keys()},
+            "total_questions_asked": 0,
+            "cat_mode": IRT_CONFIG["cat_mode"],
+            SESSION_VERSION_FIELD: 0
         }
+        if session["cat_mode"] == CAT_MULTIDIMENSIONAL:
+            session["posterior_covariance"] = IRT_CONFIG["trait_correlations"]
         
-        await sessions_collection.insert_one(session)
+        await session_store.put(session)
         
         return SessionResponse(
             session_id=session_id,
@@ -412,12 +971,24 @@ async def create_session(session_data: SessionCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في إنشاء الجلسة: {str(e)}")
 
+def question_response(question: Dict, question_number: int) -> Question:
+    return Question(
+        question_id=question["question_id"],
+        text=question["text"],
+        dimension=question["dimension"],
+        question_number=question_number,
+        reverse_scored=question.get("reverse_scored", False),
+        discrimination=question.get("discrimination", 1.0),
+        difficulty=question.get("difficulty", 0.0),
+        thresholds=item_thresholds(question)
+    )
+
 @app.get("/api/sessions/{session_id}/question", response_model=Question)
 async def get_current_question(session_id: str):
     """Get the next adaptive question for current dimension"""
     try:
         # Get session
-        session = await sessions_collection.find_one({"session_id": session_id})
+        session = await session_store.get(session_id, fields=SESSION_QUESTION_FIELDS)
         if not session:
             raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
         
@@ -428,32 +999,17 @@ async def get_current_question(session_id: str):
         current_theta = session["theta_estimates"][current_dim]
         asked_questions = session["asked_questions"][current_dim]
         
-        # Get available questions for current dimension
-        available_questions = []
-        async for q in questions_collection.find({
-            "dimension": current_dim,
-            "question_id": {"$nin": asked_questions}
-        }):
-            available_questions.append(q)
+        # Select most informative unasked question using the precomputed IRT index
+        if session.get("cat_mode") == CAT_MULTIDIMENSIONAL:
+            next_question = select_multidimensional_question(session)
+            current_dim = next_question["dimension"] if next_question else current_dim
+        else:
+            next_question = item_bank.select_question(current_dim, current_theta, asked_questions)
         
-        if not available_questions:
+        if not next_question:
             raise HTTPException(status_code=400, detail="لا توجد أسئلة متاحة لهذا البُعد")
         
-        # Select most informative question using IRT
-        next_question = IRTEngine.select_next_question(available_questions, current_theta)
-        
-        if not next_question:
-            raise HTTPException(status_code=400, detail="لا يمكن اختيار السؤال التالي")
-        
-        return Question(
-            question_id=next_question["question_id"],
-            text=next_question["text"],
-            dimension=next_question["dimension"],
-            question_number=session["dimension_progress"][current_dim] + 1,
-            reverse_scored=next_question.get("reverse_scored", False),
-            discrimination=next_question.get("discrimination", 1.0),
-            difficulty=next_question.get("difficulty", 0.0)
-        )
+        return question_response(next_question, session["dimension_progress"][current_dim] + 1)
         
     except HTTPException:
         raise
@@ -462,204 +1018,355 @@ async def get_current_question(session_id: str):
 
 @app.post("/api/answers")
 async def submit_answer(answer_data: AnswerSubmit):
-    """Submit answer and update IRT estimates"""
+    """Submit answer and update IRT estimates
+    
+    The answer is logged first, keyed on (session_id, question_id), and the session is then
+    changed by one update conditioned on its version, so a retried or concurrent submit of
+    the same answer is counted once and the session never gets ahead of the answer log.
+    """
     try:
         # Validate answer range
         if not 1 <= answer_data.answer <= 5:
             raise HTTPException(status_code=400, detail="الإجابة يجب أن تكون بين 1 و 5")
         
-        # Get session
-        session = await sessions_collection.find_one({"session_id": answer_data.session_id})
+        # Get question details
+        question = await item_bank.fetch(answer_data.question_id)
+        if not question:
+            raise HTTPException(status_code=404, detail="السؤال غير موجود")
+        
+        current_dim = question["dimension"]
+        answer_value = answer_data.answer
+        
+        for _ in range(IRT_CONFIG["answer_write_attempts"]):
+            # Get session
+            session = await session_store.get(answer_data.session_id)
+            if not session:
+                raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
+            # Taken now: the memory store hands out its live document, which later writes change in place
+            version = session.get(SESSION_VERSION_FIELD)
+            if session["status"] == "completed":
+                raise HTTPException(status_code=400, detail="الاختبار مكتمل بالفعل")
+            if answer_data.question_id in session["asked_questions"].get(current_dim, []):
+                raise HTTPException(status_code=400, detail="تمت الإجابة على هذا السؤال بالفعل")
+            if session.get("cat_mode") != CAT_MULTIDIMENSIONAL and current_dim != session["current_dimension"]:
+                # Sequential mode answers one trait at a time, in the session's dimension order
+                raise HTTPException(status_code=400, detail="السؤال لا ينتمي إلى البُعد الحالي")
+            
+            # Running IRT state for the dimension; older sessions are rebuilt from their answers once
+            stored_state = session.get("irt_state", {}).get(current_dim)
+            if stored_state is None:
+                state = await rebuild_dimension_state(answer_data.session_id, current_dim,
+                                                      session["asked_questions"].get(current_dim, []))
+            else:
+                state = {key: list(values) for key, values in stored_state.items()}
+            
+            # Append the new response to the running state
+            append_to_dimension_state(state, question, answer_value)
+            
+            if session.get("cat_mode") == CAT_MULTIDIMENSIONAL:
+                other_states = await stored_dimension_states(session, skip=current_dim)
+                set_fields, result = multidimensional_answer(session, current_dim, state, answer_data.question_id,
+                                                             other_states)
+            else:
+                set_fields, result = sequential_answer(session, current_dim, state, answer_data.question_id)
+            
+            set_fields, push, inc = answer_changes(stored_state, state, current_dim,
+                                                   answer_data.question_id, set_fields)
+            
+            # Log the answer before the session counts it; an answer logged by an earlier
+            # attempt wins, and the session is worked out again with its value
+            logged = (await session_store.record_answers([{
+                "session_id": answer_data.session_id,
+                "question_id": answer_data.question_id,
+                "answer": answer_value,
+                "dimension": current_dim,
+                "response_time": answer_data.response_time,
+                "answered_at": datetime.utcnow()
+            }]))[0]
+            if logged["answer"] != answer_value:
+                answer_value = logged["answer"]
+                continue
+            
+            updated = await session_store.update(
+                answer_data.session_id, set_fields=set_fields, push=push, inc=inc,
+                expected={SESSION_VERSION_FIELD: version},
+                fields=SESSION_STATUS_FIELDS
+            )
+            if updated is None:
+                # Another write got in first; re-read and validate against the newer session
+                continue
+            
+            if result["status"] == "test_completed":
+                start_report_job(answer_data.session_id)
+            return result
+        
+        raise HTTPException(status_code=409, detail="تم تعديل الجلسة بطلب آخر، يرجى إعادة المحاولة")
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في معالجة الإجابة: {str(e)}")
+
+@app.post("/api/answers/batch")
+async def submit_answer_batch(batch: AnswerBatchSubmit):
+    """Submit several answers at once; IRT estimates are updated once per dimension"""
+    try:
+        if not batch.answers:
+            raise HTTPException(status_code=400, detail="لا توجد إجابات")
+        if any(not 1 <= item.answer <= 5 for item in batch.answers):
+            raise HTTPException(status_code=400, detail="الإجابة يجب أن تكون بين 1 و 5")
+        
+        session = await session_store.get(batch.session_id)
         if not session:
             raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
+        # Taken now: the memory store hands out its live document, which later writes change in place
+        version = session.get(SESSION_VERSION_FIELD)
+        if session["status"] == "completed":
+            raise HTTPException(status_code=400, detail="الاختبار مكتمل بالفعل")
+        stored_session = session
         
-        # Get question details
-        question = await questions_collection.find_one({"question_id": answer_data.question_id})
-        if not question:
+        # Validate the whole batch before anything is written
+        questions = [await item_bank.fetch(item.question_id) for item in batch.answers]
+        if any(question is None for question in questions):
             raise HTTPException(status_code=404, detail="السؤال غير موجود")
+        question_ids = [item.question_id for item in batch.answers]
+        already_asked = {qid for asked in stored_session["asked_questions"].values() for qid in asked}
+        if len(set(question_ids)) != len(question_ids) or already_asked.intersection(question_ids):
+            raise HTTPException(status_code=400, detail="تمت الإجابة على هذا السؤال بالفعل")
         
-        # Store answer
-        answer_doc = {
-            "session_id": answer_data.session_id,
-            "question_id": answer_data.question_id,
-            "answer": answer_data.answer,
-            "dimension": question["dimension"],
-            "response_time": answer_data.response_time,
-            "answered_at": datetime.utcnow()
-        }
-        await answers_collection.insert_one(answer_doc)
+        multidimensional = stored_session.get("cat_mode") == CAT_MULTIDIMENSIONAL
+        min_questions = IRT_CONFIG["min_questions_multidimensional" if multidimensional else "min_questions"]
+        # The joint estimate needs every dimension's state, not only those answered in this batch
+        other_states = await stored_dimension_states(stored_session) if multidimensional else {}
         
-        # Update IRT estimates
-        current_dim = question["dimension"]
+        def refresh_estimates(dim):
+            if multidimensional:
+                thetas, ses, covariance = estimate_all_dimensions({**other_states, **states},
+                                                                  session["theta_estimates"])
+                session.update(theta_estimates=thetas, standard_errors=ses, posterior_covariance=covariance)
+                stale.clear()
+            else:
+                theta, se = estimate_dimension_theta(states[dim], session["theta_estimates"][dim])
+                session["theta_estimates"][dim] = theta
+                session["standard_errors"][dim] = se
+                stale.discard(dim)
         
-        # Get all answers for current dimension
-        responses = []
-        async for ans in answers_collection.find({
-            "session_id": answer_data.session_id,
-            "dimension": current_dim
-        }):
-            ans_question = await questions_collection.find_one({"question_id": ans["question_id"]})
-            if ans_question:
-                response_value = ans["answer"]
-                # Handle reverse scoring
-                if ans_question.get("reverse_scored", False):
-                    response_value = 6 - response_value
-                
-                responses.append((
-                    response_value,
-                    ans_question.get("discrimination", 1.0),
-                    ans_question.get("difficulty", 0.0)
-                ))
-        
-        # Update theta estimate using IRT
-        new_theta, se = IRTEngine.estimate_theta(responses, session["theta_estimates"][current_dim])
-        
-        # Update session
-        update_data = {
-            f"theta_estimates.{current_dim}": new_theta,
-            f"standard_errors.{current_dim}": se,
-            f"dimension_progress.{current_dim}": len(responses),
-            "total_questions_asked": session["total_questions_asked"] + 1
-        }
+        def sequential_dimension_done(dim):
+            # As sequential_answer decides it: the stopping rule is met or the bank has nothing left
+            if dim in stale:
+                refresh_estimates(dim)
+            answered_count = len(states[dim]["responses"]) if dim in states else session["dimension_progress"][dim]
+            return (dimension_finished(answered_count, session["standard_errors"][dim], min_questions) or
+                    item_bank.select_question(dim, session["theta_estimates"][dim], asked_questions[dim]) is None)
         
-        # Add question to asked list
-        asked_questions = session["asked_questions"][current_dim] + [answer_data.question_id]
-        update_data[f"asked_questions.{current_dim}"] = asked_questions
-        
-        # Check stopping criteria for current dimension
-        should_stop_dimension = (
-            se < IRT_CONFIG["se_threshold"] and 
-            len(responses) >= IRT_CONFIG["min_questions"]
-        ) or len(responses) >= IRT_CONFIG["max_questions"]
-        
-        if should_stop_dimension:
-            # Move to next dimension
-            current_dim_index = session["dimension_order"].index(current_dim)
-            if current_dim_index < len(session["dimension_order"]) - 1:
-                # Move to next dimension
-                next_dim = session["dimension_order"][current_dim_index + 1]
-                update_data["current_dimension"] = next_dim
+        # Answer values as logged: a question an earlier attempt already logged keeps that
+        # answer, and the batch is worked out again with it
+        answer_values = [item.answer for item in batch.answers]
+        while True:
+            # Worked on as a copy: the write below only lands if no other answer changed the session meanwhile
+            session = {**stored_session, **{field: dict(stored_session[field]) for field in
+                                            ("dimension_progress", "theta_estimates", "standard_errors")}}
+            
+            # Append every answer to a copy of its dimension's running state, in order
+            states = {}
+            stale = set()  # Dimensions whose estimate does not include their latest answers yet
+            asked_questions = {dim: list(asked) for dim, asked in session["asked_questions"].items()}
+            answer_docs = []
+            answered_at = datetime.utcnow()
+            current_dim = session["current_dimension"]
+            order = session["dimension_order"]
+            for item, question, value in zip(batch.answers, questions, answer_values):
+                dim = question["dimension"]
+                if not multidimensional:
+                    # Answers follow the dimension order, as in submit_answer: the batch only
+                    # moves on to the next trait once the current one is finished
+                    while (dim != current_dim and current_dim != order[-1] and
+                           sequential_dimension_done(current_dim)):
+                        current_dim = order[order.index(current_dim) + 1]
+                    if dim != current_dim:
+                        raise HTTPException(status_code=400, detail="السؤال لا ينتمي إلى البُعد الحالي")
+                if dim not in states:
+                    stored_state = other_states.get(dim, session.get("irt_state", {}).get(dim))
+                    if stored_state is None:
+                        states[dim] = await rebuild_dimension_state(batch.session_id, dim,
+                                                                    session["asked_questions"][dim])
+                    else:
+                        states[dim] = {key: list(values) for key, values in stored_state.items()}
                 
-                await sessions_collection.update_one(
-                    {"session_id": answer_data.session_id},
-                    {"$set": update_data}
-                )
+                # The stopping rule holds per answer, as in submit_answer
+                answered_count = len(states[dim]["responses"])
+                if dim in stale and answered_count >= min_questions:
+                    refresh_estimates(dim)
+                if dimension_finished(answered_count, session["standard_errors"][dim], min_questions):
+                    raise HTTPException(status_code=400, detail="تم إكمال هذا البُعد بالفعل")
                 
-                return {
-                    "status": "dimension_completed",
-                    "completed_dimension": BIG_FIVE_DIMENSIONS[current_dim]["name"],
-                    "next_dimension": BIG_FIVE_DIMENSIONS[next_dim]["name"],
-                    "theta_estimate": new_theta,
-                    "standard_error": se,
-                    "questions_asked": len(responses)
-                }
+                append_to_dimension_state(states[dim], question, value)
+                stale.add(dim)
+                asked_questions[dim].append(item.question_id)
+                answer_docs.append({
+                    "session_id": batch.session_id,
+                    "question_id": item.question_id,
+                    "answer": value,
+                    "dimension": dim,
+                    "response_time": item.response_time,
+                    "answered_at": answered_at
+                })
+            
+            update_data = {"total_questions_asked": session["total_questions_asked"] + len(batch.answers)}
+            for dim, state in states.items():
+                session["dimension_progress"][dim] = len(state["responses"])
+                update_data[f"dimension_progress.{dim}"] = len(state["responses"])
+                update_data[f"irt_state.{dim}"] = state
+                update_data[f"asked_questions.{dim}"] = asked_questions[dim]
+            session["asked_questions"] = asked_questions
+            
+            # Bring the estimates up to date (one joint estimate in multidimensional mode)
+            for dim in list(stale):
+                if dim in stale:
+                    refresh_estimates(dim)
+            if multidimensional:
+                update_data.update(theta_estimates=session["theta_estimates"], standard_errors=session["standard_errors"],
+                                   posterior_covariance=session["posterior_covariance"])
+                update_data.update((f"irt_state.{dim}", state) for dim, state in other_states.items()
+                                   if dim not in states and dim not in session.get("irt_state", {}))
+                next_question = select_multidimensional_question(session)
             else:
-                # All dimensions completed
-                update_data["status"] = "completed"
-                update_data["completed_at"] = datetime.utcnow()
-                
-                await sessions_collection.update_one(
-                    {"session_id": answer_data.session_id},
-                    {"$set": update_data}
-                )
+                for dim in states:
+                    update_data[f"theta_estimates.{dim}"] = session["theta_estimates"][dim]
+                    update_data[f"standard_errors.{dim}"] = session["standard_errors"][dim]
                 
-                return {
-                    "status": "test_completed",
-                    "message": "تم إكمال جميع أبعاد الاختبار بنجاح!",
-                    "total_questions": session["total_questions_asked"] + 1
-                }
-        else:
-            # Continue with current dimension
-            await sessions_collection.update_one(
-                {"session_id": answer_data.session_id},
-                {"$set": update_data}
-            )
+                # Continue with the first unfinished dimension from the current one onwards
+                next_question = None
+                for dim in order[order.index(current_dim):]:
+                    if dimension_finished(session["dimension_progress"][dim], session["standard_errors"][dim],
+                                          IRT_CONFIG["min_questions"]):
+                        continue
+                    next_question = item_bank.select_question(dim, session["theta_estimates"][dim],
+                                                              asked_questions[dim])
+                    if next_question is not None:
+                        break
             
-            return {
-                "status": "continue",
-                "current_dimension": BIG_FIVE_DIMENSIONS[current_dim]["name"],
-                "theta_estimate": new_theta,
-                "standard_error": se,
-                "questions_asked": len(responses),
-                "precision": f"{(1-se)*100:.1f}%" if se < 1 else "منخفضة"
-            }
+            if next_question is None:
+                update_data["status"] = "completed"
+                update_data["completed_at"] = datetime.utcnow()
+            else:
+                update_data["current_dimension"] = next_question["dimension"]
             
+            # Log the answers before the session counts them
+            logged = [answer["answer"] for answer in await session_store.record_answers(answer_docs)]
+            if logged == answer_values:
+                break
+            answer_values = logged
+        
+        updated = await session_store.update(
+            batch.session_id, set_fields=update_data, inc={SESSION_VERSION_FIELD: 1},
+            expected={SESSION_VERSION_FIELD: version}, fields=SESSION_STATUS_FIELDS
+        )
+        if updated is None:
+            raise HTTPException(status_code=409, detail="تم تعديل الجلسة بطلب آخر، يرجى إعادة المحاولة")
+        if next_question is None:
+            start_report_job(batch.session_id)
+        
+        result = {
+            "status": "test_completed" if next_question is None else "continue",
+            "answers_accepted": len(batch.answers),
+            "total_questions": update_data["total_questions_asked"],
+            "theta_estimates": {dim: session["theta_estimates"][dim] for dim in states},
+            "standard_errors": {dim: session["standard_errors"][dim] for dim in states},
+            "next_question": None
+        }
+        if next_question is None:
+            result["message"] = "تم إكمال جميع أبعاد الاختبار بنجاح!"
+        else:
+            next_dim = next_question["dimension"]
+            result["current_dimension"] = BIG_FIVE_DIMENSIONS[next_dim]["name"]
+            result["next_question"] = question_response(next_question, session["dimension_progress"][next_dim] + 1)
+        return result
+        
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"خطأ في معالجة الإجابة: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"خطأ في معالجة الإجابات: {str(e)}")
 
 @app.get("/api/sessions/{session_id}/report", response_model=PersonalityReport)
 async def get_personality_report(session_id: str):
     """Generate comprehensive personality report using IRT results"""
     try:
         # Get session
-        session = await sessions_collection.find_one({"session_id": session_id})
+        session = await session_store.get(session_id, fields=SESSION_REPORT_FIELDS)
         if not session:
             raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
         
         if session["status"] != "completed":
             raise HTTPException(status_code=400, detail="لم يتم إكمال الاختبار بعد")
         
-        # Prepare scores with IRT estimates
-        dimension_scores = {}
-        measurement_precision = {}
+        # Served from the report cache; generated once per scoring version
+        return PersonalityReport(**await cached_personality_report(session))
         
-        for dimension in BIG_FIVE_DIMENSIONS.keys():
-            theta = session["theta_estimates"][dimension]
-            se = session["standard_errors"][dimension]
-            
-            # Convert theta to interpretable scale (0-100)
-            # Theta typically ranges from -3 to +3, convert to 0-100 scale
-            percentile_score = norm.cdf(theta) * 100
-            
-            # Determine level
-            if percentile_score <= 25:
-                level = "منخفض"
-            elif percentile_score <= 75:
-                level = "متوسط"
-            else:
-                level = "مرتفع"
-            
-            dimension_scores[dimension] = {
-                "theta": theta,
-                "percentile": percentile_score,
-                "level": level,
-                "name": BIG_FIVE_DIMENSIONS[dimension]["name"],
-                "questions_asked": session["dimension_progress"][dimension]
-            }
-            
-            measurement_precision[dimension] = se
-        
-        # Generate AI report
-        report_data = await generate_personality_report(
-            session_id, 
-            dimension_scores, 
-            session["total_questions_asked"],
-            measurement_precision
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في إنشاء التقرير: {str(e)}")
+
+@app.get("/api/sessions/{session_id}/report/status")
+async def get_report_status(session_id: str):
+    """Progress of the background report generation"""
+    try:
+        if await find_cached_report(session_id):
+            return {"session_id": session_id, "status": "completed", "cached": True}
         
-        return PersonalityReport(
-            session_id=session_id,
-            name=session["name"],
-            scores=dimension_scores,
-            detailed_analysis=report_data["detailed_analysis"],
-            recommendations=report_data["recommendations"],
-            completion_date=session.get("completed_at", datetime.utcnow()).isoformat(),
-            total_questions_asked=session["total_questions_asked"],
-            measurement_precision=measurement_precision
-        )
+        job = report_jobs.get(session_id)
+        if job is None:
+            session = await session_store.get(session_id, fields=SESSION_STATUS_FIELDS)
+            if not session:
+                raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
+            if session["status"] != "completed":
+                return {"session_id": session_id, "status": "not_started", "cached": False}
+            job = start_report_job(session_id)
+        
+        return {**job.to_dict(), "cached": False}
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"خطأ في إنشاء التقرير: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"خطأ في استرجاع حالة التقرير: {str(e)}")
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.get("/api/sessions/{session_id}/report/stream")
+async def stream_report(session_id: str):
+    """Server-sent events: status changes, partial analysis text, then the finished report"""
+    try:
+        session = await session_store.get(session_id, fields=SESSION_STATUS_FIELDS)
+        if not session:
+            raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
+        if session["status"] != "completed":
+            raise HTTPException(status_code=400, detail="لم يتم إكمال الاختبار بعد")
+        
+        cached = await find_cached_report(session_id)
+        
+        async def events():
+            if cached:
+                yield sse_event("done", cached)
+                return
+            job = start_report_job(session_id)
+            async for event, data in job.events():
+                yield sse_event(event, data)
+        
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في بث التقرير: {str(e)}")
 
 @app.get("/api/sessions/{session_id}/progress")
 async def get_session_progress(session_id: str):
     """Get detailed session progress"""
     try:
-        session = await sessions_collection.find_one({"session_id": session_id})
+        session = await session_store.get(session_id, fields=SESSION_PROGRESS_FIELDS)
         if not session:
             raise HTTPException(status_code=404, detail="الجلسة غير موجودة")
         
@@ -699,5 +1406,13 @@ async def health_check():
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if "--generate-bank" in sys.argv:
+        # Out-of-band generation: python irt_personality_test.py --generate-bank [--force]
+        async def generate_out_of_band():
+            await initialize_question_bank()
+            await item_bank.load()
+            await run_bank_generation(force="--force" in sys.argv)
+        asyncio.run(generate_out_of_band())
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""LLM chat clients used for report (and question) generation.
+
+Handlers talk to the LLMClient interface only. GeminiClient wraps the
+emergentintegrations chat (an optional dependency, imported on first use);
+StubLLMClient returns canned replies locally so tests and load runs need no
+API key or network.
+
+Pick one with create_llm_client() or the LLM_CLIENT environment variable
+("gemini" or "stub"). Without the emergentintegrations package or a
+GEMINI_API_KEY the gemini client falls back to the stub, since every call
+would fail anyway.
+"""
+import asyncio
+import importlib.util
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Optional
+
+CLIENT_GEMINI = "gemini"
+CLIENT_STUB = "stub"
+DEFAULT_GEMINI_MODEL = "gemini-2.0-flash"
+
+
+class LLMChat(ABC):
+    """One conversation; later messages see the earlier ones"""
+
+    @abstractmethod
+    def stream(self, text: str) -> AsyncIterator[str]:
+        """Send a message and yield the reply in chunks"""
+
+    async def send(self, text: str) -> str:
+        """Send a message and return the whole reply"""
+        return "".join([chunk async for chunk in self.stream(text)])
+
+
+class LLMClient(ABC):
+    @abstractmethod
+    def chat(self, session_id: str, system_message: str) -> LLMChat:
+        """Start a conversation"""
+
+
+class GeminiChat(LLMChat):
+    def __init__(self, api_key: str, session_id: str, system_message: str, model: str):
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+        self._chat = LlmChat(
+            api_key=api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model("gemini", model)
+        self._message = UserMessage
+
+    async def stream(self, text):
+        # The integration returns whole replies, so each reply is a single chunk
+        yield await self._chat.send_message(self._message(text=text))
+
+
+class GeminiClient(LLMClient):
+    def __init__(self, api_key: Optional[str], model: str = DEFAULT_GEMINI_MODEL):
+        self.api_key = api_key
+        self.model = model
+
+    def chat(self, session_id, system_message):
+        return GeminiChat(self.api_key, session_id, system_message, self.model)
+
+
+STUB_REPLIES = [
+    "تحليل شخصيتك يُظهر توازناً جيداً في معظم الأبعاد.\n\n"
+    "أنت شخص منفتح على التجارب الجديدة ولديك مستوى جيد من التنظيم والانضباط.\n\n"
+    "تتمتع بمهارات اجتماعية جيدة وتستطيع التعامل مع الآخرين بطريقة إيجابية.\n\n"
+    "بشكل عام، شخصيتك متوازنة وتُظهر قدرة على التكيف مع المواقف المختلفة.",
+    "- استمر في تطوير نقاط قوتك\n"
+    "- اعمل على تحسين المجالات التي تحتاج لتطوير\n"
+    "- تذكر أن الشخصية قابلة للنمو والتطوير"
+]
+
+
+class StubChat(LLMChat):
+    def __init__(self, client: "StubLLMClient"):
+        self.client = client
+        self.turn = 0
+
+    async def stream(self, text):
+        self.client.calls += 1
+        reply = self.client.replies[self.turn % len(self.client.replies)]
+        self.turn += 1
+        for start in range(0, len(reply), self.client.chunk_size):
+            if self.client.delay:
+                await asyncio.sleep(self.client.delay)
+            yield reply[start:start + self.client.chunk_size]
+
+
+class StubLLMClient(LLMClient):
+    """Local stand-in: the n-th message of every chat gets replies[n] (cycling)"""
+
+    def __init__(self, replies: Optional[List[str]] = None, chunk_size: int = 40, delay: float = 0.0):
+        self.replies = replies or STUB_REPLIES
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = 0
+
+    def chat(self, session_id, system_message):
+        return StubChat(self)
+
+
+def create_llm_client(kind: Optional[str] = None) -> LLMClient:
+    kind = kind or os.getenv("LLM_CLIENT", CLIENT_GEMINI)
+    if kind == CLIENT_GEMINI:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key and importlib.util.find_spec("emergentintegrations") is not None:
+            return GeminiClient(api_key, os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL))
+        print("Gemini client unavailable (emergentintegrations not installed or GEMINI_API_KEY unset), "
+              "using the stub LLM client")
+        kind = CLIENT_STUB
+    if kind == CLIENT_STUB:
+        return StubLLMClient(delay=float(os.getenv("LLM_STUB_DELAY", 0.0)))
+    raise ValueError(f"Unknown LLM client: {kind}")
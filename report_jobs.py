@@ -0,0 +1,201 @@
+"""Background report generation: an asyncio worker pool with retries.
+
+A job per session runs the configured handler (the IRT backend scores the
+session, streams the LLM text and stores the report). Jobs are deduplicated
+per (session, scoring version); request handlers poll a job's status or
+subscribe to its events (status / text / reset / done / error) for streaming.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+# Failures another attempt cannot fix (a missing package); the job fails at once
+PERMANENT_ERRORS = (ImportError,)
+
+
+class ReportJob:
+    def __init__(self, session_id: str, version: str):
+        self.session_id = session_id
+        self.version = version
+        self.status = JOB_QUEUED
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.text: List[str] = []  # Partial text of the current attempt
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result_future = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved; callers that care await result()
+        self.result_future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._listeners: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def emit(self, event: str, data: Any):
+        for listener in self._listeners:
+            listener.put_nowait((event, data))
+
+    def set_status(self, status: str):
+        self.status = status
+        self.emit("status", status)
+
+    def append_text(self, chunk: str):
+        self.text.append(chunk)
+        self.emit("text", chunk)
+
+    def reset_text(self):
+        """Drop partial text before a retry"""
+        self.text = []
+        self.emit("reset", self.attempts)
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None):
+        self.finished_at = time.time()
+        if error is None:
+            self.set_status(JOB_COMPLETED)
+            self.result_future.set_result(result)
+            self.emit("done", result)
+        else:
+            self.error = str(error)
+            self.set_status(JOB_FAILED)
+            self.result_future.set_exception(error)
+            self.emit("error", self.error)
+
+    def follow(self, replacement: Optional["ReportJob"]):
+        """Finish a job superseded while queued with its replacement's outcome"""
+        def settle(future: asyncio.Future):
+            if self.finished:
+                return
+            if future.cancelled():
+                self.finish(error=RuntimeError("report job was cancelled"))
+            elif future.exception() is not None:
+                self.finish(error=future.exception())
+            else:
+                self.finish(future.result())
+
+        if replacement is None:
+            self.finish(error=RuntimeError("report job was superseded"))
+        else:
+            replacement.result_future.add_done_callback(settle)
+
+    async def result(self) -> Any:
+        return await asyncio.shield(self.result_future)
+
+    async def events(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Current state first, then live events until the job finishes"""
+        listener = asyncio.Queue()
+        self._listeners.append(listener)
+        try:
+            yield "status", self.status
+            if self.text:
+                yield "text", "".join(self.text)
+            if self.finished:
+                if self.status == JOB_COMPLETED:
+                    yield "done", self.result_future.result()
+                else:
+                    yield "error", self.error
+                return
+            while True:
+                event, data = await listener.get()
+                yield event, data
+                if event in ("done", "error"):
+                    return
+        finally:
+            self._listeners.remove(listener)
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "scoring_version": self.version,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "text_length": sum(len(chunk) for chunk in self.text),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class ReportJobQueue:
+    """Bounded pool of workers running handler(job) with exponential-backoff retries"""
+
+    def __init__(self, handler: Callable[[ReportJob], Awaitable[Any]], concurrency: int = 2,
+                 max_attempts: int = 3, retry_delay: float = 2.0, max_finished: int = 1000):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_finished = max_finished
+        self.jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    def get(self, session_id: str) -> Optional[ReportJob]:
+        return self.jobs.get(session_id)
+
+    def submit(self, session_id: str, version: str) -> ReportJob:
+        """Queue a job unless one for this session and version is pending or already succeeded"""
+        job = self.jobs.get(session_id)
+        if job is not None and job.version == version and job.status != JOB_FAILED:
+            return job
+        job = ReportJob(session_id, version)
+        self.jobs[session_id] = job
+        self.jobs.move_to_end(session_id)
+        self._queue.put_nowait(job)
+        self._prune()
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs (their reports are stored elsewhere)"""
+        finished = [sid for sid, job in self.jobs.items() if job.finished]
+        for session_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[session_id]
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                current = self.jobs.get(job.session_id)
+                if current is job:
+                    await self._run(job)
+                else:
+                    # Superseded while queued: whoever waits on it gets the replacement's outcome
+                    job.follow(current)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ReportJob):
+        while True:
+            job.attempts += 1
+            job.set_status(JOB_RUNNING)
+            try:
+                result = await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Report job for {job.session_id} failed (attempt {job.attempts}): {e}")
+                if job.attempts >= self.max_attempts or isinstance(e, PERMANENT_ERRORS):
+                    job.finish(error=e)
+                    return
+                job.set_status(JOB_RETRYING)
+                job.reset_text()
+                await asyncio.sleep(self.retry_delay * 2 ** (job.attempts - 1))
+                continue
+            job.finish(result)
+            return
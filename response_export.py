@@ -0,0 +1,215 @@
+"""Columnar export of stored answers as a memory-mapped response matrix.
+
+An export directory holds:
+  responses.int8       sessions x items matrix of raw 1-5 answers (0 = not asked)
+  item_dimension.int8  dimension index of every item column (-1 = unknown)
+  item_reverse.int8    1 where the item is reverse scored
+  session_ids.txt      one session id per matrix row
+  item_ids.txt         one question id per matrix column
+  meta.json            shape, dimension names and export time
+
+Readers open it with ResponseMatrix.open(), which maps responses.int8 with
+numpy.memmap so scans never deserialize per-row JSON/BSON.
+
+Usage:
+  python response_export.py mongo OUT_DIR
+  python response_export.py sessions-json OUT_DIR [sessions_data.json]
+"""
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+RESPONSES_FILE = "responses.int8"
+MISSING = 0
+
+
+class ResponseMatrix:
+    """Read-only view of an export directory"""
+
+    def __init__(self, path: str, responses: np.ndarray, session_ids: List[str], item_ids: List[str],
+                 item_dimension: np.ndarray, item_reverse: np.ndarray, dimensions: List[str]):
+        self.path = path
+        self.responses = responses
+        self.session_ids = session_ids
+        self.item_ids = item_ids
+        self.item_dimension = item_dimension
+        self.item_reverse = item_reverse
+        self.dimensions = dimensions
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.responses.shape
+
+    @classmethod
+    def open(cls, path: str) -> "ResponseMatrix":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        shape = tuple(meta["shape"])
+        if shape[0] and shape[1]:
+            responses = np.memmap(os.path.join(path, RESPONSES_FILE), dtype=np.int8, mode="r", shape=shape)
+        else:
+            responses = np.zeros(shape, dtype=np.int8)
+        return cls(
+            path,
+            responses,
+            _read_lines(os.path.join(path, "session_ids.txt")),
+            _read_lines(os.path.join(path, "item_ids.txt")),
+            np.fromfile(os.path.join(path, "item_dimension.int8"), dtype=np.int8),
+            np.fromfile(os.path.join(path, "item_reverse.int8"), dtype=np.int8).astype(bool),
+            meta["dimensions"]
+        )
+
+    def dimension_columns(self, dimension: str) -> np.ndarray:
+        return np.flatnonzero(self.item_dimension == self.dimensions.index(dimension))
+
+    def iter_rows(self, chunk_rows: int = 65536) -> Iterator[Tuple[int, np.ndarray]]:
+        """(first row, block) pairs over the matrix without loading it whole"""
+        for start in range(0, self.shape[0], chunk_rows):
+            yield start, self.responses[start:start + chunk_rows]
+
+    def scored(self, block: np.ndarray, columns: Optional[np.ndarray] = None) -> np.ndarray:
+        """Apply reverse scoring to a block of raw answers, keeping 0 for missing"""
+        reverse = self.item_reverse if columns is None else self.item_reverse[columns]
+        return np.where(reverse & (block != MISSING), 6 - block, block).astype(np.int8)
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _write_lines(path: str, lines: Iterable[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(f"{line}\n")
+
+
+class ResponseMatrixWriter:
+    """Creates an export directory and fills the memory-mapped matrix in batches"""
+
+    def __init__(self, path: str, session_ids: List[str], items: List[Dict], dimensions: List[str]):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.row = {sid: i for i, sid in enumerate(session_ids)}
+        self.column = {q["question_id"]: i for i, q in enumerate(items)}
+        self.shape = (len(session_ids), len(items))
+
+        dimension_index = {dim: i for i, dim in enumerate(dimensions)}
+        item_dimension = np.array([dimension_index.get(q.get("dimension"), -1) for q in items], dtype=np.int8)
+        item_reverse = np.array([bool(q.get("reverse_scored", False)) for q in items], dtype=np.int8)
+        item_dimension.tofile(os.path.join(path, "item_dimension.int8"))
+        item_reverse.tofile(os.path.join(path, "item_reverse.int8"))
+        _write_lines(os.path.join(path, "session_ids.txt"), session_ids)
+        _write_lines(os.path.join(path, "item_ids.txt"), (q["question_id"] for q in items))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "shape": self.shape,
+                "dtype": "int8",
+                "missing": MISSING,
+                "dimensions": dimensions,
+                "exported_at": datetime.utcnow().isoformat()
+            }, f, ensure_ascii=False)
+
+        self.responses = None
+        if all(self.shape):
+            self.responses = np.memmap(os.path.join(path, RESPONSES_FILE), dtype=np.int8, mode="w+", shape=self.shape)
+        else:
+            open(os.path.join(path, RESPONSES_FILE), "wb").close()
+
+    def write_batch(self, answers: List[Tuple[str, str, int]]):
+        """Store (session_id, question_id, answer) triples; unknown ids are skipped"""
+        if self.responses is None:
+            return
+        rows, cols, values = [], [], []
+        for session_id, question_id, answer in answers:
+            row = self.row.get(session_id)
+            col = self.column.get(question_id)
+            if row is not None and col is not None:
+                rows.append(row)
+                cols.append(col)
+                values.append(answer)
+        if rows:
+            self.responses[np.array(rows), np.array(cols)] = np.array(values, dtype=np.int8)
+
+    def close(self):
+        if self.responses is not None:
+            self.responses.flush()
+            self.responses = None
+
+
+def export_sessions(sessions: Iterable[Dict], path: str, items: Optional[List[Dict]] = None,
+                    dimensions: Optional[List[str]] = None, batch_size: int = 10_000) -> Tuple[int, int]:
+    """Export simple_backend style sessions (answers embedded in questions_answered)"""
+    sessions = list(sessions)
+    if items is None:
+        seen = {}
+        for session in sessions:
+            for ans in session.get("questions_answered", []):
+                seen.setdefault(ans["question_id"], {"question_id": ans["question_id"]})
+        items = list(seen.values())
+    dimensions = dimensions or sorted({q["dimension"] for q in items if q.get("dimension")})
+
+    writer = ResponseMatrixWriter(path, [s["session_id"] for s in sessions], items, dimensions)
+    batch = []
+    for session in sessions:
+        for ans in session.get("questions_answered", []):
+            batch.append((session["session_id"], ans["question_id"], ans["response"]))
+        if len(batch) >= batch_size:
+            writer.write_batch(batch)
+            batch = []
+    writer.write_batch(batch)
+    writer.close()
+    return writer.shape
+
+
+async def export_mongo(db, path: str, batch_size: int = 10_000,
+                       session_filter: Optional[Dict] = None) -> Tuple[int, int]:
+    """Export the IRT backend's answers collection (of the sessions matching session_filter)"""
+    items = [q async for q in db.questions.find(
+        {}, {"_id": 0, "question_id": 1, "dimension": 1, "reverse_scored": 1}
+    ).sort("question_id", 1)]
+    session_ids = [s["session_id"] async for s in db.sessions.find(
+        session_filter or {}, {"_id": 0, "session_id": 1}
+    ).batch_size(batch_size)]
+    dimensions = sorted({q["dimension"] for q in items})
+
+    writer = ResponseMatrixWriter(path, session_ids, items, dimensions)
+    batch = []
+    cursor = db.answers.find(
+        {}, {"_id": 0, "session_id": 1, "question_id": 1, "answer": 1}
+    ).batch_size(batch_size)
+    async for ans in cursor:
+        batch.append((ans["session_id"], ans["question_id"], ans["answer"]))
+        if len(batch) >= batch_size:
+            writer.write_batch(batch)
+            batch = []
+    writer.write_batch(batch)
+    writer.close()
+    return writer.shape
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("mongo", "sessions-json"):
+        print(__doc__)
+        sys.exit(1)
+    source, out_dir = sys.argv[1], sys.argv[2]
+
+    if source == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))[
+            os.getenv("DB_NAME", "personality_test_db")]
+        shape = asyncio.run(export_mongo(db, out_dir))
+    else:
+        sessions_file = sys.argv[3] if len(sys.argv) > 3 else "sessions_data.json"
+        with open(sessions_file, encoding="utf-8") as f:
+            shape = export_sessions(json.load(f).values(), out_dir)
+
+    print(f"Exported {shape[0]} sessions x {shape[1]} items to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
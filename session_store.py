@@ -0,0 +1,893 @@
+"""Session storage shared by simple_backend.py and irt_personality_test.py.
+
+SessionStore is a small document-store interface: sessions are dicts keyed by
+session_id, updated with Mongo-style $set / $push / $inc semantics, plus an
+append-only answer log. Three backends implement it:
+
+  memory  - a plain dict (optionally persisted by the caller through on_change)
+  sqlite  - one local file in WAL mode with indexed columns and batched writes
+  mongo   - Motor collections, for the IRT backend and larger deployments
+
+Pick one with create_session_store(kind, ...).
+"""
+import asyncio
+import bisect
+import json
+import operator
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+STORE_MEMORY = "memory"
+STORE_SQLITE = "sqlite"
+STORE_MONGO = "mongo"
+
+# Top-level session fields that the memory and SQLite backends index for scans and counts
+INDEXED_FIELDS = ("status", "gender", "education_level", "age", "created_at", "completed_at")
+
+
+def apply_update(doc: Dict, set_fields: Optional[Dict[str, Any]] = None,
+                 push: Optional[Dict[str, Any]] = None, inc: Optional[Dict[str, Any]] = None) -> Dict:
+    """Apply $set / $push (with $each) / $inc style changes (dotted paths allowed) to a document in place"""
+    def parent_of(path):
+        parts = path.split(".")
+        target = doc
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        return target, parts[-1]
+
+    for path, value in (set_fields or {}).items():
+        target, key = parent_of(path)
+        target[key] = value
+    for path, value in (push or {}).items():
+        target, key = parent_of(path)
+        if isinstance(value, dict) and "$each" in value:
+            target.setdefault(key, []).extend(value["$each"])
+        else:
+            target.setdefault(key, []).append(value)
+    for path, value in (inc or {}).items():
+        target, key = parent_of(path)
+        target[key] = target.get(key, 0) + value
+    return doc
+
+
+# Comparison operators accepted in filters, besides plain equality values
+RANGE_OPERATORS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_COMPARATORS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def is_condition(value: Any) -> bool:
+    """True for operator filters such as {"$gte": 18, "$lt": 30} or {"$in": [...]}"""
+    return isinstance(value, dict) and bool(value) and all(op in RANGE_OPERATORS or op == "$in" for op in value)
+
+
+def _match_value(value: Any, condition: Any) -> bool:
+    if not is_condition(condition):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$in":
+            if value not in operand:
+                return False
+            continue
+        try:
+            if value is None or not _COMPARATORS[op](value, operand):
+                return False
+        except TypeError:  # Like Mongo, values of another type never match a range
+            return False
+    return True
+
+
+def matches(doc: Dict, filters: Optional[Dict[str, Any]]) -> bool:
+    """Equality or $gt / $gte / $lt / $lte / $in match on top-level fields"""
+    return not filters or all(_match_value(doc.get(field), value) for field, value in filters.items())
+
+
+class SessionStore(ABC):
+    """Async session storage used by the request handlers"""
+
+    @abstractmethod
+    async def get(self, session_id: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        """The session document, or None; fields limits it to those paths where the backend can project"""
+
+    @abstractmethod
+    async def put(self, session: Dict):
+        """Insert or replace a whole session"""
+
+    async def put_many(self, sessions: List[Dict]):
+        """Insert or replace several sessions in one batch"""
+        for session in sessions:
+            await self.put(session)
+
+    @abstractmethod
+    async def update(self, session_id: str, set_fields: Optional[Dict[str, Any]] = None,
+                     push: Optional[Dict[str, Any]] = None,
+                     inc: Optional[Dict[str, Any]] = None,
+                     expected: Optional[Dict[str, Any]] = None,
+                     fields: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        """Atomically apply changes to one session and return the updated document
+
+        With expected, the changes are only applied while the stored session still
+        matches those top-level values (a missing field matches None); otherwise
+        nothing is written and None is returned. fields projects the result like get().
+        """
+
+    async def update_many(self, updates: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Apply (session_id, set_fields) pairs in one batch; returns the number of sessions found"""
+        updated = 0
+        for session_id, set_fields in updates:
+            if await self.update(session_id, set_fields=set_fields) is not None:
+                updated += 1
+        return updated
+
+    @abstractmethod
+    async def record_answers(self, answers: List[Dict]) -> List[Dict]:
+        """Add answers (with session_id and question_id) to the answer log, keyed on the pair
+
+        An answer already logged for the same question is kept, so a retried write never logs
+        twice. Returns the logged answer for each input, in order.
+        """
+
+    @abstractmethod
+    async def answers(self, session_id: str, dimension: Optional[str] = None,
+                      fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Logged answers of a session in insertion order (projected to fields where supported)"""
+
+    @abstractmethod
+    def scan(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Iterate sessions matching equality filters"""
+
+    async def query(self, filters: Optional[Dict[str, Any]] = None, after: Optional[str] = None,
+                    limit: Optional[int] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Sessions matching filters in session_id order, starting after the cursor session_id"""
+        found = [s async for s in self.scan(filters, batch_size) if after is None or s["session_id"] > after]
+        found.sort(key=lambda s: s["session_id"])
+        for session in found[:limit]:
+            yield session
+
+    async def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        total = 0
+        async for _ in self.scan(filters):
+            total += 1
+        return total
+
+    async def distinct_counts(self, field: str, filters: Optional[Dict[str, Any]] = None) -> Dict[Any, int]:
+        """Number of matching sessions per value of a top-level field (a group-by count)"""
+        counts = Counter()
+        async for session in self.scan(filters):
+            counts[session.get(field)] += 1
+        return dict(counts)
+
+    async def latest(self, limit: int) -> List[Dict]:
+        """The most recently written sessions, oldest first"""
+        recent = []
+        async for session in self.scan():
+            recent.append(session)
+            del recent[:-limit]
+        return recent
+
+    async def seed(self, sessions: List[Dict]) -> bool:
+        """Write sessions only into an empty store; True when they were written"""
+        if await self.count() > 0:
+            return False
+        await self.put_many(sessions)
+        return True
+
+    async def ensure_indexes(self):
+        """Create backend indexes (SQLite creates its own on connect)"""
+
+    async def close(self):
+        pass
+
+
+class FieldIndex:
+    """Session ids per value of one field, with the distinct values also kept sorted for ranges"""
+
+    def __init__(self):
+        self.ids: Dict[Any, Set[str]] = {}
+        self.keys: List[Any] = []  # Sorted distinct values, None excluded
+        self.sortable = True       # False once values of incomparable types were seen
+
+    def add(self, value: Any, session_id: str):
+        ids = self.ids.get(value)
+        if ids is None:
+            ids = self.ids[value] = set()
+            if value is not None and self.sortable:
+                try:
+                    bisect.insort(self.keys, value)
+                except TypeError:
+                    self.sortable = False
+        ids.add(session_id)
+
+    def remove(self, value: Any, session_id: str):
+        ids = self.ids.get(value)
+        if ids is None:
+            return
+        ids.discard(session_id)
+        if not ids:
+            del self.ids[value]
+            if value is not None and self.sortable:
+                position = bisect.bisect_left(self.keys, value)
+                if position < len(self.keys) and self.keys[position] == value:
+                    del self.keys[position]
+
+    def lookup(self, condition: Any) -> Optional[Set[str]]:
+        """Ids matching an equality or operator condition, or None when the index cannot answer it
+
+        Equality lookups return the live set; callers must not modify it.
+        """
+        try:
+            if not is_condition(condition):
+                return self.ids.get(condition, set())
+            result = None
+            if "$in" in condition:
+                result = set().union(*(self.ids.get(value, ()) for value in condition["$in"]))
+            bounds = {op: operand for op, operand in condition.items() if op in RANGE_OPERATORS}
+            if bounds:
+                if not self.sortable:
+                    return None
+                low, high = 0, len(self.keys)
+                for op, operand in bounds.items():
+                    if op == "$gt":
+                        low = max(low, bisect.bisect_right(self.keys, operand))
+                    elif op == "$gte":
+                        low = max(low, bisect.bisect_left(self.keys, operand))
+                    elif op == "$lt":
+                        high = min(high, bisect.bisect_left(self.keys, operand))
+                    else:
+                        high = min(high, bisect.bisect_right(self.keys, operand))
+                in_range = set().union(*(self.ids[key] for key in self.keys[low:high]))
+                result = in_range if result is None else result & in_range
+            return result
+        except TypeError:  # Unhashable or incomparable operands: leave the condition to matches()
+            return None
+
+
+class InMemorySessionStore(SessionStore):
+    """Sessions in a process-local dict
+
+    get() returns the live document; changes must go through put/update so that
+    on_change (used by simple_backend's journal) sees them and the secondary
+    indexes over INDEXED_FIELDS stay current. Filters on indexed fields are
+    answered by intersecting those indexes instead of scanning every session.
+    """
+
+    def __init__(self, sessions: Optional[Dict[str, Dict]] = None,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.sessions = sessions if sessions is not None else {}
+        self.answer_log: Dict[str, List[Dict]] = {}
+        self.on_change = on_change
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self):
+        """Index every session again (after the sessions dict was refilled outside the store)"""
+        self.indexes = {field: FieldIndex() for field in INDEXED_FIELDS}
+        self._indexed: Dict[str, Tuple] = {}  # Indexed values per session, to unindex after in-place updates
+        self._ids: List[str] = sorted(self.sessions)  # Ordered session ids for cursor pagination
+        for session_id, session in self.sessions.items():
+            self._index(session_id, session)
+
+    def _index(self, session_id: str, session: Dict):
+        previous = self._indexed.get(session_id)
+        values = tuple(session.get(field) for field in INDEXED_FIELDS)
+        if values == previous:
+            return
+        for field, old, new in zip(INDEXED_FIELDS, previous or values, values):
+            if previous is None or old != new:
+                if previous is not None:
+                    self.indexes[field].remove(old, session_id)
+                self.indexes[field].add(new, session_id)
+        self._indexed[session_id] = values
+
+    def _changed(self, session_id: str):
+        if session_id not in self._indexed:
+            bisect.insort(self._ids, session_id)
+        self._index(session_id, self.sessions[session_id])
+        if self.on_change is not None:
+            self.on_change(session_id)
+
+    def _candidates(self, filters: Optional[Dict[str, Any]]) -> Tuple[Optional[Set[str]], Dict[str, Any]]:
+        """Ids satisfying the indexed filters (None when no index applies) and the filters left to check"""
+        found, rest = [], {}
+        for field, condition in (filters or {}).items():
+            ids = self.indexes[field].lookup(condition) if field in self.indexes else None
+            if ids is None:
+                rest[field] = condition
+            else:
+                found.append(ids)
+        if not found:
+            return None, rest
+        # The smallest set is used as is (never modified); intersections build new sets
+        found.sort(key=len)
+        candidates = found[0]
+        for ids in found[1:]:
+            if not candidates:
+                break
+            candidates = candidates & ids
+        return candidates, rest
+
+    async def get(self, session_id: str, fields=None) -> Optional[Dict]:
+        return self.sessions.get(session_id)
+
+    async def put(self, session: Dict):
+        self.sessions[session["session_id"]] = session
+        self._changed(session["session_id"])
+
+    async def update(self, session_id, set_fields=None, push=None, inc=None, expected=None, fields=None):
+        session = self.sessions.get(session_id)
+        if session is None or not matches(session, expected):
+            return None
+        apply_update(session, set_fields, push, inc)
+        self._changed(session_id)
+        return session
+
+    async def record_answers(self, answers):
+        logged = []
+        for answer in answers:
+            log = self.answer_log.setdefault(answer["session_id"], [])
+            existing = next((a for a in log if a["question_id"] == answer["question_id"]), None)
+            if existing is None:
+                log.append(answer)
+            logged.append(existing or answer)
+        return logged
+
+    async def answers(self, session_id, dimension=None, fields=None):
+        return [a for a in self.answer_log.get(session_id, [])
+                if dimension is None or a.get("dimension") == dimension]
+
+    async def scan(self, filters=None, batch_size=500):
+        # Snapshot the matches so handlers may add sessions while a scan is in progress
+        candidates, rest = self._candidates(filters)
+        if candidates is None:
+            found = list(self.sessions.values())
+        else:
+            found = [self.sessions[sid] for sid in candidates if sid in self.sessions]
+        for session in found:
+            if matches(session, rest):
+                yield session
+
+    async def query(self, filters=None, after=None, limit=None, batch_size=500):
+        candidates, rest = self._candidates(filters)
+        start = 0 if after is None else bisect.bisect_right(self._ids, after)
+        if candidates is not None and len(candidates) * 8 < len(self._ids) - start:
+            # Few candidates: sort just those
+            ordered = sorted(sid for sid in candidates if after is None or sid > after)
+        else:
+            # Walk the sorted ids from the cursor and stop as soon as the page is full
+            ordered = (sid for sid in self._ids[start:] if candidates is None or sid in candidates)
+        remaining = limit
+        for session_id in ordered:
+            if remaining is not None and remaining <= 0:
+                return
+            session = self.sessions.get(session_id)
+            if session is not None and matches(session, rest):
+                yield session
+                if remaining is not None:
+                    remaining -= 1
+
+    async def count(self, filters=None):
+        if not filters:
+            return len(self.sessions)
+        candidates, rest = self._candidates(filters)
+        if candidates is not None and not rest:
+            return len(candidates)
+        return await super().count(filters)
+
+    async def distinct_counts(self, field, filters=None):
+        candidates, rest = self._candidates(filters)
+        if field not in self.indexes or rest:
+            return await super().distinct_counts(field, filters)
+        return {
+            value: len(ids) if candidates is None else len(ids & candidates)
+            for value, ids in self.indexes[field].ids.items()
+            if candidates is None or not ids.isdisjoint(candidates)
+        }
+
+    async def latest(self, limit):
+        recent = []
+        for session_id in reversed(self.sessions):
+            if len(recent) >= limit:
+                break
+            recent.append(self.sessions[session_id])
+        return recent[::-1]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, float) and value in (float("inf"), float("-inf")):
+        return {"$float": "inf" if value > 0 else "-inf"}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        if "$date" in obj:
+            return datetime.fromisoformat(obj["$date"])
+        if "$float" in obj:
+            return float(obj["$float"])
+    return obj
+
+
+def _dumps(doc: Dict) -> str:
+    # Infinite standard errors and datetimes survive the JSON round trip
+    return json.dumps(_replace_infinities(doc), ensure_ascii=False, default=_encode_value)
+
+
+def _replace_infinities(value):
+    if isinstance(value, float) and value in (float("inf"), float("-inf")):
+        return _encode_value(value)
+    if isinstance(value, dict):
+        return {k: _replace_infinities(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_infinities(v) for v in value]
+    return value
+
+
+def _loads(data: str) -> Dict:
+    return json.loads(data, object_hook=_decode_object)
+
+
+def _column_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite file (WAL mode)
+
+    Each session is a JSON document plus indexed columns for INDEXED_FIELDS.
+    All statements run on one dedicated thread so the event loop never blocks,
+    and every update is a single row-level transaction, so several processes
+    can share the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self._conn = None
+        self._executor.submit(self._connect).result()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} {'INTEGER' if field == 'age' else 'TEXT'}" for field in INDEXED_FIELDS)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                {columns},
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                dimension TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_session ON answers(session_id, dimension);
+        """)
+        for field in INDEXED_FIELDS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_sessions_{field} ON sessions({field})")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    @staticmethod
+    def _row(session: Dict):
+        return (session["session_id"],
+                *(_column_value(session.get(field)) for field in INDEXED_FIELDS),
+                _dumps(session))
+
+    def _upsert_sql(self) -> str:
+        names = ", ".join(("session_id",) + INDEXED_FIELDS + ("data",))
+        marks = ", ".join("?" * (len(INDEXED_FIELDS) + 2))
+        return f"INSERT OR REPLACE INTO sessions ({names}) VALUES ({marks})"
+
+    def _get(self, session_id):
+        row = self._conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return _loads(row[0]) if row else None
+
+    async def get(self, session_id, fields=None):
+        return await self._run(self._get, session_id)
+
+    def _put_many(self, sessions):
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(self._upsert_sql(), [self._row(s) for s in sessions])
+
+    async def put(self, session):
+        await self._run(self._put_many, [session])
+
+    async def put_many(self, sessions):
+        if sessions:
+            await self._run(self._put_many, list(sessions))
+
+    def _update(self, session_id, set_fields, push, inc, expected):
+        with self._conn:
+            # IMMEDIATE takes the write lock before reading, so concurrent writers serialize per update
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            session = _loads(row[0])
+            if not matches(session, expected):
+                return None
+            apply_update(session, set_fields, push, inc)
+            self._conn.execute(self._upsert_sql(), self._row(session))
+            return session
+
+    async def update(self, session_id, set_fields=None, push=None, inc=None, expected=None, fields=None):
+        return await self._run(self._update, session_id, set_fields, push, inc, expected)
+
+    def _update_many(self, updates):
+        # Top-level, non-indexed fields are patched in place with json_set, grouped by field set;
+        # anything else is read, updated and rewritten like update()
+        in_place, rewrite = {}, []
+        for session_id, set_fields in updates:
+            if any("." in path or path in INDEXED_FIELDS for path in set_fields):
+                rewrite.append((session_id, set_fields))
+            else:
+                in_place.setdefault(tuple(set_fields), []).append((session_id, set_fields))
+
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            updated = 0
+            for paths, group in in_place.items():
+                assignments = ", ".join("?, json(?)" for _ in paths)
+                cursor = self._conn.executemany(
+                    f"UPDATE sessions SET data = json_set(data, {assignments}) WHERE session_id = ?",
+                    [(*(arg for path in paths for arg in (f'$."{path}"', _dumps(fields[path]))), session_id)
+                     for session_id, fields in group]
+                )
+                updated += cursor.rowcount
+            rows = []
+            for session_id, set_fields in rewrite:
+                row = self._conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                if row is not None:
+                    rows.append(self._row(apply_update(_loads(row[0]), set_fields)))
+            self._conn.executemany(self._upsert_sql(), rows)
+            return updated + len(rows)
+
+    async def update_many(self, updates):
+        if not updates:
+            return 0
+        return await self._run(self._update_many, list(updates))
+
+    def _seed(self, sessions):
+        with self._conn:
+            # Check and insert under one write lock so only the first worker seeds
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+                return False
+            self._conn.executemany(self._upsert_sql(), [self._row(s) for s in sessions])
+            return True
+
+    async def seed(self, sessions):
+        return await self._run(self._seed, list(sessions))
+
+    def key_value(self, name: str) -> "SQLiteKeyValue":
+        """A small key-value table in the same database file"""
+        return SQLiteKeyValue(self, name)
+
+    def _record_answers(self, answers):
+        logged = []
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            existing = {}
+            for session_id in {a["session_id"] for a in answers}:
+                for answer in self._answers(session_id, None):
+                    existing.setdefault((session_id, answer["question_id"]), answer)
+            for answer in answers:
+                key = (answer["session_id"], answer["question_id"])
+                if key not in existing:
+                    self._conn.execute("INSERT INTO answers (session_id, dimension, data) VALUES (?, ?, ?)",
+                                       (answer["session_id"], answer.get("dimension"), _dumps(answer)))
+                    existing[key] = answer
+                logged.append(existing[key])
+        return logged
+
+    async def record_answers(self, answers):
+        if not answers:
+            return []
+        return await self._run(self._record_answers, list(answers))
+
+    def _answers(self, session_id, dimension):
+        if dimension is None:
+            rows = self._conn.execute(
+                "SELECT data FROM answers WHERE session_id = ? ORDER BY id", (session_id,))
+        else:
+            rows = self._conn.execute(
+                "SELECT data FROM answers WHERE session_id = ? AND dimension = ? ORDER BY id",
+                (session_id, dimension))
+        return [_loads(row[0]) for row in rows.fetchall()]
+
+    async def answers(self, session_id, dimension=None, fields=None):
+        return await self._run(self._answers, session_id, dimension)
+
+    @staticmethod
+    def _where(filters):
+        """SQL for the indexed part of the filters, plus the remainder to check in Python"""
+        clauses, params, rest = [], [], {}
+        for field, value in (filters or {}).items():
+            if field not in INDEXED_FIELDS:
+                rest[field] = value
+            elif not is_condition(value):
+                clauses.append(f"{field} = ?")
+                params.append(_column_value(value))
+            else:
+                for op, operand in value.items():
+                    if op == "$in":
+                        clauses.append(f"{field} IN ({', '.join('?' * len(operand))})")
+                        params.extend(_column_value(v) for v in operand)
+                    else:
+                        clauses.append(f"{field} {RANGE_OPERATORS[op]} ?")
+                        params.append(_column_value(operand))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params, rest
+
+    async def scan(self, filters=None, batch_size=500):
+        where, params, rest = self._where(filters)
+        cursor = await self._run(lambda: self._conn.execute(
+            f"SELECT data FROM sessions{where} ORDER BY rowid", params))
+        while True:
+            rows = await self._run(cursor.fetchmany, batch_size)
+            if not rows:
+                break
+            for row in rows:
+                session = _loads(row[0])
+                if matches(session, rest):
+                    yield session
+
+    def _page(self, where, params, after, size):
+        if after is not None:
+            where += (" AND " if where else " WHERE ") + "session_id > ?"
+            params = [*params, after]
+        return self._conn.execute(
+            f"SELECT session_id, data FROM sessions{where} ORDER BY session_id LIMIT ?", [*params, size]
+        ).fetchall()
+
+    async def query(self, filters=None, after=None, limit=None, batch_size=500):
+        # Keyset pages over the primary key, so no cursor stays open between batches
+        where, params, rest = self._where(filters)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            rows = await self._run(self._page, where, params, after, batch_size)
+            for session_id, data in rows:
+                session = _loads(data)
+                if matches(session, rest):
+                    yield session
+                    if remaining is not None:
+                        remaining -= 1
+                        if remaining == 0:
+                            return
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    async def count(self, filters=None):
+        where, params, rest = self._where(filters)
+        if rest:
+            return await super().count(filters)
+        return await self._run(lambda: self._conn.execute(
+            f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0])
+
+    async def distinct_counts(self, field, filters=None):
+        where, params, rest = self._where(filters)
+        if field not in INDEXED_FIELDS or rest:
+            return await super().distinct_counts(field, filters)
+        return dict(await self._run(lambda: self._conn.execute(
+            f"SELECT {field}, COUNT(*) FROM sessions{where} GROUP BY {field}", params).fetchall()))
+
+    async def latest(self, limit):
+        rows = await self._run(lambda: self._conn.execute(
+            "SELECT data FROM sessions ORDER BY rowid DESC LIMIT ?", (limit,)).fetchall())
+        return [_loads(row[0]) for row in reversed(rows)]
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+
+class KeyValueStore(ABC):
+    """Async key-value storage for small shared records such as admin logins"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict]:
+        """The stored value, or None"""
+
+    @abstractmethod
+    async def put(self, key: str, value: Dict):
+        """Insert or replace a value"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Remove a key; True when it existed"""
+
+
+class InMemoryKeyValue(KeyValueStore):
+    def __init__(self, data: Optional[Dict[str, Dict]] = None):
+        self.data = data if data is not None else {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def put(self, key, value):
+        self.data[key] = value
+
+    async def delete(self, key):
+        return self.data.pop(key, None) is not None
+
+
+class SQLiteKeyValue(KeyValueStore):
+    """Key-value table sharing a SQLiteSessionStore's connection and thread"""
+
+    def __init__(self, store: SQLiteSessionStore, name: str):
+        if not name.isidentifier():
+            raise ValueError(f"Invalid table name: {name}")
+        self.store = store
+        self.table = f"kv_{name}"
+        store._executor.submit(
+            lambda: store._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        ).result()
+
+    def _get(self, key):
+        row = self.store._conn.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return _loads(row[0]) if row else None
+
+    async def get(self, key):
+        return await self.store._run(self._get, key)
+
+    def _put(self, key, value):
+        self.store._conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, data) VALUES (?, ?)",
+                                 (key, _dumps(value)))
+
+    async def put(self, key, value):
+        await self.store._run(self._put, key, value)
+
+    def _delete(self, key):
+        return self.store._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    async def delete(self, key):
+        return await self.store._run(self._delete, key)
+
+
+class MotorSessionStore(SessionStore):
+    """Sessions and answers in MongoDB collections (Motor)"""
+
+    def __init__(self, sessions_collection, answers_collection):
+        self.sessions_collection = sessions_collection
+        self.answers_collection = answers_collection
+
+    async def ensure_indexes(self):
+        # Only the indexes the IRT query paths use (timed in bench_mongo_queries.py)
+        await self.sessions_collection.create_index("session_id", unique=True)
+        await self.answers_collection.create_index([("session_id", 1), ("dimension", 1)])
+        # Keeps record_answers to one answer per question
+        await self.answers_collection.create_index([("session_id", 1), ("question_id", 1)], unique=True)
+
+    async def get(self, session_id, fields=None):
+        return await self.sessions_collection.find_one({"session_id": session_id}, _projection(fields))
+
+    async def put(self, session):
+        await self.sessions_collection.replace_one(
+            {"session_id": session["session_id"]}, _without_id(session), upsert=True)
+
+    async def put_many(self, sessions):
+        from pymongo import ReplaceOne
+        if sessions:
+            await self.sessions_collection.bulk_write(
+                [ReplaceOne({"session_id": s["session_id"]}, _without_id(s), upsert=True) for s in sessions],
+                ordered=False
+            )
+
+    async def update(self, session_id, set_fields=None, push=None, inc=None, expected=None, fields=None):
+        from pymongo import ReturnDocument
+        update = {}
+        if set_fields:
+            update["$set"] = set_fields
+        if push:
+            update["$push"] = push
+        if inc:
+            update["$inc"] = inc
+        query = {**(expected or {}), "session_id": session_id}
+        if not update:
+            return await self.sessions_collection.find_one(query, _projection(fields))
+        return await self.sessions_collection.find_one_and_update(
+            query, update, projection=_projection(fields), return_document=ReturnDocument.AFTER
+        )
+
+    async def update_many(self, updates):
+        from pymongo import UpdateOne
+        if not updates:
+            return 0
+        result = await self.sessions_collection.bulk_write(
+            [UpdateOne({"session_id": session_id}, {"$set": set_fields}) for session_id, set_fields in updates],
+            ordered=False
+        )
+        return result.matched_count
+
+    async def record_answers(self, answers):
+        from pymongo import UpdateOne
+        if not answers:
+            return []
+        keys = [{"session_id": a["session_id"], "question_id": a["question_id"]} for a in answers]
+        await self.answers_collection.bulk_write(
+            [UpdateOne(key, {"$setOnInsert": _without_id(a)}, upsert=True) for key, a in zip(keys, answers)],
+            ordered=True
+        )
+        logged = {}
+        for session_id in {key["session_id"] for key in keys}:
+            query = {"session_id": session_id,
+                     "question_id": {"$in": [key["question_id"] for key in keys if key["session_id"] == session_id]}}
+            async for answer in self.answers_collection.find(query, {"_id": 0}):
+                logged[(session_id, answer["question_id"])] = answer
+        return [logged[(key["session_id"], key["question_id"])] for key in keys]
+
+    async def answers(self, session_id, dimension=None, fields=None):
+        query = {"session_id": session_id}
+        if dimension is not None:
+            query["dimension"] = dimension
+        return [a async for a in self.answers_collection.find(query, _projection(fields)).sort("_id", 1)]
+
+    async def scan(self, filters=None, batch_size=500):
+        async for session in self.sessions_collection.find(filters or {}, {"_id": 0}).batch_size(batch_size):
+            yield session
+
+    async def query(self, filters=None, after=None, limit=None, batch_size=500):
+        query = dict(filters or {})
+        if after is not None:
+            query["session_id"] = {"$gt": after}
+        if limit is not None and limit <= 0:
+            return
+        cursor = self.sessions_collection.find(query, {"_id": 0}).sort("session_id", 1).batch_size(batch_size)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        async for session in cursor:
+            yield session
+
+    async def count(self, filters=None):
+        return await self.sessions_collection.count_documents(filters or {})
+
+    async def distinct_counts(self, field, filters=None):
+        pipeline = [{"$match": filters or {}}, {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+        return {group["_id"]: group["count"] async for group in self.sessions_collection.aggregate(pipeline)}
+
+    async def latest(self, limit):
+        recent = [s async for s in self.sessions_collection.find({}, {"_id": 0}).sort("_id", -1).limit(limit)]
+        return recent[::-1]
+
+
+def _without_id(doc: Dict) -> Dict:
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+def _projection(fields: Optional[Sequence[str]]) -> Dict[str, int]:
+    """Mongo projection returning only fields (everything but _id when None)"""
+    projection = {"_id": 0}
+    if fields:
+        projection.update((field, 1) for field in fields)
+    return projection
+
+
+def create_session_store(kind: str, sessions: Optional[Dict[str, Dict]] = None,
+                         on_change: Optional[Callable[[str], None]] = None,
+                         sqlite_path: Optional[str] = None, db=None) -> SessionStore:
+    """Build the configured backend (SESSION_STORE environment variable in both apps)"""
+    if kind == STORE_MEMORY:
+        return InMemorySessionStore(sessions, on_change)
+    if kind == STORE_SQLITE:
+        return SQLiteSessionStore(sqlite_path or os.getenv("SQLITE_PATH", "sessions.db"))
+    if kind == STORE_MONGO:
+        if db is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            db = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))[
+                os.getenv("DB_NAME", "personality_test_db")]
+        return MotorSessionStore(db.sessions, db.answers)
+    raise ValueError(f"Unknown session store: {kind}")
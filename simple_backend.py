@@ -1,11 +1,30 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uuid
-import random
+import copy
+import csv
+import io
 import json
 import os
+import time
+import asyncio
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from string import Formatter
+from session_store import create_session_store, InMemoryKeyValue, STORE_MEMORY, STORE_SQLITE
+from irt_engine import MODEL_GRM, DEFAULT_ESTIMATOR
+from bulk_scoring import ScoringPlan, score_block, dimension_scores
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, run a single worker
+    fcntl = None
 
 app = FastAPI()
 
@@ -93,39 +112,362 @@ def add_sample_data():
 # Add sample data when starting
 add_sample_data()
 
-# Data persistence functions
-def save_sessions():
-    """Save sessions to a JSON file"""
+# Data persistence: sessions_data.json is a periodic snapshot and every change made
+# since then is appended to a journal, which load_sessions() replays on startup
+SESSIONS_FILE = 'sessions_data.json'
+JOURNAL_FILE = 'sessions_journal.jsonl'
+LOCK_FILE = 'sessions_data.lock'
+JOURNAL_COMPACT_EVERY = 500  # Journal events before they are folded into a new snapshot
+FLUSH_INTERVAL = float(os.environ.get("FLUSH_INTERVAL", 1.0))  # Seconds between background flushes
+FLUSH_MAX_BATCH = 200  # Dirty sessions that trigger an early flush
+
+@contextmanager
+def file_lock():
+    """Exclusive lock shared by every process writing the snapshot or the journal"""
+    if fcntl is None:
+        yield
+        return
+    with open(LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def apply_session_event(event):
+    """Apply one journal event to the in-memory sessions (replaying an event twice is harmless)"""
+    if event.get("op") == "put":
+        sessions[event["session"]["session_id"]] = event["session"]
+
+class SessionJournal:
+    """Append-only log of session changes with periodic compaction into the snapshot
+    
+    Only the persistence worker writes to it, from an executor thread.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.events_since_snapshot = 0
+        self._file = None
+    
+    def write_lines(self, lines):
+        with file_lock():
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.writelines(lines)
+            self._file.flush()
+        self.events_since_snapshot += len(lines)
+    
+    def needs_compaction(self):
+        return self.events_since_snapshot >= JOURNAL_COMPACT_EVERY
+    
+    def compact(self, snapshot=None):
+        """Write a fresh snapshot, then start an empty journal"""
+        with file_lock():
+            write_snapshot(sessions if snapshot is None else snapshot)
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, 'w', encoding='utf-8')
+        self.events_since_snapshot = 0
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def replay(self):
+        """Re-apply journaled events on top of the loaded snapshot"""
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave the last line half written
+                    print(f"Ignoring truncated journal entry after {count} events")
+                    break
+                apply_session_event(event)
+                count += 1
+        return count
+
+journal = SessionJournal(JOURNAL_FILE)
+
+class SessionPersistence:
+    """Background worker that coalesces dirty sessions and journals them in batches
+    
+    Request handlers only call mark_dirty(); file I/O happens in an executor thread.
+    """
+    
+    def __init__(self, journal, flush_interval=FLUSH_INTERVAL, max_batch=FLUSH_MAX_BATCH):
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dirty = set()
+        self.oldest_dirty_at = None
+        self.metrics = {
+            "flushes": 0,
+            "sessions_flushed": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_lag_ms": 0.0,
+            "max_flush_lag_ms": 0.0,
+            "last_flush_duration_ms": 0.0,
+            "compactions": 0,
+            "errors": 0
+        }
+        self._wake = None
+        self._task = None
+        self._lock = None
+    
+    def mark_dirty(self, session_id):
+        if not self.dirty:
+            self.oldest_dirty_at = time.monotonic()
+        self.dirty.add(session_id)
+        if self._wake is not None and len(self.dirty) >= self.max_batch:
+            self._wake.set()
+    
+    def start(self):
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the worker and flush everything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.journal.close()
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+    
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.dirty:
+                return
+            batch, self.dirty = self.dirty, set()
+            marked_at, self.oldest_dirty_at = self.oldest_dirty_at, None
+            
+            # Serialize on the loop so the sessions are not read while handlers mutate them;
+            # this is O(batch), the disk write below runs in a thread
+            lines = [
+                json.dumps({"op": "put", "session": sessions[sid]}, ensure_ascii=False) + "\n"
+                for sid in batch if sid in sessions
+            ]
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.journal.write_lines, lines)
+                if self.journal.needs_compaction():
+                    # Deep copy: handlers keep appending to the live questions_answered lists
+                    # while the snapshot thread serializes
+                    snapshot = copy.deepcopy(sessions)
+                    await loop.run_in_executor(None, self.journal.compact, snapshot)
+                    self.metrics["compactions"] += 1
+            except Exception as e:
+                print(f"Error flushing sessions: {e}")
+                self.metrics["errors"] += 1
+                self.dirty |= batch
+                self.oldest_dirty_at = self.oldest_dirty_at or marked_at
+                return
+            
+            finished = time.monotonic()
+            lag_ms = (finished - marked_at) * 1000 if marked_at else 0.0
+            self.metrics["flushes"] += 1
+            self.metrics["sessions_flushed"] += len(lines)
+            self.metrics["last_batch_size"] = len(lines)
+            self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(lines))
+            self.metrics["last_flush_lag_ms"] = round(lag_ms, 2)
+            self.metrics["max_flush_lag_ms"] = round(max(self.metrics["max_flush_lag_ms"], lag_ms), 2)
+            self.metrics["last_flush_duration_ms"] = round((finished - started) * 1000, 2)
+
+persistence = SessionPersistence(journal)
+
+def write_snapshot(data):
+    """Replace the JSON snapshot; the caller holds file_lock()"""
     try:
-        with open('sessions_data.json', 'w', encoding='utf-8') as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=2)
+        # Write to a per-process temporary file first so a crash or a concurrent
+        # writer never leaves a half-written snapshot
+        tmp_path = f"{SESSIONS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SESSIONS_FILE)
     except Exception as e:
         print(f"Error saving sessions: {e}")
 
+def save_sessions(snapshot=None):
+    """Save a snapshot of all sessions to the JSON file"""
+    with file_lock():
+        write_snapshot(sessions if snapshot is None else snapshot)
+
 def load_sessions():
-    """Load sessions from JSON file"""
-    global sessions
+    """Load the sessions snapshot and replay the journal"""
     try:
-        if os.path.exists('sessions_data.json'):
-            with open('sessions_data.json', 'r', encoding='utf-8') as f:
-                sessions = json.load(f)
+        if os.path.exists(SESSIONS_FILE):
+            with open(SESSIONS_FILE, 'r', encoding='utf-8') as f:
+                # Refill in place: the memory session store holds a reference to this dict
+                sessions.clear()
+                sessions.update(json.load(f))
                 print(f"Loaded {len(sessions)} sessions from file")
         else:
             add_sample_data()
-            save_sessions()
+        replayed = journal.replay()
+        if replayed:
+            print(f"Replayed {replayed} journal events")
+        # Fold the replayed events into a fresh snapshot
+        journal.compact()
     except Exception as e:
         print(f"Error loading sessions: {e}")
         add_sample_data()
+    # The dict was refilled behind the memory store's back, so its secondary indexes start over
+    session_store.rebuild_indexes()
+
+# Session storage backend: "memory" (the dict above, persisted by the journal) or
+# "sqlite" (SQLITE_PATH, default sessions.db); see session_store.py.
+# The memory store is per process, so running several workers needs sqlite.
+SESSION_STORE = os.environ.get("SESSION_STORE", STORE_MEMORY)
+WORKERS = int(os.environ.get("WORKERS", 1))
+
+session_store = create_session_store(SESSION_STORE, sessions=sessions, on_change=persistence.mark_dirty)
+
+async def seed_session_store():
+    """Fill an empty non-memory store from the JSON snapshot, or the sample data
+    
+    Every worker calls this on startup; the store only accepts the first seed.
+    """
+    seed = sessions
+    if os.path.exists(SESSIONS_FILE):
+        with open(SESSIONS_FILE, 'r', encoding='utf-8') as f:
+            seed = json.load(f)
+    if await session_store.seed(list(seed.values())):
+        print(f"Seeded {SESSION_STORE} session store with {len(seed)} sessions")
+
+AGE_BUCKETS = [("18-25", 18, 25), ("26-35", 26, 35), ("36-45", 36, 45), ("46-55", 46, 55), ("56+", 56, None)]
+RECENT_SESSIONS = 5
+# A sqlite store is shared with other workers, whose changes this process never sees;
+# their aggregates are rebuilt from the store when older than this (seconds)
+DASHBOARD_REFRESH_INTERVAL = float(os.environ.get("DASHBOARD_REFRESH_INTERVAL", 60))
 
-# Load existing sessions when starting
-load_sessions()
+def age_bucket(age):
+    for name, low, high in AGE_BUCKETS:
+        if age is not None and age >= low and (high is None or age <= high):
+            return name
+    return None
+
+class DashboardStats:
+    """Admin dashboard aggregates kept up to date by the session handlers
+    
+    Rebuilt from the session store once at startup; afterwards create, answer and
+    completion events adjust the counters, so the dashboard never scans sessions.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.total = 0
+        self.statuses = Counter()
+        self.ages = Counter()
+        self.genders = Counter()
+        self.education_levels = Counter()
+        self.recent = deque(maxlen=RECENT_SESSIONS)
+        self.rebuilt_at = None
+    
+    @staticmethod
+    def recent_entry(session):
+        return {
+            "session_id": session["session_id"],
+            "name": session["name"],
+            "age": session["age"],
+            "gender": session["gender"],
+            "status": session["status"],
+            "questions_answered": len(session["questions_answered"])
+        }
+    
+    def add(self, session):
+        self.total += 1
+        self.statuses[session["status"]] += 1
+        self.ages[age_bucket(session["age"])] += 1
+        self.genders[session["gender"]] += 1
+        self.education_levels[session["education_level"]] += 1
+        self.recent.append(self.recent_entry(session))
+    
+    def answered(self, session, previous_status="active"):
+        """Record answers (and a completion) of an updated session"""
+        if session["status"] != previous_status:
+            self.statuses[previous_status] -= 1
+            self.statuses[session["status"]] += 1
+        for entry in self.recent:
+            if entry["session_id"] == session["session_id"]:
+                entry["status"] = session["status"]
+                entry["questions_answered"] = len(session["questions_answered"])
+    
+    async def rebuild(self):
+        """Recount everything with the store's indexed group-by counts"""
+        self.reset()
+        self.total = await session_store.count()
+        self.statuses.update(await session_store.distinct_counts("status"))
+        self.genders.update(await session_store.distinct_counts("gender"))
+        self.education_levels.update(await session_store.distinct_counts("education_level"))
+        for age, count in (await session_store.distinct_counts("age")).items():
+            self.ages[age_bucket(age)] += count
+        self.recent.extend(self.recent_entry(s) for s in await session_store.latest(RECENT_SESSIONS))
+        self.rebuilt_at = time.monotonic()
+        print(f"Dashboard aggregates rebuilt from {self.total} sessions")
+    
+    async def refresh(self):
+        if self.rebuilt_at is None or (SESSION_STORE != STORE_MEMORY and
+                                       time.monotonic() - self.rebuilt_at > DASHBOARD_REFRESH_INTERVAL):
+            await self.rebuild()
+    
+    def snapshot(self):
+        completed = self.statuses["completed"]
+        return {
+            "total_sessions": self.total,
+            "completed_sessions": completed,
+            "active_sessions": self.statuses["active"],
+            "completion_rate": round((completed / self.total * 100) if self.total > 0 else 0, 1),
+            "age_distribution": {name: self.ages[name] for name, _, _ in AGE_BUCKETS},
+            "gender_distribution": {
+                "male": self.genders["male"],
+                "female": self.genders["female"]
+            },
+            "education_distribution": {level: count for level, count in self.education_levels.items() if count},
+            "recent_sessions": [
+                {key: value for key, value in entry.items() if key != "session_id"}
+                for entry in self.recent
+            ]
+        }
+
+dashboard_stats = DashboardStats()
 
 # Admin credentials (في التطبيق الحقيقي يجب تشفيرها)
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"  # يمكنك تغييرها
 
-# Store admin sessions
+# Store admin sessions (in the sqlite file too, so every worker sees the same logins)
 admin_sessions = {}
+admin_store = (session_store.key_value("admin_sessions") if SESSION_STORE == STORE_SQLITE
+               else InMemoryKeyValue(admin_sessions))
 
 # Sample questions that will be personalized with multi-language support
 base_questions = [
@@ -455,6 +797,68 @@ base_questions = [
     }
 ]
 
+# Question bank compiled once: every language template is pre-split into
+# (literal, field) parts so rendering is a join instead of str.format parsing
+DEFAULT_LANGUAGE = "ar"
+RENDER_CACHE_SIZE = 4096
+
+def compile_template(template):
+    """Split a str.format template into (literal text, field name or None) parts"""
+    return tuple(
+        (literal, field_name)
+        for literal, field_name, _, _ in Formatter().parse(template)
+    )
+
+def compile_question_bank(questions):
+    compiled = []
+    for question in questions:
+        # Old-format questions only have the Arabic template
+        templates = question.get("templates") or {DEFAULT_LANGUAGE: question.get("template", "")}
+        compiled.append({
+            "question_id": question["question_id"],
+            "dimension": question["dimension"],
+            "reverse_scored": question["reverse_scored"],
+            "parts": {lang: compile_template(text) for lang, text in templates.items()},
+            # IRT parameters; uncalibrated questions get the engine defaults (a=1, b=0)
+            **{field: question[field] for field in ("discrimination", "difficulty", "thresholds") if field in question}
+        })
+    return compiled
+
+compiled_questions = compile_question_bank(base_questions)
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_question(question_index, language, first_name):
+    """Personalized text of one question (the same for every session sharing name and language)"""
+    parts = compiled_questions[question_index]["parts"]
+    template = parts.get(language, parts[DEFAULT_LANGUAGE])
+    return "".join(
+        literal + (first_name if field_name else "")
+        for literal, field_name in template
+    )
+
+questions_by_id = {q["question_id"]: q for q in compiled_questions}
+
+# Scoring uses the same measurement model as irt_personality_test.py
+DIMENSIONS = ["openness", "conscientiousness", "extraversion", "agreeableness", "neuroticism"]
+SCORING_MODEL = os.environ.get("IRT_MODEL", MODEL_GRM)  # "grm" or "2pl"
+SCORING_ESTIMATOR = os.environ.get("IRT_ESTIMATOR", DEFAULT_ESTIMATOR)
+THETA_BOUNDS = (-3.0, 3.0)
+
+# Item parameters per dimension; response rows are indexed by position in compiled_questions
+scoring_plan = ScoringPlan.from_questions(compiled_questions, DIMENSIONS, model=SCORING_MODEL,
+                                          method=SCORING_ESTIMATOR, bounds=THETA_BOUNDS)
+question_positions = {q["question_id"]: i for i, q in enumerate(compiled_questions)}
+
+def build_question(session, question_index):
+    question = compiled_questions[question_index]
+    return Question(
+        question_id=question["question_id"],
+        text=render_question(question_index, session.get("language", DEFAULT_LANGUAGE), session["first_name"]),
+        dimension=question["dimension"],
+        question_number=question_index + 1,
+        reverse_scored=question["reverse_scored"]
+    )
+
 # Pydantic models
 class SessionCreate(BaseModel):
     name: str
@@ -485,6 +889,15 @@ class AnswerSubmission(BaseModel):
     question_id: str
     response: int
 
+class BatchAnswer(BaseModel):
+    question_id: str
+    response: int
+
+class AnswerBatchSubmission(BaseModel):
+    session_id: str
+    answers: List[BatchAnswer]  # In question order, starting at the current question
+    prefetch: int = 1  # Next questions to return with the result
+
 class AdminLogin(BaseModel):
     username: str
     password: str
@@ -512,7 +925,7 @@ async def create_session(session_data: SessionCreate):
         first_name = session_data.name.split()[0]
         
         # Create session
-        sessions[session_id] = {
+        session = {
             "session_id": session_id,
             "name": session_data.name,
             "first_name": first_name,
@@ -528,9 +941,8 @@ async def create_session(session_data: SessionCreate):
             "questions_answered": [],
             "current_question_index": 0
         }
-        
-        # Save sessions when a new session is created
-        save_sessions()
+        await session_store.put(session)
+        dashboard_stats.add(session)
         
         return SessionResponse(
             session_id=session_id,
@@ -553,73 +965,69 @@ async def create_session(session_data: SessionCreate):
 @app.get("/api/sessions/{session_id}/question", response_model=Question)
 async def get_current_question(session_id: str):
     try:
-        if session_id not in sessions:
+        session = await session_store.get(session_id)
+        if session is None:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        session = sessions[session_id]
         question_index = session["current_question_index"]
         
         if question_index >= len(base_questions):
             # Test is complete
             raise HTTPException(status_code=404, detail="No more questions")
         
-        question_template = base_questions[question_index]
-        
-        # Get user's language preference
-        user_language = session.get("language", "ar")
-        
-        # Get the appropriate template based on language
-        if "templates" in question_template:
-            template_text = question_template["templates"].get(user_language, question_template["templates"]["ar"])
-        else:
-            # Fallback for old format
-            template_text = question_template.get("template", "")
-        
-        # Personalize the question with the user's first name
-        personalized_text = template_text.format(
-            name=session["first_name"]
-        )
-        
-        return Question(
-            question_id=question_template["question_id"],
-            text=personalized_text,
-            dimension=question_template["dimension"],
-            question_number=question_index + 1,
-            reverse_scored=question_template["reverse_scored"]
-        )
+        # Personalized in the user's language from the compiled templates
+        return build_question(session, question_index)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting question: {str(e)}")
 
+@app.get("/api/sessions/{session_id}/questions")
+async def get_remaining_questions(session_id: str):
+    """Every question still to be answered, so the client can prefetch the sequence"""
+    try:
+        session = await session_store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        start = session["current_question_index"]
+        return {
+            "session_id": session_id,
+            "status": session["status"],
+            "questions": [build_question(session, index) for index in range(start, len(compiled_questions))]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting questions: {str(e)}")
+
 @app.post("/api/answers")
 async def submit_answer(answer: AnswerSubmission):
     try:
         print(f"Received answer: {answer}")
+        if not 1 <= answer.response <= 5:
+            raise HTTPException(status_code=400, detail="Responses must be between 1 and 5")
         
-        if answer.session_id not in sessions:
+        # Record the answer and move to next question in one store update
+        session = await session_store.update(
+            answer.session_id,
+            push={"questions_answered": {
+                "question_id": answer.question_id,
+                "response": answer.response
+            }},
+            inc={"current_question_index": 1, "current_question_number": 1}
+        )
+        if session is None:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        session = sessions[answer.session_id]
-        
-        # Record the answer
-        session["questions_answered"].append({
-            "question_id": answer.question_id,
-            "response": answer.response
-        })
-        
-        # Move to next question
-        session["current_question_index"] += 1
-        session["current_question_number"] += 1
-        
         print(f"Updated session: {session}")
+        previous_status = session["status"]
         
         # Check if test is complete
-        if session["current_question_index"] >= len(base_questions):
-            session["status"] = "completed"
+        if session["current_question_index"] >= len(base_questions) and session["status"] != "completed":
+            session = await session_store.update(answer.session_id, set_fields=completion_fields(session))
             print("Test completed!")
-            # Save sessions when a test is completed
-            save_sessions()
+        dashboard_stats.answered(session, previous_status)
         
         return {"message": "Answer submitted successfully", "status": session["status"]}
     except HTTPException:
@@ -627,75 +1035,191 @@ async def submit_answer(answer: AnswerSubmission):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error submitting answer: {str(e)}")
 
-@app.get("/api/sessions/{session_id}/report")
-async def get_report(session_id: str):
+@app.post("/api/answers/batch")
+async def submit_answer_batch(batch: AnswerBatchSubmission):
     try:
-        if session_id not in sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        session = sessions[session_id]
+        if not batch.answers:
+            raise HTTPException(status_code=400, detail="No answers submitted")
         
-        if session["status"] != "completed":
-            raise HTTPException(status_code=400, detail="Test not completed yet")
+        session = await session_store.get(batch.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if session["status"] == "completed":
+            raise HTTPException(status_code=400, detail="Test already completed")
         
-        # Generate a simple mock report
-        def get_level(score):
-            if score >= 80:
-                return "عالي"
-            elif score >= 60:
-                return "متوسط"
-            else:
-                return "منخفض"
+        # Validate the whole batch against the expected question sequence before applying it
+        start = session["current_question_index"]
+        expected_ids = [q["question_id"] for q in compiled_questions[start:start + len(batch.answers)]]
+        if [a.question_id for a in batch.answers] != expected_ids:
+            raise HTTPException(status_code=400, detail=f"Answers must follow the question order starting at {expected_ids[:1]}")
+        if any(not 1 <= a.response <= 5 for a in batch.answers):
+            raise HTTPException(status_code=400, detail="Responses must be between 1 and 5")
         
-        openness_score = random.randint(30, 100)
-        conscientiousness_score = random.randint(30, 100)
-        extraversion_score = random.randint(30, 100)
-        agreeableness_score = random.randint(30, 100)
-        neuroticism_score = random.randint(30, 100)
+        # Record every answer in one store update (scoring the session if this batch completes it),
+        # applied only if no other submit moved the session on since it was validated
+        count = len(batch.answers)
+        new_answers = [{"question_id": a.question_id, "response": a.response} for a in batch.answers]
+        completed = start + count >= len(compiled_questions)
+        session = await session_store.update(
+            batch.session_id,
+            set_fields=completion_fields(
+                {"questions_answered": session["questions_answered"] + new_answers}
+            ) if completed else None,
+            push={"questions_answered": {"$each": new_answers}},
+            inc={"current_question_index": count, "current_question_number": count},
+            expected={"current_question_index": start}
+        )
+        if session is None:
+            raise HTTPException(status_code=409, detail="Session changed while the answers were submitted, please retry")
+        if completed:
+            print("Test completed!")
+        dashboard_stats.answered(session)
         
+        next_index = session["current_question_index"]
         return {
-            "session_id": session_id,
-            "name": session["name"],
-            "completion_date": "2025-01-24T10:30:00Z",
-            "scores": {
-                "openness": {
-                    "name": "الانفتاح على التجارب",
-                    "score": openness_score / 20.0,  # Convert to 1-5 scale
-                    "level": get_level(openness_score)
-                },
-                "conscientiousness": {
-                    "name": "الضمير الحي",
-                    "score": conscientiousness_score / 20.0,
-                    "level": get_level(conscientiousness_score)
-                },
-                "extraversion": {
-                    "name": "الانبساط",
-                    "score": extraversion_score / 20.0,
-                    "level": get_level(extraversion_score)
-                },
-                "agreeableness": {
-                    "name": "المقبولية",
-                    "score": agreeableness_score / 20.0,
-                    "level": get_level(agreeableness_score)
-                },
-                "neuroticism": {
-                    "name": "العصابية",
-                    "score": neuroticism_score / 20.0,
-                    "level": get_level(neuroticism_score)
-                }
-            },
-            "detailed_analysis": "تحليل شخصيتك يُظهر توازناً جيداً في معظم الأبعاد.\n\nأنت شخص منفتح على التجارب الجديدة ولديك مستوى جيد من التنظيم والانضباط.\n\nتتمتع بمهارات اجتماعية جيدة وتستطيع التعامل مع الآخرين بطريقة إيجابية.\n\nبشكل عام، شخصيتك متوازنة وتُظهر قدرة على التكيف مع المواقف المختلفة.",
-            "recommendations": [
-                "استمر في تطوير نقاط قوتك",
-                "اعمل على تحسين المجالات التي تحتاج لتطوير",
-                "تذكر أن الشخصية قابلة للنمو والتطوير"
+            "message": "Answers submitted successfully",
+            "status": session["status"],
+            "answers_accepted": count,
+            "next_questions": [
+                build_question(session, index)
+                for index in range(next_index, min(next_index + max(batch.prefetch, 0), len(compiled_questions)))
             ]
         }
     except HTTPException:
         raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error submitting answers: {str(e)}")
+
+SCORING_VERSION = 2  # Bump when scoring or reports change; results stored under older versions are recomputed
+
+DIMENSION_NAMES = {
+    "openness": "الانفتاح على التجارب",
+    "conscientiousness": "الضمير الحي",
+    "extraversion": "الانبساط",
+    "agreeableness": "المقبولية",
+    "neuroticism": "العصابية"
+}
+
+def completion_timestamp():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+VALID_RESPONSES = range(1, 6)
+
+def score_session(session):
+    """Classical sum score and IRT theta per dimension from the stored responses"""
+    # One response row with the same scoring code that bulk_scoring.py runs over all sessions
+    row = np.zeros((1, len(compiled_questions)), dtype=np.int8)
+    for answer in session["questions_answered"]:
+        position = question_positions.get(answer["question_id"])
+        # Responses stored before they were validated may be out of range; those items count as unanswered
+        if position is not None and answer.get("response") in VALID_RESPONSES:
+            row[0, position] = answer["response"]
+    return dimension_scores(DIMENSIONS, score_block(row, scoring_plan))[0]
+
+def session_scores(session):
+    """Scores stored at completion, or computed now for sessions completed before scoring existed"""
+    if session.get("scoring_version") == SCORING_VERSION and "scores" in session:
+        return session["scores"]
+    return score_session(session)
+
+def completion_fields(session):
+    """Fields set when a session completes; scoring happens once, here"""
+    return {
+        "status": "completed",
+        "completed_at": completion_timestamp(),
+        "scores": score_session(session),
+        "scoring_version": SCORING_VERSION
+    }
+
+def build_report(session):
+    def get_level(percentile):
+        if percentile is None:
+            return "غير محدد"
+        if percentile > 75:
+            return "عالي"
+        elif percentile > 25:
+            return "متوسط"
+        else:
+            return "منخفض"
+    
+    scores = session_scores(session)
+    return {
+        "session_id": session["session_id"],
+        "name": session["name"],
+        "completion_date": session.get("completed_at", "2025-01-24T10:30:00Z"),
+        "scores": {
+            dimension: {
+                "name": DIMENSION_NAMES[dimension],
+                "score": score["mean"],  # 1-5 scale
+                "raw_score": score["raw_score"],
+                "theta": score["theta"],
+                "standard_error": score["standard_error"],
+                "percentile": score["percentile"],
+                "level": get_level(score["percentile"])
+            }
+            for dimension, score in scores.items()
+        },
+        "scoring_model": SCORING_MODEL,
+        "detailed_analysis": "تحليل شخصيتك يُظهر توازناً جيداً في معظم الأبعاد.\n\nأنت شخص منفتح على التجارب الجديدة ولديك مستوى جيد من التنظيم والانضباط.\n\nتتمتع بمهارات اجتماعية جيدة وتستطيع التعامل مع الآخرين بطريقة إيجابية.\n\nبشكل عام، شخصيتك متوازنة وتُظهر قدرة على التكيف مع المواقف المختلفة.",
+        "recommendations": [
+            "استمر في تطوير نقاط قوتك",
+            "اعمل على تحسين المجالات التي تحتاج لتطوير",
+            "تذكر أن الشخصية قابلة للنمو والتطوير"
+        ]
+    }
+
+@app.get("/api/sessions/{session_id}/report")
+async def get_report(session_id: str):
+    try:
+        session = await session_store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        if session["status"] != "completed":
+            raise HTTPException(status_code=400, detail="Test not completed yet")
+        
+        # Computed once per scoring version and kept on the session
+        report = session.get("report")
+        if report is None or session.get("report_version") != SCORING_VERSION:
+            report = build_report(session)
+            await session_store.update(session_id, set_fields={
+                "scores": session_scores(session),
+                "scoring_version": SCORING_VERSION,
+                "report": report,
+                "report_version": SCORING_VERSION
+            })
+        return report
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
 
+@app.on_event("startup")
+async def startup_event():
+    if SESSION_STORE == STORE_MEMORY:
+        # Loaded here rather than on import, so tools importing this module never compact the journal
+        load_sessions()
+        persistence.start()
+    else:
+        await seed_session_store()
+    await dashboard_stats.rebuild()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush pending sessions before the process exits
+    if SESSION_STORE == STORE_MEMORY:
+        await persistence.stop()
+    await session_store.close()
+
+@app.get("/api/metrics/persistence")
+async def persistence_metrics():
+    return {
+        "session_store": SESSION_STORE,
+        **persistence.metrics,
+        "pending_sessions": len(persistence.dirty),
+        "journal_events_since_snapshot": journal.events_since_snapshot
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Personality Test API is running"}
@@ -708,11 +1232,11 @@ async def admin_login(login_data: AdminLogin):
             admin_id = str(uuid.uuid4())
             from datetime import datetime
             
-            admin_sessions[admin_id] = {
+            await admin_store.put(admin_id, {
                 "admin_id": admin_id,
                 "username": login_data.username,
                 "login_time": datetime.now().isoformat()
-            }
+            })
             
             return {
                 "success": True,
@@ -730,85 +1254,130 @@ async def admin_login(login_data: AdminLogin):
 async def get_dashboard_data(admin_id: str):
     try:
         # التحقق من صحة جلسة الإدارة
-        if admin_id not in admin_sessions:
+        if await admin_store.get(admin_id) is None:
             raise HTTPException(status_code=401, detail="جلسة غير صالحة")
         
-        # حساب الإحصائيات
-        total_sessions = len(sessions)
-        completed_sessions = len([s for s in sessions.values() if s["status"] == "completed"])
-        active_sessions = len([s for s in sessions.values() if s["status"] == "active"])
-        
-        # توزيع الأعمار
-        ages = [s["age"] for s in sessions.values()]
-        age_distribution = {
-            "18-25": len([age for age in ages if 18 <= age <= 25]),
-            "26-35": len([age for age in ages if 26 <= age <= 35]),
-            "36-45": len([age for age in ages if 36 <= age <= 45]),
-            "46-55": len([age for age in ages if 46 <= age <= 55]),
-            "56+": len([age for age in ages if age > 55])
-        }
-        
-        # توزيع الجنس
-        genders = [s["gender"] for s in sessions.values()]
-        gender_distribution = {
-            "male": genders.count("male"),
-            "female": genders.count("female")
-        }
-        
-        # توزيع التعليم
-        education_levels = [s["education_level"] for s in sessions.values()]
-        education_distribution = {}
-        for level in education_levels:
-            education_distribution[level] = education_distribution.get(level, 0) + 1
-        
-        # أحدث المشاركين
-        recent_sessions = []
-        for session in list(sessions.values())[-5:]:  # آخر 5 مشاركين
-            recent_sessions.append({
-                "name": session["name"],
-                "age": session["age"],
-                "gender": session["gender"],
-                "status": session["status"],
-                "questions_answered": len(session["questions_answered"])
-            })
-        
-        return {
-            "total_sessions": total_sessions,
-            "completed_sessions": completed_sessions,
-            "active_sessions": active_sessions,
-            "completion_rate": round((completed_sessions / total_sessions * 100) if total_sessions > 0 else 0, 1),
-            "age_distribution": age_distribution,
-            "gender_distribution": gender_distribution,
-            "education_distribution": education_distribution,
-            "recent_sessions": recent_sessions
-        }
+        # الإحصائيات محدثة تدريجياً مع كل جلسة وإجابة
+        await dashboard_stats.refresh()
+        return dashboard_stats.snapshot()
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب بيانات الداشبورد: {str(e)}")
 
+DETAILED_REPORTS_PAGE_SIZE = 100
+DETAILED_REPORTS_MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 500  # Sessions read from the store per batch while streaming an export
+DETAILED_REPORT_FIELDS = ["session_id", "name", "age", "gender", "education_level",
+                          "marital_status", "total_questions", "completion_date"]
+
+def detailed_report_row(session):
+    return {
+        "session_id": session["session_id"],
+        "name": session["name"],
+        "age": session["age"],
+        "gender": session["gender"],
+        "education_level": session["education_level"],
+        "marital_status": session["marital_status"],
+        "total_questions": len(session["questions_answered"]),
+        # Sessions completed before completion times were recorded keep the old placeholder date
+        "completion_date": (session.get("completed_at") or "2025-01-24")[:10]
+    }
+
+def completion_bound(value, name, upper):
+    """Range condition on completed_at ("%Y-%m-%dT%H:%M:%SZ" strings compare in time order)
+    
+    A bare date covers the whole day; a datetime is an exact inclusive bound.
+    """
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            return ("$lt", (day + timedelta(days=1)).isoformat()) if upper else ("$gte", day.isoformat())
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return ("$lte" if upper else "$gte"), moment
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"تاريخ غير صالح في {name}: {value}")
+
+def detailed_report_filters(gender, education_level, min_age, max_age, completed_from, completed_to):
+    """Store filters over the indexed session fields"""
+    filters = {"status": "completed"}
+    if gender:
+        filters["gender"] = gender
+    if education_level:
+        filters["education_level"] = education_level
+    
+    age = {}
+    if min_age is not None:
+        age["$gte"] = min_age
+    if max_age is not None:
+        age["$lte"] = max_age
+    if age:
+        filters["age"] = age
+    
+    completed = {}
+    for value, name, upper in ((completed_from, "completed_from", False), (completed_to, "completed_to", True)):
+        if value:
+            op, bound = completion_bound(value, name, upper)
+            completed[op] = bound
+    if completed:
+        filters["completed_at"] = completed
+    return filters
+
+async def stream_detailed_reports(filters, cursor, export_format):
+    """Write report rows as they are read from the store, one batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=DETAILED_REPORT_FIELDS)
+    if export_format == "csv":
+        buffer.write("\ufeff")  # BOM so spreadsheet apps read the Arabic text as UTF-8
+        writer.writeheader()
+    
+    pending = 0
+    async for session in session_store.query(filters, after=cursor, batch_size=EXPORT_BATCH_SIZE):
+        row = detailed_report_row(session)
+        if export_format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False) + "\n")
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
 @app.get("/api/admin/detailed-reports/{admin_id}")
-async def get_detailed_reports(admin_id: str):
+async def get_detailed_reports(admin_id: str, cursor: Optional[str] = None, limit: int = DETAILED_REPORTS_PAGE_SIZE,
+                               gender: Optional[str] = None, education_level: Optional[str] = None,
+                               min_age: Optional[int] = None, max_age: Optional[int] = None,
+                               completed_from: Optional[str] = None, completed_to: Optional[str] = None,
+                               format: str = "json"):
     try:
         # التحقق من صحة جلسة الإدارة
-        if admin_id not in admin_sessions:
+        if await admin_store.get(admin_id) is None:
             raise HTTPException(status_code=401, detail="جلسة غير صالحة")
         
-        detailed_reports = []
-        for session in sessions.values():
-            if session["status"] == "completed":
-                detailed_reports.append({
-                    "session_id": session["session_id"],
-                    "name": session["name"],
-                    "age": session["age"],
-                    "gender": session["gender"],
-                    "education_level": session["education_level"],
-                    "marital_status": session["marital_status"],
-                    "total_questions": len(session["questions_answered"]),
-                    "completion_date": "2025-01-24"  # يمكن إضافة التاريخ الحقيقي لاحقاً
-                })
+        filters = detailed_report_filters(gender, education_level, min_age, max_age, completed_from, completed_to)
+        
+        # تصدير كامل البيانات بشكل متدفق بدون تحميلها في الذاكرة
+        if format in ("ndjson", "csv"):
+            return StreamingResponse(
+                stream_detailed_reports(filters, cursor, format),
+                media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+                headers={"Content-Disposition": f"attachment; filename=detailed_reports.{format}"}
+            )
+        if format != "json":
+            raise HTTPException(status_code=400, detail=f"صيغة غير مدعومة: {format}")
         
-        return {"detailed_reports": detailed_reports}
+        # صفحة واحدة؛ next_cursor يشير إلى بداية الصفحة التالية
+        limit = min(max(limit, 1), DETAILED_REPORTS_MAX_PAGE_SIZE)
+        page = [s async for s in session_store.query(filters, after=cursor, limit=limit + 1)]
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            "detailed_reports": [detailed_report_row(s) for s in page],
+            "next_cursor": page[-1]["session_id"] if has_more else None
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -817,8 +1386,7 @@ async def get_detailed_reports(admin_id: str):
 @app.post("/api/admin/logout/{admin_id}")
 async def admin_logout(admin_id: str):
     try:
-        if admin_id in admin_sessions:
-            del admin_sessions[admin_id]
+        if await admin_store.delete(admin_id):
             return {"success": True, "message": "تم تسجيل الخروج بنجاح"}
         else:
             raise HTTPException(status_code=401, detail="جلسة غير صالحة")
@@ -830,4 +1398,11 @@ async def admin_logout(admin_id: str):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8005))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if WORKERS > 1:
+        if SESSION_STORE == STORE_MEMORY:
+            # Workers inherit the environment, so they all open the same sqlite file
+            print("Several workers need shared state: using the sqlite session store")
+            os.environ["SESSION_STORE"] = STORE_SQLITE
+        uvicorn.run("simple_backend:app", host="0.0.0.0", port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,55 @@
+"""Regression tests for simple_backend answer validation and completion scoring.
+
+Run with: python -m pytest test_simple_backend.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+import simple_backend
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The memory store's snapshot and journal go to the working directory
+    monkeypatch.chdir(tmp_path)
+    with TestClient(simple_backend.app) as test_client:
+        yield test_client
+
+
+def create_session(client):
+    response = client.post("/api/sessions", json={
+        "name": "Test", "gender": "female", "birth_year": 1995, "education_level": "جامعي"
+    })
+    assert response.status_code == 200
+    return response.json()["session_id"]
+
+
+def test_out_of_range_answer_is_rejected(client):
+    session_id = create_session(client)
+    question_ids = [q["question_id"] for q in simple_backend.compiled_questions]
+
+    response = client.post("/api/answers", json={
+        "session_id": session_id, "question_id": question_ids[0], "response": 9
+    })
+    assert response.status_code == 400
+    assert client.get(f"/api/sessions/{session_id}/question").json()["question_id"] == question_ids[0]
+
+    for question_id in question_ids:
+        response = client.post("/api/answers", json={
+            "session_id": session_id, "question_id": question_id, "response": 4
+        })
+        assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert client.get(f"/api/sessions/{session_id}/report").status_code == 200
+
+
+def test_score_session_skips_out_of_range_responses():
+    questions = simple_backend.compiled_questions
+    session = {"questions_answered": [
+        {"question_id": q["question_id"], "response": 9 if i == 0 else 3} for i, q in enumerate(questions)
+    ]}
+    scores = simple_backend.score_session(session)
+
+    dimension = questions[0]["dimension"]
+    in_dimension = sum(q["dimension"] == dimension for q in questions)
+    assert scores[dimension]["items"] == in_dimension - 1
+    assert scores[dimension]["raw_score"] == 3 * (in_dimension - 1)